@@ -109,6 +109,37 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Responses of the API and iCal endpoints, see ustc/cache_utils.py. Each process keeps its own, evicting the
+# least recently used ones; with RESPONSE_CACHE_DIR set, they are also shared between processes in that directory.
+# They don't expire: they're keyed by the data version, which every change of the data bumps.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_ENTRIES", 2000)), "CULL_FREQUENCY": 10},
+    },
+}
+
+if os.getenv("RESPONSE_CACHE_DIR"):
+    CACHES["shared_responses"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("RESPONSE_CACHE_DIR"),
+        "TIMEOUT": 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_SHARED_ENTRIES", 20000))},
+    }
+
+
+# Downloadable semester snapshots written by the importers, see ustc/snapshot_utils.py
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", BASE_DIR / "snapshots")
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -147,10 +178,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Django REST Framework settings
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'ustc.pagination.PageNumberOrCursorPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'ustc.renderers.ORJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
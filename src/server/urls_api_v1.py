@@ -52,4 +52,10 @@ urlpatterns = [
     # - course-type, course-gradation, course-category, course-classify
     # - exam-mode, teach-language, education-level, class-type
     path('', include(router.urls)),
+
+    # Semester snapshots, written by the importers (see ustc/snapshot_utils.py):
+    # - GET /semester/<id>/snapshot/: gzipped NDJSON of the semester, supports Range requests
+    # - GET /semester/<id>/snapshot/manifest/: its checksums, entity counts and data versions
+    path('semester/<int:pk>/snapshot/', semester_snapshot, name='semester-snapshot'),
+    path('semester/<int:pk>/snapshot/manifest/', semester_snapshot_manifest, name='semester-snapshot-manifest'),
 ]
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class USTCConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ustc'
+
+    def ready(self):
+        from . import views
+        from .version_utils import DataVersionMixin, connect_bump_on_change
+
+        # Changes of the rows the API serves, made outside the importers and the API, invalidate cached responses too
+        connect_bump_on_change({
+            viewset.queryset.model for viewset in vars(views).values()
+            if isinstance(viewset, type) and issubclass(viewset, DataVersionMixin)
+            and getattr(viewset, 'queryset', None) is not None
+        })
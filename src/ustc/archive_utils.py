@@ -0,0 +1,191 @@
+"""
+Record-and-replay archive of raw upstream API responses
+
+An archive is a directory holding gzip-compressed response bodies under ``objects/``, named by the
+SHA-256 of their content so identical responses are stored once, and a ``manifest.json`` mapping
+request keys (e.g. ``timetable/lessons/<semester jw_id>``) to those objects plus some metadata.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+# Seconds between two saves of the manifest while recording, see `ResponseArchive.flush()`
+MANIFEST_SAVE_INTERVAL = 5.0
+# Bodies kept in memory by `ResponseArchive.load()`, the most recently used ones
+LOADED_OBJECTS = 16
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ResponseArchive:
+    """
+    A response archive directory
+
+    Recorded entries are written to the manifest at most every `MANIFEST_SAVE_INTERVAL` seconds, and by
+    `flush()` or `close()`, which a recording must call once it's done (or use the archive as a context manager).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.objects_path = self.path / 'objects'
+        self.manifest_path = self.path / 'manifest.json'
+        self.lock = threading.Lock()
+        self.loaded = OrderedDict()
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get('version') != MANIFEST_VERSION:
+                raise ArchiveError(f"Unsupported archive version in {self.manifest_path}")
+        else:
+            self.manifest = {'version': MANIFEST_VERSION, 'entries': {}}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def entries(self):
+        return self.manifest['entries']
+
+    def object_path(self, digest):
+        return self.objects_path / f"{digest}.json.gz"
+
+    def record(self, key, content, **metadata):
+        """Store a raw response body under `key`, with optional JSON-serializable metadata"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+
+        with self.lock:
+            if not path.exists():
+                self.objects_path.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix('.tmp')
+                with gzip.open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+
+            self.entries[key] = {
+                'object': digest,
+                'size': len(content),
+                'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                **metadata,
+            }
+            self.entry_recorded()
+
+    def record_chunks(self, key, chunks, **metadata):
+        """
+        Store a response body read as an iterable of byte chunks, yielding the chunks on to the caller
+
+        The body is compressed to a temporary file while it is consumed and only added to the archive
+        once the caller has read it completely, so memory use doesn't grow with the response size.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.objects_path / f"{threading.get_ident()}-{id(chunks)}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                    yield chunk
+
+            with self.lock:
+                path = self.object_path(digest.hexdigest())
+                if path.exists():
+                    tmp_path.unlink()
+                else:
+                    os.replace(tmp_path, path)
+
+                self.entries[key] = {
+                    'object': digest.hexdigest(),
+                    'size': size,
+                    'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    **metadata,
+                }
+                self.entry_recorded()
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def entry_recorded(self):
+        """Save the manifest if it wasn't for a while, so an interrupted recording keeps most completed entries"""
+        self.dirty = True
+        if time.monotonic() - self.saved_at >= MANIFEST_SAVE_INTERVAL:
+            self.save_manifest()
+
+    def flush(self):
+        """Save the entries recorded since the manifest was last saved"""
+        with self.lock:
+            if self.dirty:
+                self.save_manifest()
+
+    def close(self):
+        self.flush()
+
+    def save_manifest(self):
+        """Atomically rewrite the manifest, holding the lock"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def load(self, key):
+        """Return the raw response body recorded under `key`"""
+        entry = self.entries.get(key)
+        if entry is None:
+            raise ArchiveError(f"No recorded response for {key} in {self.path}")
+        return self.load_object(entry['object'])
+
+    def load_chunks(self, key, chunk_size=64 * 1024):
+        """Yield the raw response body recorded under `key` in chunks, checking its digest once it was read"""
+        entry = self.entries.get(key)
+        if entry is None:
+            raise ArchiveError(f"No recorded response for {key} in {self.path}")
+
+        digest = hashlib.sha256()
+        with gzip.open(self.object_path(entry['object']), 'rb') as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+                yield chunk
+        if digest.hexdigest() != entry['object']:
+            raise ArchiveError(f"Archived object {entry['object']} is corrupted")
+
+    def load_json(self, key):
+        return json.loads(self.load(key))
+
+    def load_object(self, digest):
+        with self.lock:
+            if (content := self.loaded.get(digest)) is not None:
+                self.loaded.move_to_end(digest)
+                return content
+
+        with gzip.open(self.object_path(digest), 'rb') as f:
+            content = f.read()
+        if hashlib.sha256(content).hexdigest() != digest:
+            raise ArchiveError(f"Archived object {digest} is corrupted")
+
+        with self.lock:
+            self.loaded[digest] = content
+            while len(self.loaded) > LOADED_OBJECTS:
+                self.loaded.popitem(last=False)
+        return content
+
+    def keys(self, prefix=''):
+        return sorted(key for key in self.entries if key.startswith(prefix))
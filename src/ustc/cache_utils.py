@@ -0,0 +1,192 @@
+"""
+Response cache of the API and iCal endpoints, keyed by the data version so that imports invalidate it
+
+Each process keeps the responses it rendered in the "responses" cache (least recently used ones are evicted
+first), and if the "shared_responses" cache is configured, also in that one, shared with the other processes.
+A response is only rendered once at a time: concurrent requests for it wait for its result instead.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+from itertools import chain
+
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import urlencode
+
+from .version_utils import data_version_stamp
+
+RESPONSE_CACHE = 'responses'
+SHARED_RESPONSE_CACHE = 'shared_responses'
+
+CACHED_CONTENT_TYPES = ('application/json', 'text/calendar')
+# Larger responses (unpaginated bulk lists) would evict too many others
+MAX_CACHED_SIZE = 256 * 1024
+# Seconds a request waits for another thread or process rendering the same response, before rendering it too
+SHARED_FLIGHT_TIMEOUT = 10.0
+SHARED_FLIGHT_POLL = 0.05
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class Flight:
+    """A response being rendered by one thread, which the others requesting it wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+def response_cache_key(request, stamp):
+    """Cache key of a GET request: its path, sorted query, language and whether it may get an HTML response"""
+    query = urlencode(sorted((key, sorted(values)) for key, values in request.GET.lists()), doseq=True)
+    # Browsers get the browsable API, which isn't cached, unless they ask for a format
+    html = 'text/html' in request.headers.get('Accept', '') and 'format' not in request.GET
+    language = getattr(request, 'LANGUAGE_CODE', '')
+    key = f'{stamp}\n{language}\n{int(html)}\n{request.path}?{query}'
+    return 'response:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def buffered(response, limit=MAX_CACHED_SIZE):
+    """
+    Read a streaming response into a plain one if it's at most `limit` bytes long, so that it may be cached
+
+    Longer ones keep streaming: the chunks read so far, then the rest.
+    """
+    chunks = iter(response.streaming_content)
+    read = []
+    size = 0
+    for chunk in chunks:
+        read.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            result = StreamingHttpResponse(chain(read, chunks), status=response.status_code)
+            break
+    else:
+        result = HttpResponse(b''.join(read), status=response.status_code)
+    for name, value in response.items():
+        result[name] = value
+    result.cookies = response.cookies
+    return result
+
+
+def cache_entry(response):
+    """`(status, headers, content)` of a response that may be cached, or None"""
+    if response.status_code != 200 or response.cookies or response.streaming:
+        return None
+    if hasattr(response, 'render'):
+        response.render()
+    if not response.get('Content-Type', '').startswith(CACHED_CONTENT_TYPES):
+        return None
+    if len(response.content) > MAX_CACHED_SIZE:
+        return None
+    return response.status_code, dict(response.headers), response.content
+
+
+def cached_response(entry):
+    status, headers, content = entry
+    response = HttpResponse(content, status=status)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def single_flight(key, render):
+    """
+    `render()` the cache entry of `key` unless another thread is already doing so, then wait for its entry
+
+    Returns `(entry, response)`, the response only if this thread rendered it. Waits at most
+    `SHARED_FLIGHT_TIMEOUT` seconds, then renders it too.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        if not flight.done.wait(SHARED_FLIGHT_TIMEOUT):
+            return render()
+        if flight.entry is not None:
+            return flight.entry, None
+        # Not cacheable, e.g. an error: every request gets its own
+        return render()
+
+    try:
+        flight.entry, response = render()
+        return flight.entry, response
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def shared_flight(key, render):
+    """
+    Like `single_flight` across processes, through the shared cache, if it's configured
+
+    The renderer holds a flight key in the cache. That's best effort with backends whose `add()` isn't atomic,
+    like the file-based one: processes that start at the very same time may both render.
+    """
+    if SHARED_RESPONSE_CACHE not in caches.settings:
+        return render()
+    shared = caches[SHARED_RESPONSE_CACHE]
+    if (entry := shared.get(key)) is not None:
+        return entry, None
+
+    flight_key = key + ':flight'
+    if not shared.add(flight_key, 1, SHARED_FLIGHT_TIMEOUT):
+        deadline = time.monotonic() + SHARED_FLIGHT_TIMEOUT
+        while time.monotonic() < deadline and shared.get(flight_key) is not None:
+            time.sleep(SHARED_FLIGHT_POLL)
+            if (entry := shared.get(key)) is not None:
+                return entry, None
+        return render()
+
+    try:
+        entry, response = render()
+        if entry is not None:
+            shared.set(key, entry)
+        return entry, response
+    finally:
+        shared.delete(flight_key)
+
+
+def cache_on_data_version(view):
+    """
+    Serve the GET requests of `view` from the response cache while the data version they were rendered at is current
+
+    Only successful JSON and iCalendar responses are cached. Nothing is cached before the first import.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        stamp = data_version_stamp()
+        if request.method != 'GET' or stamp is None:
+            return view(request, *args, **kwargs)
+
+        key = response_cache_key(request, stamp)
+        local = caches[RESPONSE_CACHE]
+        if (entry := local.get(key)) is not None:
+            return cached_response(entry)
+
+        def render():
+            response = view(request, *args, **kwargs)
+            if response.streaming and response.status_code == 200:
+                response = buffered(response)
+            return cache_entry(response), response
+
+        entry, response = single_flight(key, lambda: shared_flight(key, render))
+        if entry is None:
+            return response
+        local.set(key, entry)
+        return response if response is not None else cached_response(entry)
+
+    return wrapper
+
+
+class CachedResponseMixin:
+    """Serve the reads of a viewset from the response cache, see `cache_on_data_version`"""
+
+    def dispatch(self, request, *args, **kwargs):
+        return cache_on_data_version(super().dispatch)(request, *args, **kwargs)
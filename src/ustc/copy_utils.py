@@ -0,0 +1,179 @@
+"""
+PostgreSQL ``COPY`` writes for loads too large for batched INSERTs
+
+Rows are streamed with ``COPY ... FROM STDIN`` straight into the target table, or into a temporary
+staging table that is then merged into it with a single set-based statement. On other databases
+(SQLite in development) every function falls back to the batched ORM writes of ``import_utils``.
+"""
+import json
+
+from django.db import connections, models, transaction
+
+from ustc.import_utils import BATCH_SIZE, bulk_upsert
+
+# Bytes handed to the database driver per read while copying
+COPY_BUFFER_SIZE = 64 * 1024
+
+_escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_supported(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def copy_formatter(field):
+    """Return a function formatting non-null values of ``field`` for the text format of COPY"""
+    if isinstance(field, models.JSONField):
+        return lambda value: json.dumps(value, cls=field.encoder, ensure_ascii=False).translate(_escapes)
+    if isinstance(field, models.BooleanField):
+        return lambda value: 't' if value else 'f'
+    if isinstance(field, models.DateField):
+        return lambda value: field.get_prep_value(value).isoformat()
+    if isinstance(field, models.FloatField):
+        return lambda value: repr(float(value))
+    if isinstance(field, (models.IntegerField, models.AutoField, models.ForeignKey)):
+        return lambda value: str(int(value))
+    return lambda value: str(value).translate(_escapes)
+
+
+def copy_lines(fields, objs):
+    formatters = [(field.attname, copy_formatter(field)) for field in fields]
+    for obj in objs:
+        values = [
+            '\\N' if (value := getattr(obj, attname)) is None else format_value(value)
+            for attname, format_value in formatters
+        ]
+        yield '\t'.join(values) + '\n'
+
+
+class _CopyStream:
+    """File-like object encoding COPY lines on demand, so the rows never have to be formatted all at once"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b''
+
+    def read(self, size=-1):
+        size = COPY_BUFFER_SIZE if size is None or size < 0 else size
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            encoded = line.encode('utf-8')
+            parts.append(encoded)
+            length += len(encoded)
+        data = b''.join(parts)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(cursor, table, fields, objs):
+    """Stream the ``fields`` of ``objs`` into ``table`` through ``COPY FROM STDIN``"""
+    quote = cursor.db.ops.quote_name
+    sql = f"COPY {quote(table)} ({', '.join(quote(field.column) for field in fields)}) FROM STDIN"
+    lines = copy_lines(fields, objs)
+
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):
+        raw.copy_expert(sql, _CopyStream(lines), size=COPY_BUFFER_SIZE)
+    else:
+        # psycopg 3
+        with raw.copy(sql) as copy:
+            for line in lines:
+                copy.write(line)
+
+
+def insert_fields(model):
+    """The concrete fields written when inserting ``model`` rows, leaving the primary key to the database"""
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def _staging_table(cursor, model, fields):
+    # Dropped at the end of the transaction at the latest, the callers drop it once merged
+    quote = cursor.db.ops.quote_name
+    table = f"{model._meta.db_table}_staging"
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {quote(table)} ON COMMIT DROP AS "
+        f"SELECT {', '.join(quote(field.column) for field in fields)} FROM {quote(model._meta.db_table)} WITH NO DATA"
+    )
+    return table
+
+
+def copy_upsert(model, objs, unique_fields, update_fields=None, using='default'):
+    """
+    Like ``bulk_upsert``, but on PostgreSQL the rows are copied into a staging table and merged
+    with one ``INSERT ... SELECT ... ON CONFLICT`` statement
+
+    When several objects share a unique key the last one wins.
+    """
+    if not copy_supported(using):
+        bulk_upsert(model, objs, unique_fields, update_fields)
+        return
+    if not objs:
+        return
+
+    opts = model._meta
+    fields = insert_fields(model)
+    unique_attnames = [opts.get_field(name).attname for name in unique_fields]
+    objs = list({tuple(getattr(obj, attname) for attname in unique_attnames): obj for obj in objs}.values())
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    if update_fields:
+        assignments = ', '.join(
+            f"{quote(column)} = EXCLUDED.{quote(column)}"
+            for column in (opts.get_field(name).column for name in update_fields)
+        )
+        conflict = f"({', '.join(quote(opts.get_field(name).column) for name in unique_fields)}) DO UPDATE SET {assignments}"
+    else:
+        conflict = "DO NOTHING"
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        staging = _staging_table(cursor, model, fields)
+        copy_rows(cursor, staging, fields, objs)
+        cursor.execute(
+            f"INSERT INTO {quote(opts.db_table)} ({columns}) SELECT {columns} FROM {quote(staging)} "
+            f"ON CONFLICT {conflict}"
+        )
+        cursor.execute(f"DROP TABLE {quote(staging)}")
+
+
+def copy_insert(model, objs, using='default'):
+    """Insert ``objs`` with ``COPY`` straight into the table of ``model``, or ``bulk_create`` elsewhere"""
+    if not copy_supported(using):
+        model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+        return
+    if not objs:
+        return
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        copy_rows(cursor, model._meta.db_table, insert_fields(model), objs)
+
+
+def copy_update(model, objs, update_fields, using='default'):
+    """Update ``update_fields`` of the existing rows ``objs`` through a staging table, or ``bulk_update`` elsewhere"""
+    if not copy_supported(using):
+        model.objects.bulk_update(objs, update_fields, batch_size=BATCH_SIZE)
+        return
+    if not objs:
+        return
+
+    opts = model._meta
+    pk_column = opts.pk.column
+    fields = [opts.pk, *(opts.get_field(name) for name in update_fields)]
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f"{quote(field.column)} = s.{quote(field.column)}" for field in fields[1:])
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        staging = _staging_table(cursor, model, fields)
+        copy_rows(cursor, staging, fields, objs)
+        cursor.execute(
+            f"UPDATE {quote(opts.db_table)} AS t SET {assignments} FROM {quote(staging)} AS s "
+            f"WHERE t.{quote(pk_column)} = s.{quote(pk_column)}"
+        )
+        cursor.execute(f"DROP TABLE {quote(staging)}")
@@ -0,0 +1,323 @@
+"""
+HTTP helpers shared by the importers: a pooled, cached transport, rate limiting, retries and adaptive batch sizes
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+# Responses worth retrying, anything else is returned (or raised) right away
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+# Share of recent requests that may fail or need a retry while batches still grow
+ERROR_RATE_LIMIT = 0.1
+
+# Defaults of the importers' HTTP options, see add_transport_arguments
+HTTP_CACHE_MAX_AGE = 24 * 60 * 60
+HTTP_CACHE_MAX_SIZE = 256 * 1024 * 1024
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+RETRIES = 3
+
+logger = logging.getLogger('ustc.http_utils')
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting callers to `rate` requests per second
+
+    Up to `capacity` requests may be made in a burst; a non-positive rate disables the limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveBatchSize:
+    """
+    Thread-safe controller of how many items to put into one request
+
+    Batches grow by a tenth while requests finish within `target_latency` seconds, answer with at most
+    `max_bytes` and the recent error rate stays below `ERROR_RATE_LIMIT`. A slow request scales the size
+    down towards the target latency, an oversized response towards `max_bytes`, and a failed one halves it,
+    always staying within `minimum` and `maximum`. With `adaptive` off the size never changes.
+    """
+
+    def __init__(self, size, minimum=1, maximum=None, adaptive=True, target_latency=10.0, max_bytes=None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or size)
+        self.size = min(max(size, self.minimum), self.maximum)
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.error_rate = 0.0
+        self.sizes = Counter()
+        self.lock = threading.Lock()
+
+    def next(self):
+        """The size of the next batch"""
+        with self.lock:
+            self.sizes[self.size] += 1
+            return self.size
+
+    def _observe(self, failed):
+        self.error_rate = 0.8 * self.error_rate + (0.2 if failed else 0.0)
+
+    def _resize(self, size):
+        self.size = min(max(int(size), self.minimum), self.maximum)
+
+    def record_success(self, count, seconds, nbytes):
+        """Adjust the size after a request for `count` items answered `nbytes` in `seconds`"""
+        with self.lock:
+            self._observe(False)
+            if not self.adaptive:
+                return
+            if self.max_bytes and nbytes > self.max_bytes:
+                self._resize(min(self.size, count * self.max_bytes / nbytes))
+            elif self.target_latency and seconds > self.target_latency:
+                self._resize(min(self.size, max(count // 2, count * self.target_latency / seconds)))
+            elif self.error_rate < ERROR_RATE_LIMIT and count >= self.size:
+                self._resize(self.size + max(1, self.size // 10))
+
+    def record_retry(self):
+        """Count a retried request towards the error rate"""
+        with self.lock:
+            self._observe(True)
+
+    def record_failure(self, count):
+        """Halve the size after a request for `count` items failed for good"""
+        with self.lock:
+            self._observe(True)
+            if self.adaptive:
+                self._resize(min(self.size, count // 2))
+
+    def describe(self):
+        with self.lock:
+            if not self.sizes:
+                return "no batches"
+            return (
+                f"{sum(self.sizes.values())} batches of {min(self.sizes)} to {max(self.sizes)} items, "
+                f"next {self.size}, error rate {self.error_rate:.0%}"
+            )
+
+
+def request_with_retry(session, method, url, retries=3, backoff=1.0, rate_limiter=None, log=None, on_retry=None, **kwargs):
+    """
+    Send a request, retrying with jittered exponential backoff on 5xx responses, timeouts and connection errors
+
+    The final attempt's response is checked with `raise_for_status()`, so callers only ever see
+    a successful response or an exception. Retries are reported on `log` (defaults to this module's logger)
+    and to the optional `on_retry` callback.
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter:
+            rate_limiter.acquire()
+
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                response.raise_for_status()
+                return response
+            error = f"HTTP {response.status_code}"
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if attempt == retries:
+                raise
+            error = str(e)
+
+        # Jittered, so that concurrent requests failing together don't all retry at the same moment
+        delay = random.uniform(0.5, 1.0) * backoff * 2 ** attempt
+        (log or logger).warning(f"{method} {url} failed ({error}), retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+        if on_retry:
+            on_retry()
+        time.sleep(delay)
+
+
+class Transport:
+    """
+    Pooled, cached HTTP client of an importer, safe to share between its fetch threads
+
+    A single keep-alive session keeps up to `pool_size` connections per host, asks for compressed
+    responses (gzip and deflate, plus brotli or zstd when their packages are installed) and gives every
+    request `timeout` unless it passes its own. Requests are sent through `request_with_retry`.
+
+    GET responses are cached for `max_age` seconds in the SQLite file `<cache_dir>/<name>.sqlite`, which
+    `prune()` keeps below `max_size` bytes by evicting the oldest responses. The session and its cache are
+    only created by the first request, so runs replaying an archive never touch them. Requests, cache hits,
+    retries, errors, bytes and seconds are counted per host in `hosts`.
+    """
+
+    def __init__(self, name, cache_dir='.', cache=True, max_age=HTTP_CACHE_MAX_AGE, max_size=HTTP_CACHE_MAX_SIZE,
+                 pool_size=10, timeout=(CONNECT_TIMEOUT, 60), retries=3, backoff=1.0, rate_limiter=None, log=None):
+        self.cache_path = Path(cache_dir) / name
+        self.cache = cache
+        self.max_age = max_age
+        self.max_size = max_size
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter
+        self.log = log or logger
+        self.hosts = defaultdict(Counter)
+        self._session = None
+        self.lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self.lock:
+            if self._session is None:
+                if self.cache:
+                    self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    session = requests_cache.CachedSession(str(self.cache_path), expire_after=self.max_age)
+                else:
+                    session = requests_cache.CachedSession(backend='memory', expire_after=requests_cache.DO_NOT_CACHE)
+                adapter = HTTPAdapter(pool_maxsize=self.pool_size, pool_block=True)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+                self._session = session
+            return self._session
+
+    def record(self, host, **counts):
+        with self.lock:
+            self.hosts[host].update(counts)
+
+    def request(self, method, url, cache=True, on_retry=None, **kwargs):
+        """
+        Send a request with retries and count it, returning the successful response or raising
+
+        `cache=False` neither reads nor writes the response cache, e.g. for streamed bodies. `on_retry` is
+        called before every retry.
+        """
+        host = urlsplit(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+        if not cache:
+            kwargs['expire_after'] = requests_cache.DO_NOT_CACHE
+
+        def retried():
+            self.record(host, retries=1)
+            if on_retry:
+                on_retry()
+
+        started = time.monotonic()
+        try:
+            response = request_with_retry(
+                self.session, method, url, retries=self.retries, backoff=self.backoff,
+                rate_limiter=self.rate_limiter, log=self.log, on_retry=retried, **kwargs,
+            )
+        except Exception:
+            self.record(host, requests=1, errors=1, seconds=time.monotonic() - started)
+            raise
+
+        if getattr(response, 'from_cache', False):
+            self.record(host, requests=1, cache_hits=1, seconds=time.monotonic() - started)
+        else:
+            # A streamed body hasn't been read yet, only its announced length is known
+            size = int(response.headers.get('Content-Length', 0)) if kwargs.get('stream') else len(response.content)
+            self.record(host, requests=1, bytes=size, seconds=time.monotonic() - started)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def host_stats(self):
+        """The per-host counters as a JSON-serializable dict"""
+        with self.lock:
+            return {
+                host: {key: round(value, 3) for key, value in sorted(counts.items())}
+                for host, counts in sorted(self.hosts.items())
+            }
+
+    def prune(self):
+        """Evict expired responses from the cache, then the oldest ones while its file is larger than `max_size`"""
+        if self._session is None or not self.cache:
+            return
+
+        responses = self._session.cache.responses
+        before = responses.count()
+        self._session.cache.delete(expired=True)
+        size = responses.size()
+        if self.max_size and size > self.max_size:
+            # The file only shrinks once vacuumed, so evict a share of the responses matching the excess size
+            excess = math.ceil(responses.count() * (1 - self.max_size / size))
+            keys = [response.cache_key for response in responses.sorted('expires', limit=excess)]
+            self._session.cache.delete(*keys, vacuum=False)
+            responses.vacuum()
+        evicted = before - responses.count()
+        if evicted:
+            self.log.info(f"Evicted {evicted} responses from the HTTP cache, {responses.size() / 1024 / 1024:.1f} MiB left")
+
+    def close(self):
+        """Prune the cache and close the session"""
+        self.prune()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def add_transport_arguments(parser):
+    """Add the options of `transport_from_options` to an importer's argument parser"""
+    http = parser.add_argument_group('HTTP')
+    http.add_argument('--retries', type=int, default=RETRIES,
+                      help=f'Retries with exponential backoff on 5xx responses and timeouts (default: {RETRIES})')
+    http.add_argument('--timeout', type=float, default=READ_TIMEOUT,
+                      help=f'Timeout in seconds for a single request (default: {READ_TIMEOUT})')
+    http.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT,
+                      help=f'Timeout in seconds for opening a connection (default: {CONNECT_TIMEOUT})')
+    http.add_argument('--http-cache-dir', default=os.getenv('USTC_HTTP_CACHE_DIR', '.'), metavar='DIR',
+                      help='Directory of the HTTP response cache (default: $USTC_HTTP_CACHE_DIR or the current directory)')
+    http.add_argument('--http-cache-max-age', type=int, default=HTTP_CACHE_MAX_AGE, metavar='SECONDS',
+                      help=f'How long cached responses are used (default: {HTTP_CACHE_MAX_AGE})')
+    http.add_argument('--http-cache-max-size', type=int, default=HTTP_CACHE_MAX_SIZE // 1024 // 1024, metavar='MIB',
+                      help=f'Size the HTTP cache is pruned to after each run (default: {HTTP_CACHE_MAX_SIZE // 1024 // 1024})')
+    http.add_argument('--no-http-cache', action='store_true', default=False,
+                      help='Neither read nor write the HTTP response cache')
+
+
+def transport_from_options(name, options, pool_size=10, rate_limiter=None, log=None):
+    """Build the `Transport` of an importer from the options of `add_transport_arguments`"""
+    return Transport(
+        name,
+        cache_dir=options['http_cache_dir'],
+        cache=not options['no_http_cache'],
+        max_age=options['http_cache_max_age'],
+        max_size=options['http_cache_max_size'] * 1024 * 1024,
+        pool_size=pool_size,
+        timeout=(options['connect_timeout'], options['timeout']),
+        retries=options['retries'],
+        rate_limiter=rate_limiter,
+        log=log,
+    )
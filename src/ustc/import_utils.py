@@ -0,0 +1,259 @@
+"""
+Helpers shared by the ``fetch_timetable`` and ``fetch_schedule`` importers
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+
+# Keep every statement well below the bind-parameter limits of SQLite and PostgreSQL
+BATCH_SIZE = 500
+
+
+def chunked(items, size=BATCH_SIZE):
+    """Split a sequence into consecutive lists of at most ``size`` items"""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields=None, batch_size=BATCH_SIZE):
+    """
+    Insert ``objs`` in bulk, resolving conflicts on ``unique_fields``
+
+    Existing rows get ``update_fields`` overwritten; without ``update_fields``
+    existing rows are left untouched (insert-if-missing).
+    """
+    if not objs:
+        return
+
+    if update_fields:
+        model.objects.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+    else:
+        model.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+
+
+def id_map(model, field, values, target='pk'):
+    """Return a ``{value: target}`` map (``target`` defaults to the pk) for the rows whose ``field`` is one of ``values``"""
+    result = {}
+    for chunk in chunked(set(values)):
+        result.update(model.objects.filter(**{f"{field}__in": chunk}).values_list(field, target))
+    return result
+
+
+def fingerprint(payload):
+    """Stable SHA-256 hex digest of a JSON-serializable payload, independent of key order"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class IdentityMap:
+    """
+    Run-scoped cache of model instances keyed by a natural key such as jw_id or person_id
+
+    Each key is loaded from the database at most once per run, and the instance is only saved
+    when the upstream attributes passed to `resolve` differ from what is already stored.
+    A `readonly` map never updates existing rows, for worker processes whose shared rows were
+    already resolved by the parent process. `filters` restricts the rows it resolves keys to.
+    """
+
+    def __init__(self, model, key_field, readonly=False, filters=None):
+        self.model = model
+        self.key_field = key_field
+        self.readonly = readonly
+        self.filters = filters or {}
+        self.cache = {}
+        self.stats = Counter()
+
+    def preload(self, keys):
+        """Load every uncached key of ``keys`` with one query per chunk instead of one per key"""
+        missing = set(keys) - self.cache.keys()
+        for chunk in chunked(missing):
+            queryset = self.model.objects.filter(**{f"{self.key_field}__in": chunk}, **self.filters)
+            for instance in queryset.order_by('pk'):
+                self.cache.setdefault(getattr(instance, self.key_field), instance)
+                self.stats["loaded"] += 1
+
+    def resolve(self, key, defaults, fallback=None):
+        """
+        Return ``(instance, created)`` for ``key``, creating the row or updating the changed ``defaults``
+
+        ``fallback`` is an optional filter used to adopt an existing row when nothing matches ``key``
+        yet (e.g. a row created by another importer that doesn't know the key).
+        """
+        self.stats["resolved"] += 1
+        instance = self.cache.get(key)
+        if instance is None:
+            self.stats["loaded"] += 1
+            # Ordered by primary key, so that a key shared by several rows always resolves to the same one
+            instance = self.model.objects.filter(**{self.key_field: key}, **self.filters).order_by('pk').first()
+            if instance is None and fallback:
+                instance = self.model.objects.filter(**fallback).order_by('pk').first()
+            if instance is None:
+                instance = self.model.objects.create(**{self.key_field: key}, **defaults)
+                self.cache[key] = instance
+                self.stats["created"] += 1
+                return instance, True
+            self.cache[key] = instance
+
+        if not self.readonly and self.update(instance, {self.key_field: key, **defaults}):
+            self.stats["updated"] += 1
+        return instance, False
+
+    def update(self, instance, values):
+        """Save the fields of ``values`` that differ on ``instance``, returning the names of the changed fields"""
+        changed = []
+        for name, value in values.items():
+            field = self.model._meta.get_field(name)
+            if field.is_relation:
+                value = value.pk if value is not None else None
+            if getattr(instance, field.attname) != value:
+                setattr(instance, field.attname, value)
+                changed.append(name)
+        if changed:
+            instance.save(update_fields=changed)
+        return changed
+
+    def evict(self, key):
+        """Forget the cached instance for ``key``"""
+        self.cache.pop(key, None)
+
+
+def run_in_processes(func, tasks, workers):
+    """
+    Call ``func(*args)`` for every ``args`` of ``tasks`` on a pool of ``workers`` processes
+
+    ``tasks`` is consumed lazily, so the caller can prepare the next task while the pool works on the
+    previous ones; at most twice as many tasks as workers are queued at a time. Yields ``(args, result, error)``
+    in completion order, with ``error`` set to the exception when a task failed. Workers are spawned rather
+    than forked so they never share the parent's database connections, and set Django up themselves.
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as executor:
+        pending = {}
+
+        def finished(futures):
+            for future in futures:
+                args = pending.pop(future)
+                error = future.exception()
+                yield args, None if error else future.result(), error
+
+        for args in tasks:
+            pending[executor.submit(func, *args)] = args
+            yield from finished([future for future in pending if future.done()])
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+
+
+def log_run_summary(logger, results):
+    """Log the statistics of ``[(semester, stats, seconds), ...]`` merged over all semesters, then per semester"""
+    def describe(stats):
+        return ", ".join(f"{name}: {count}" for name, count in sorted(stats.items())) or "nothing to do"
+
+    total = Counter()
+    for _, stats, _ in results:
+        total.update(stats)
+
+    logger.info(f"Run summary for {len(results)} semesters: {describe(total)}")
+    for semester, stats, seconds in results:
+        logger.info(f"  {semester.name} ({semester.code}) in {seconds:.1f}s: {describe(stats)}")
+
+
+class Checkpoint:
+    """
+    Persisted progress of one semester's import, so an interrupted run can resume where it stopped
+
+    Tracks the lessons whose batch was committed and the batches that failed, with their error. Each batch is
+    appended to a log next to the JSON state file, which is only rewritten (compacting the log into it) on the
+    first write of a run and once the import completes. Only one process may write a given checkpoint.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.log_path = self.path.with_suffix('.log')
+        self.completed = False
+        self.done = set()
+        self.failed = {}
+        self.compacted = False
+
+        if resume and self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.completed = state['completed']
+            self.done = set(state['done'])
+            self.failed = state['failed']
+            if self.log_path.exists():
+                with open(self.log_path, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            self.apply(json.loads(line))
+                        except ValueError:
+                            # Cut short by an interruption, the last batch is done again
+                            break
+
+    @property
+    def failed_lesson_ids(self):
+        return {lesson_id for batch in self.failed.values() for lesson_id in batch['lesson_ids']}
+
+    def apply(self, event):
+        if 'done' in event:
+            self.done.update(event['done'])
+            # Forget earlier failures of the batches it completes
+            self.failed = {
+                key: batch for key, batch in self.failed.items() if not self.done.issuperset(batch['lesson_ids'])
+            }
+        else:
+            self.failed[event['key']] = event['failed']
+
+    def mark_done(self, lesson_ids):
+        """Record a committed batch, forgetting earlier failures of batches it completes"""
+        self.append({'done': sorted(lesson_ids)})
+
+    def mark_failed(self, lesson_ids, error):
+        """Record a batch that couldn't be fetched or committed, to be retried later"""
+        self.append({'key': fingerprint(sorted(lesson_ids)), 'failed': {
+            'lesson_ids': sorted(lesson_ids),
+            'error': str(error),
+            'failed_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }})
+
+    def mark_completed(self):
+        self.completed = True
+        self.save()
+
+    def append(self, event):
+        if not self.compacted:
+            # Of a fresh start or a resumed run, so that the log only holds this run's batches
+            self.save()
+        self.apply(event)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def save(self):
+        """Atomically rewrite the state file with everything recorded so far, emptying the log"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'completed': self.completed, 'done': sorted(self.done), 'failed': self.failed},
+                f, ensure_ascii=False, separators=(',', ':'),
+            )
+        os.replace(tmp_path, self.path)
+        self.log_path.unlink(missing_ok=True)
+        self.compacted = True
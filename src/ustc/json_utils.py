@@ -0,0 +1,91 @@
+"""
+Incremental parsing of large JSON arrays, so importers never hold a whole response in memory
+"""
+import codecs
+import json
+import re
+
+# Bytes read from a response or archive at a time
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+_significant = re.compile(r'[^ \t\n\r]')
+
+
+def iter_json_array(chunks):
+    """
+    Yield the items of a top-level JSON array read from an iterable of UTF-8 byte chunks
+
+    Only the item being parsed and the unparsed rest of the current chunk are kept in memory.
+    The chunks are always read to the end. Raises ValueError if the document isn't an array,
+    ends early or has trailing data.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    exhausted = False
+
+    def read():
+        nonlocal buffer, position, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer = buffer[position:] + decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[position:] + decoder.decode(chunk)
+        position = 0
+
+    def skip_whitespace():
+        # Returns the next significant character, reading more input as needed, or '' at the end
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _whitespace:
+                position += 1
+            if position < len(buffer) or exhausted:
+                return buffer[position:position + 1]
+            read()
+
+    def finish():
+        # Read the input to its end, so that wrappers such as ResponseArchive.record_chunks see all of it
+        nonlocal position
+        position += 1
+        while not exhausted:
+            read()
+        if _significant.search(buffer, position):
+            raise ValueError("Unexpected data after JSON array")
+
+    if skip_whitespace() != '[':
+        raise ValueError("Expected a JSON array")
+    position += 1
+
+    if skip_whitespace() == ']':
+        finish()
+        return
+
+    while True:
+        # An item is only complete once the delimiter following it has been read, e.g. for numbers split across chunks
+        try:
+            item, end = _decoder.raw_decode(buffer, position)
+            following = _significant.search(buffer, end)
+            complete = exhausted or (following is not None and following.group() in ',]')
+        except json.JSONDecodeError:
+            if exhausted:
+                raise ValueError("Truncated or invalid JSON array")
+            complete = False
+        if not complete:
+            read()
+            continue
+
+        position = end
+        yield item
+
+        delimiter = skip_whitespace()
+        if delimiter == ']':
+            finish()
+            return
+        position += 1
+        if delimiter != ',':
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {delimiter!r}")
+        skip_whitespace()
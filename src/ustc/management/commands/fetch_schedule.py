@@ -1,18 +1,47 @@
-import requests_cache
+import contextlib
+import requests
 import json
 import logging
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
 from django.core.management.base import BaseCommand
 from ustc.models import Section, Schedule, ScheduleGroup, Room, Teacher, Building, Campus, Semester
 from ustc.models_extra import RoomType
 from django.db import transaction
+from django.utils.dateparse import parse_date
+from ustc.archive_utils import ArchiveError, ResponseArchive
+from ustc.http_utils import (
+    RETRY_STATUS_CODES, AdaptiveBatchSize, TokenBucket, add_transport_arguments, transport_from_options
+)
+from ustc.pipeline_utils import Pipeline
+from ustc.telemetry_utils import Telemetry, emit_report, profiling
+from ustc.snapshot_utils import write_outdated_snapshots
+from ustc.version_utils import bump_data_version, bumps_explicitly
+from ustc.import_utils import (
+    BATCH_SIZE, Checkpoint, IdentityMap, chunked, fingerprint, log_run_summary, run_in_processes
+)
+
+# Schedule columns that may change while the reconcile key (Schedule.reconcile_key) stays the same
+SCHEDULE_UPDATE_FIELDS = [
+    "section", "custom_place", "periods", "weekday", "end_time", "experiment", "lesson_type",
+    "week_index", "exercise_class", "start_unit", "end_unit",
+]
 
 
 class Command(BaseCommand):
-    help = "Fetches schedule data for sections in groups of 50 and commits to the database"
+    help = "Fetches schedule data for sections in batches and commits to the database"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.session = requests_cache.CachedSession('cache_fetch_schedule', expire_after=60 * 60 * 24)  # Cache for 24 hours
+        self.transport = None
+        self.force = False
+        self.record_archive = None
+        self.replay_archive = None
+        self.shared_resolved = False  # Set in worker processes, whose shared rows the parent process resolves
+        self.telemetry = Telemetry('fetch_schedule')
+        self.reset_identity_maps()
         self.logger = logging.getLogger('ustc.fetch_schedule')
         self.setup_logging()
 
@@ -36,15 +65,69 @@ class Command(BaseCommand):
         parser.add_argument('--log-level', default='INFO',
                             choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                             help='Set the logging level explicitly')
-
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Number of schedule requests kept in flight (default: 1)')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Maximum requests per second, 0 for no limit (default: 0)')
+        batching = parser.add_argument_group('batching')
+        batching.add_argument('--batch-policy', choices=['adaptive', 'fixed'], default='adaptive',
+                              help='Resize batches by latency, response size and errors, splitting failed ones, '
+                                   'or always request --batch-size sections (default: adaptive)')
+        batching.add_argument('--batch-size', type=int, default=100,
+                              help='Sections requested per batch to start with (default: 100)')
+        batching.add_argument('--min-batch-size', type=int, default=10,
+                              help='Smallest batch the adaptive policy shrinks or splits to (default: 10)')
+        batching.add_argument('--max-batch-size', type=int, default=250,
+                              help='Largest batch the adaptive policy grows to (default: 250)')
+        batching.add_argument('--target-latency', type=float, default=10,
+                              help='Seconds per request above which batches shrink (default: 10)')
+        batching.add_argument('--max-response-size', type=int, default=16 * 1024 * 1024, metavar='BYTES',
+                              help='Response size above which batches shrink (default: 16 MiB)')
+        parser.add_argument('--base-url', default='https://jw.ustc.edu.cn',
+                            help='Base URL of the schedule API, e.g. a local stub replaying recorded responses')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Rewrite the schedules of every section, even if the upstream payload is unchanged')
+        archive = parser.add_mutually_exclusive_group()
+        archive.add_argument('--record', metavar='DIR',
+                             help='Also write every raw API response to an archive directory')
+        archive.add_argument('--replay', metavar='DIR',
+                             help='Import from an archive directory written by --record instead of the network')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Commit this many semesters at a time in separate processes (default: 1)')
+        parser.add_argument('--state-dir', default='fetch_schedule_state',
+                            help='Directory keeping the progress of each semester (default: fetch_schedule_state)')
+        progress = parser.add_mutually_exclusive_group()
+        progress.add_argument('--resume', action='store_true', default=False,
+                              help='Skip the semesters and sections completed by an earlier, interrupted run')
+        progress.add_argument('--retry-failed', action='store_true', default=False,
+                              help='Only retry the batches recorded as failed by earlier runs')
+        parser.add_argument('--report', metavar='FILE',
+                            help='Write the JSON telemetry report of the run to this file instead of the log')
+        parser.add_argument('--profile', metavar='FILE',
+                            help='Run under cProfile and write the statistics to this file (the main process only)')
+        add_transport_arguments(parser)
+
+    @bumps_explicitly()
     def handle(self, *args, **options):
-        if options.get('quiet'):
-            self.logger.setLevel(logging.WARNING)
-        elif options.get('log_level'):
-            log_level = options['log_level']
-            self.logger.setLevel(getattr(logging, log_level))
-
-        self.logger.debug("Debug logging is enabled")
+        with profiling(options['profile'], self.logger), self.telemetry.capture_queries():
+            try:
+                results = self.run(options)
+            finally:
+                if self.transport:
+                    self.transport.close()
+                if self.record_archive:
+                    self.record_archive.close()
+
+        total = Counter()
+        for _, stats, _ in results:
+            total.update(stats)
+        self.count_identity_map_rows()
+        hosts = self.transport.host_stats() if self.transport else None
+        emit_report(self.logger, self.telemetry.report(total, hosts=hosts), options['report'])
+
+    def run(self, options):
+        """Import the semesters selected by `options`, returning `[(semester, stats, seconds), ...]`"""
+        self.configure(options)
 
         # Get all available semesters
         self.logger.info("Getting available semesters...")
@@ -52,7 +135,7 @@ class Command(BaseCommand):
 
         if not semesters:
             self.logger.error("No semesters found in database")
-            return
+            return []
 
         # If --all not specified, use only the most recent semester
         if not options['all']:
@@ -61,10 +144,15 @@ class Command(BaseCommand):
         else:
             self.logger.info(f"Processing all {semesters.count()} semesters")
 
-        self.logger.info("Please enter cookies for the request (key=value pairs, separated by semicolons):")
-        cookies_input = input().strip()
-        self.cookies = {k.strip(): v.strip() for k, v in (pair.split('=') for pair in cookies_input.split(';'))}
-        self.logger.debug(f"Cookies parsed with {len(self.cookies)} key-value pairs")
+        if self.replay_archive:
+            self.cookies = {}
+        else:
+            self.logger.info("Please enter cookies for the request (key=value pairs, separated by semicolons):")
+            cookies_input = input().strip()
+            self.cookies = {
+                k.strip(): v.strip() for k, v in (pair.split('=', 1) for pair in cookies_input.split(';') if pair.strip())
+            }
+            self.logger.debug(f"Cookies parsed with {len(self.cookies)} key-value pairs")
 
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:140.0) Gecko/20100101 Firefox/140.0",
@@ -82,42 +170,226 @@ class Command(BaseCommand):
         }
         self.logger.debug("HTTP headers configured")
 
-        # Process each selected semester
-        for semester in semesters:
-            self.logger.info(f"Processing semester: {semester.name} ({semester.code})")
-
-            # Get all section IDs for this semester
-            self.logger.info(f"Starting schedule data fetch for semester {semester.name}...")
-            section_ids = list(Section.objects.filter(semester=semester).values_list('jw_id', flat=True))
-            self.logger.info(f"Found {len(section_ids)} sections to process for semester {semester.name}")
+        if options['workers'] > 1:
+            results = self.import_semesters_parallel(list(semesters), options)
+        else:
+            # Process each selected semester
+            results = []
+            for semester in semesters:
+                started = time.monotonic()
+                stats = self.import_semester(semester)
+                results.append((semester, stats, time.monotonic() - started))
+
+        self.log_identity_map_stats()
+        log_run_summary(self.logger, results)
+        with self.telemetry.stage("snapshot"):
+            write_outdated_snapshots([semester for semester, _, _ in results], self.logger)
+        return results
+
+    def configure(self, options):
+        """Apply the logging, HTTP and archive options, shared by `handle` and the worker processes"""
+        if options.get('quiet'):
+            self.logger.setLevel(logging.WARNING)
+        elif options.get('log_level'):
+            log_level = options['log_level']
+            self.logger.setLevel(getattr(logging, log_level))
 
-            if not section_ids:
-                self.logger.warning(f"No sections found for semester {semester.name}, skipping")
-                continue
+        self.logger.debug("Debug logging is enabled")
 
-            self.process_section_ids(section_ids)
+        self.concurrency = max(1, options['concurrency'])
+        self.rate_limiter = TokenBucket(options['rate'])
+        self.transport = transport_from_options(
+            'cache_fetch_schedule', options, pool_size=self.concurrency, rate_limiter=self.rate_limiter, log=self.logger
+        )
+        self.batch_size = AdaptiveBatchSize(
+            options['batch_size'],
+            minimum=options['min_batch_size'],
+            maximum=options['max_batch_size'],
+            adaptive=options['batch_policy'] == 'adaptive',
+            target_latency=options['target_latency'],
+            max_bytes=options['max_response_size'],
+        )
+        self.base_url = options['base_url'].rstrip('/')
+        self.force = options['force']
+        self.state_dir = Path(options['state_dir'])
+        self.resume = options['resume']
+        self.retry_failed = options['retry_failed']
+
+        if options['record']:
+            self.record_archive = ResponseArchive(options['record'])
+            self.logger.info(f"Recording responses to {options['record']}")
+        if options['replay']:
+            self.replay_archive = ResponseArchive(options['replay'])
+            # Which archived batch holds each lesson, for requests split differently than when recording
+            self.replay_index = {
+                lesson_id: key
+                for key in self.replay_archive.keys('schedule/datum/')
+                for lesson_id in self.replay_archive.entries[key].get('lesson_ids', [])
+            }
+            self.logger.info(f"Replaying responses from {options['replay']}")
+
+    def import_semester(self, semester):
+        """Fetch and commit the schedules of every section of a semester, returning a Counter of section stats"""
+        self.logger.info(f"Processing semester: {semester.name} ({semester.code})")
+
+        # Get all section IDs for this semester
+        self.logger.info(f"Starting schedule data fetch for semester {semester.name}...")
+        section_ids = list(Section.objects.filter(semester=semester).values_list('jw_id', flat=True))
+        self.logger.info(f"Found {len(section_ids)} sections to process for semester {semester.name}")
+
+        if not section_ids:
+            self.logger.warning(f"No sections found for semester {semester.name}, skipping")
+            return Counter()
+
+        checkpoint = self.open_checkpoint(semester)
+        pending_ids = self.pending_section_ids(semester, checkpoint, section_ids)
+        if not pending_ids:
+            self.logger.info(f"No sections left to process for semester {semester.name}")
+            return Counter()
+
+        stats = self.process_section_ids(pending_ids, checkpoint=checkpoint)
+        if not checkpoint.failed and checkpoint.done.issuperset(section_ids):
+            checkpoint.mark_completed()
+        self.logger.info(
+            f"Sync summary: Created: {stats['created']}, Changed: {stats['changed']}, Unchanged: {stats['unchanged']}, "
+            f"Removed upstream: {stats['removed']}, Failed: {stats['failed']}, Not in database: {stats['missing']}"
+        )
+        self.logger.info(
+            f"Schedules: {stats['schedules_inserted']} inserted, {stats['schedules_updated']} updated, "
+            f"{stats['schedules_deleted']} deleted"
+        )
+        return stats
+
+    def import_semesters_parallel(self, semesters, options):
+        """
+        Import semesters on `--workers` processes, returning `[(semester, stats, seconds), ...]`
+
+        Schedule data is fetched here, one semester after another, into an archive (the --record or
+        --replay one, otherwise a temporary directory), and the rows shared between semesters (teachers
+        and rooms with their buildings, campuses and room types) are resolved as each batch arrives.
+        Worker processes then replay the archive and only write the schedule groups, schedules and
+        fingerprints of their own semester, so they never contend for the same rows.
+        """
+        workers = options['workers']
+        self.logger.info(f"Importing {len(semesters)} semesters with {workers} worker processes")
+        semesters_by_id = {semester.pk: semester for semester in semesters}
+        prepared = {}
+        results = []
+
+        with tempfile.TemporaryDirectory(prefix='fetch_schedule-') as temp_dir, contextlib.ExitStack() as stack:
+            if not self.record_archive and not self.replay_archive:
+                self.record_archive = stack.enter_context(ResponseArchive(temp_dir))
+                stack.callback(setattr, self, 'record_archive', None)
+            archive_path = str((self.replay_archive or self.record_archive).path)
+            worker_options = {
+                **{key: options[key] for key in [
+                    'quiet', 'log_level', 'rate', 'retries', 'timeout', 'connect_timeout', 'base_url', 'force',
+                    'http_cache_dir', 'http_cache_max_age', 'http_cache_max_size', 'no_http_cache',
+                    'state_dir', 'resume', 'retry_failed', 'batch_policy', 'batch_size', 'min_batch_size',
+                    'max_batch_size', 'target_latency', 'max_response_size',
+                ]},
+                'concurrency': 1,
+                'record': None,
+                'replay': archive_path,
+            }
 
-    def process_section_ids(self, section_ids):
-        """Process a list of section IDs to fetch and update schedule data"""
+            def tasks():
+                for semester in semesters:
+                    self.logger.info(f"Fetching schedules and resolving shared rows for semester {semester.name} ({semester.code})")
+                    started = time.monotonic()
+                    section_ids = list(Section.objects.filter(semester=semester).values_list('jw_id', flat=True))
+                    # Fetch exactly what the worker will replay, its checkpoint is only read here
+                    section_ids = self.pending_section_ids(semester, self.open_checkpoint(semester), section_ids)
+                    if not section_ids:
+                        self.logger.warning(f"No sections to process for semester {semester.name}, skipping")
+                        results.append((semester, Counter(), time.monotonic() - started))
+                        continue
+
+                    self.process_section_ids(section_ids, handle_batch=self.resolve_shared_rows)
+                    if self.record_archive:
+                        # The worker reads the manifest to replay the batches
+                        self.record_archive.flush()
+                    prepared[semester.pk] = time.monotonic() - started
+                    yield semester.pk, worker_options
+
+            for (semester_id, _), result, error in run_in_processes(import_semester_process, tasks(), workers):
+                semester = semesters_by_id[semester_id]
+                seconds = prepared.pop(semester_id)
+                if error:
+                    self.logger.error(f"Failed to import semester {semester.name}: {error}")
+                    stats = Counter(failed_semesters=1)
+                else:
+                    stats, worker_seconds, report = result
+                    seconds += worker_seconds
+                    self.telemetry.merge(report)
+                results.append((semester, stats, seconds))
+
+        order = {semester.pk: i for i, semester in enumerate(semesters)}
+        return sorted(results, key=lambda result: order[result[0].pk])
+
+    def open_checkpoint(self, semester):
+        """Load the progress of `semester` for --resume and --retry-failed, otherwise start it afresh"""
+        return Checkpoint(self.state_dir / f"{semester.jw_id}.json", resume=self.resume or self.retry_failed)
+
+    def pending_section_ids(self, semester, checkpoint, section_ids):
+        """Narrow `section_ids` down to the sections --resume or --retry-failed still have to process"""
+        if self.retry_failed:
+            failed = checkpoint.failed_lesson_ids
+            self.logger.info(f"Retrying {len(failed)} sections of {len(checkpoint.failed)} failed batches")
+            return [section_id for section_id in section_ids if section_id in failed]
+
+        if self.resume:
+            if checkpoint.completed:
+                self.logger.info(f"Semester {semester.name} was completed by an earlier run")
+                return []
+            section_ids = [section_id for section_id in section_ids if section_id not in checkpoint.done]
+            self.logger.info(f"Resuming with {len(section_ids)} sections left")
+
+        return section_ids
+
+    def process_section_ids(self, section_ids, handle_batch=None, checkpoint=None):
+        """
+        Process a list of section IDs to fetch and update schedule data, returning a Counter of section stats
+
+        Batches flow through a bounded pipeline: up to --concurrency requests are fetched while the previous
+        batches are decoded on a parse thread and committed here, on the main thread, by `handle_batch`
+        (`commit_batch` by default). Each batch is then marked as done or failed on `checkpoint` if one is given,
+        except for the sections `handle_batch` lists in ``batch["failed_sections"]``, which are marked as failed.
+        Batch sizes follow `self.batch_size`, and the parts of a batch fetched separately after it failed are
+        marked on their own.
+        """
+        handle_batch = handle_batch or self.commit_batch
         section_ids = sorted(section_ids)[::-1]  # Ensure section IDs are sorted
         self.logger.debug("Section IDs sorted in reverse order")
 
-        # Divide section IDs into groups
-        LEN = 100
-        section_id_groups = [section_ids[i:i + LEN] for i in range(0, len(section_ids), LEN)]
-        self.logger.info(f"Divided into {len(section_id_groups)} groups of up to {LEN} sections each")
+        def section_id_groups():
+            # Sized as the source thread reads them, so each batch uses what earlier requests taught the controller
+            start = 0
+            while start < len(section_ids):
+                size = self.batch_size.next()
+                yield section_ids[start:start + size]
+                start += size
+
+        batch_size = self.batch_size
+        self.logger.info(
+            f"Fetching in batches of {batch_size.size} sections" +
+            (f", adapting between {batch_size.minimum} and {batch_size.maximum}" if batch_size.adaptive else "")
+        )
 
-        url = "https://jw.ustc.edu.cn/ws/schedule-table/datum"
+        url = f"{self.base_url}/ws/schedule-table/datum"
         self.logger.debug(f"Using API endpoint: {url}")
-        self.logger.debug("Using requests_cache with 24-hour expiration")
+        self.logger.debug(f"Caching responses in {self.transport.cache_path} for {self.transport.max_age}s")
+        self.logger.debug(f"Keeping up to {self.concurrency} requests in flight")
 
         # Track progress
-        total_groups = len(section_id_groups)
         processed_sections = 0
         total_sections = len(section_ids)
+        stats = Counter()
 
-        for i, group in enumerate(section_id_groups, 1):
-            self.logger.info(f"Processing group {i}/{total_groups} with {len(group)} sections " +
+        def commit(i, group, batch, error):
+            # Runs on the main thread in group order, so progress and database writes stay serialized
+            nonlocal processed_sections
+            self.logger.info(f"Processing group {i} with {len(group)} sections " +
                              f"(Overall progress: {processed_sections}/{total_sections} sections, {processed_sections / total_sections:.1%})")
 
             if self.logger.isEnabledFor(logging.DEBUG):
@@ -126,22 +398,146 @@ class Command(BaseCommand):
             processed_sections += len(group)
 
             try:
-                self.logger.debug(f"Sending POST request to {url}")
-                response = self.session.post(
-                    url,
-                    headers=self.headers,
-                    cookies=self.cookies,
-                    data=json.dumps({"lessonIds": group})
-                )
-                response.raise_for_status()
-                data = response.json()
-                self.logger.debug(f"Received response with status {response.status_code}")
-
-                self.parse_and_commit(data)
-                self.logger.info(f"Completed processing group {i}/{total_groups}")
+                if error:
+                    raise error
+                for part, part_error in batch["failed_parts"]:
+                    self.logger.error(f"Error fetching {len(part)} sections of group {i}: {str(part_error)}")
+                    stats["failed_batches"] += 1
+                    if checkpoint:
+                        checkpoint.mark_failed(part, part_error)
+                if batch["lesson_ids"]:
+                    stats.update(handle_batch(batch))
+                    stats["removed"] += len(set(batch["lesson_ids"]) - batch["fingerprints"].keys())
+                    if checkpoint:
+                        # Sections that failed on their own are retried on their own
+                        failed_sections = batch.get("failed_sections", {})
+                        for section_id, section_error in failed_sections.items():
+                            checkpoint.mark_failed([section_id], section_error)
+                        checkpoint.mark_done(set(batch["lesson_ids"]) - failed_sections.keys())
+                self.logger.info(f"Completed processing group {i}")
 
             except Exception as e:
-                self.logger.error(f"Error fetching data for group {i}/{total_groups}: {str(e)}", exc_info=True)
+                self.logger.error(f"Error fetching data for group {i}: {str(e)}", exc_info=True)
+                stats["failed_batches"] += 1
+                if checkpoint:
+                    checkpoint.mark_failed(group, e)
+
+        pipeline = Pipeline("schedule datum", [
+            ("fetch", lambda group: self.fetch_batch(url, group), self.concurrency),
+            ("parse", self.parse_parts, 1),
+        ], capacity=self.concurrency, log=self.logger)
+        for i, (group, batch, error) in enumerate(pipeline.run(section_id_groups()), 1):
+            commit(i, group, batch, error)
+
+        self.logger.info(f"Batch sizes: {self.batch_size.describe()}")
+        return stats
+
+    def fetch_batch(self, url, group):
+        """
+        Fetch a group of section IDs, returning `[(part, body, error), ...]`, runs on a fetch thread
+
+        With the adaptive policy a group that times out or keeps failing upstream is split in halves
+        and each half fetched on its own, down to --min-batch-size, so one bad request only loses
+        the sections it can't do without.
+        """
+        started = time.monotonic()
+        try:
+            body = self.fetch_group(url, group)
+        except Exception as e:
+            self.batch_size.record_failure(len(group))
+            if not self.batch_size.adaptive or len(group) <= self.batch_size.minimum or not splittable(e):
+                return [(group, None, e)]
+            self.logger.warning(f"Fetching {len(group)} sections failed ({str(e)}), splitting the batch in halves")
+            self.telemetry.count("batch_splits")
+            middle = len(group) // 2
+            return self.fetch_batch(url, group[:middle]) + self.fetch_batch(url, group[middle:])
+
+        self.batch_size.record_success(len(group), time.monotonic() - started, len(body))
+        return [(group, body, None)]
+
+    def fetch_group(self, url, group):
+        """Fetch the raw schedule datum of a group of section IDs, runs on a fetch thread"""
+        with self.telemetry.stage("fetch"):
+            return self.fetch_group_content(url, group)
+
+    def fetch_group_content(self, url, group):
+        key = f"schedule/datum/{fingerprint(sorted(group))}"
+        if self.replay_archive:
+            return self.replay_group(key, group)
+
+        self.logger.debug(f"Sending POST request to {url}")
+        response = self.transport.post(
+            url,
+            on_retry=self.batch_size.record_retry,
+            headers=self.headers,
+            cookies=self.cookies,
+            data=json.dumps({"lessonIds": group})
+        )
+        self.logger.debug(f"Received response with status {response.status_code}")
+        if self.record_archive:
+            self.record_archive.record(key, response.content, url=url, lesson_ids=sorted(group))
+        return response.content
+
+    def replay_group(self, key, group):
+        """Read the schedule datum of a group from the archive, assembling it from other batches if needed"""
+        if key in self.replay_archive.entries:
+            self.logger.debug(f"Replaying {key} from archive")
+            return self.replay_archive.load(key)
+
+        # The batches were split differently when recording, pick the lessons out of every batch holding them
+        wanted = set(group)
+        if not_recorded := wanted - self.replay_index.keys():
+            raise ArchiveError(f"No recorded response for lessons {sorted(not_recorded)}")
+        result = {"lessonList": [], "scheduleGroupList": [], "scheduleList": []}
+        for archived_key in sorted({self.replay_index[i] for i in wanted if i in self.replay_index}):
+            self.logger.debug(f"Replaying part of {key} from {archived_key}")
+            archived = self.replay_archive.load_json(archived_key).get("result", {})
+            result["lessonList"] += [lesson for lesson in archived.get("lessonList", []) if lesson.get("id") in wanted]
+            for name in ("scheduleGroupList", "scheduleList"):
+                result[name] += [item for item in archived.get(name, []) if item.get("lessonId") in wanted]
+        return json.dumps({"result": result}, ensure_ascii=False).encode('utf-8')
+
+    def reset_identity_maps(self):
+        """Create the run-scoped caches resolving related rows by their upstream keys"""
+        readonly = self.shared_resolved
+        self.campuses = IdentityMap(Campus, "jw_id", readonly=readonly)
+        self.campuses_by_name = IdentityMap(Campus, "name_cn", readonly=readonly)
+        self.buildings = IdentityMap(Building, "jw_id", readonly=readonly)
+        self.room_types = IdentityMap(RoomType, "jw_id", readonly=readonly)
+        self.rooms = IdentityMap(Room, "jw_id", readonly=readonly)
+        self.teachers = IdentityMap(Teacher, "person_id", readonly=readonly)
+        # Teachers upstream doesn't know the person of
+        self.teachers_by_name = IdentityMap(Teacher, "name_cn", readonly=readonly, filters={"person_id__isnull": True})
+        self.schedule_groups = IdentityMap(ScheduleGroup, "jw_id")
+
+    def clear_identity_maps(self):
+        """Drop every cached instance, keeping the statistics"""
+        for identity_map in [self.campuses, self.campuses_by_name, self.buildings, self.room_types,
+                             self.rooms, self.teachers, self.teachers_by_name, self.schedule_groups]:
+            identity_map.cache.clear()
+
+    def count_identity_map_rows(self):
+        """Add the rows the identity maps created and updated to the telemetry"""
+        for identity_map in [self.campuses, self.campuses_by_name, self.buildings, self.room_types,
+                             self.rooms, self.teachers, self.teachers_by_name, self.schedule_groups]:
+            self.telemetry.count_rows(
+                identity_map.model, inserted=identity_map.stats["created"], updated=identity_map.stats["updated"]
+            )
+
+    def log_identity_map_stats(self):
+        """Log how often each cache was hit, loaded from and written to the database"""
+        for name in ["campuses", "buildings", "room_types", "rooms", "teachers", "teachers_by_name", "schedule_groups"]:
+            stats = getattr(self, name).stats
+            self.logger.info(
+                f"Resolved {name}: {stats['resolved']} lookups, {stats['loaded']} loaded, "
+                f"{stats['created']} created, {stats['updated']} updated"
+            )
+
+    def log_resolved(self, model_name, name, jw_id, created):
+        if created:
+            self.logger.info(f"Created new {model_name}: {name} (jw_id: {jw_id})")
+        else:
+            self.logger.debug(f"Resolved existing {model_name}: {name} (jw_id: {jw_id})")
 
     def create_or_update_campus(self, campus_data):
         if not campus_data:
@@ -157,29 +553,18 @@ class Command(BaseCommand):
         self.logger.debug(f"Processing campus: {campus_name} (jw_id: {campus_id})")
 
         if campus_id:
-            # If we have a jw_id, use it as the primary lookup
-            campus, created = Campus.objects.update_or_create(
-                jw_id=campus_id,
-                defaults={
-                    "name_cn": campus_name,
-                    "name_en": campus_data.get("nameEn"),
-                }
+            # If we have a jw_id, use it as the primary lookup, adopting a campus created by name in fetch_timetable
+            campus, created = self.campuses.resolve(
+                campus_id,
+                {"name_cn": campus_name, "name_en": campus_data.get("nameEn")},
+                fallback={"name_cn": campus_name, "jw_id__isnull": True},
             )
         else:
             # Fall back to using name_cn if no jw_id is available
             self.logger.warning(f"No jw_id for campus {campus_name}, using name_cn as lookup key")
-            campus, created = Campus.objects.update_or_create(
-                name_cn=campus_name,
-                defaults={
-                    "name_en": campus_data.get("nameEn"),
-                }
-            )
-
-        if created:
-            self.logger.info(f"Created new Campus: {campus_name} (jw_id: {campus_id})")
-        else:
-            self.logger.debug(f"Updated existing Campus: {campus_name} (jw_id: {campus_id})")
+            campus, created = self.campuses_by_name.resolve(campus_name, {"name_en": campus_data.get("nameEn")})
 
+        self.log_resolved("Campus", campus_name, campus_id, created)
         return campus
 
     def create_or_update_building(self, building_data):
@@ -195,21 +580,14 @@ class Command(BaseCommand):
         self.logger.debug("Processing campus for building")
         campus = self.create_or_update_campus(building_data.get("campus"))
 
-        building, created = Building.objects.update_or_create(
-            jw_id=building_id,
-            defaults={
-                "code": building_data.get("code"),
-                "name_cn": building_name,
-                "name_en": building_data.get("nameEn"),
-                "campus": campus
-            }
-        )
-
-        if created:
-            self.logger.info(f"Created new Building: {building_name} (jw_id: {building_id})")
-        else:
-            self.logger.debug(f"Updated existing Building: {building_name} (jw_id: {building_id})")
+        building, created = self.buildings.resolve(building_id, {
+            "code": building_data.get("code"),
+            "name_cn": building_name,
+            "name_en": building_data.get("nameEn"),
+            "campus": campus
+        })
 
+        self.log_resolved("Building", building_name, building_id, created)
         return building
 
     def create_or_update_room_type(self, room_type_data):
@@ -221,20 +599,13 @@ class Command(BaseCommand):
         room_type_id = room_type_data.get("id")
         self.logger.debug(f"Processing room type: {room_type_name} (jw_id: {room_type_id})")
 
-        room_type, created = RoomType.objects.update_or_create(
-            jw_id=room_type_id,
-            defaults={
-                "code": room_type_data.get("code"),
-                "name_cn": room_type_name,
-                "name_en": room_type_data.get("nameEn"),
-            }
-        )
-
-        if created:
-            self.logger.info(f"Created new RoomType: {room_type_name} (jw_id: {room_type_id})")
-        else:
-            self.logger.debug(f"Updated existing RoomType: {room_type_name} (jw_id: {room_type_id})")
+        room_type, created = self.room_types.resolve(room_type_id, {
+            "code": room_type_data.get("code"),
+            "name_cn": room_type_name,
+            "name_en": room_type_data.get("nameEn"),
+        })
 
+        self.log_resolved("RoomType", room_type_name, room_type_id, created)
         return room_type
 
     def create_or_update_room(self, room_data):
@@ -252,56 +623,45 @@ class Command(BaseCommand):
         self.logger.debug("Processing room type for room")
         room_type = self.create_or_update_room_type(room_data.get("roomType"))
 
-        room, created = Room.objects.update_or_create(
-            jw_id=room_id,
-            defaults={
-                "code": room_data.get("code"),
-                "name_cn": room_name,
-                "name_en": room_data.get("nameEn"),
-                "floor": room_data.get("floor"),
-                "virtual": room_data.get("virtual", False),
-                "seats_for_section": room_data.get("seatsForLesson"),
-                "remark": room_data.get("remark"),
-                "seats": room_data.get("seats", 0),
-                "building": building,
-                "room_type": room_type
-            }
-        )
-
-        if created:
-            self.logger.info(f"Created new Room: {room_name} (jw_id: {room_id})")
-        else:
-            self.logger.debug(f"Updated existing Room: {room_name} (jw_id: {room_id})")
-
+        room, created = self.rooms.resolve(room_id, {
+            "code": room_data.get("code"),
+            "name_cn": room_name,
+            "name_en": room_data.get("nameEn"),
+            "floor": room_data.get("floor"),
+            "virtual": room_data.get("virtual", False),
+            "seats_for_section": room_data.get("seatsForLesson"),
+            "remark": room_data.get("remark"),
+            "seats": room_data.get("seats", 0),
+            "building": building,
+            "room_type": room_type
+        })
+
+        self.log_resolved("Room", room_name, room_id, created)
         return room
 
     def create_or_update_teacher(self, teacher_id, person_id, person_name):
         self.logger.debug(f"Processing teacher: {person_name} (teacher_id: {teacher_id})")
 
-        teacher = Teacher.objects.filter(person_id=person_id).first()
-        if not teacher:
-            teacher = Teacher.objects.filter(name_cn=person_name, person_id__isnull=True).first()
-
-        if not teacher:
-            self.logger.debug(f"Teacher with person_id={person_id} not found, creating new record")
-            teacher, created = Teacher.objects.update_or_create(
-                person_id=person_id,
-                defaults={
-                    "name_cn": person_name,
-                    "teacher_id": teacher_id,
-                    "person_id": person_id,
-                    "department": None
-                }
+        if person_id is None:
+            if not person_name:
+                self.logger.debug("No person_id nor name for teacher, leaving schedule without teacher")
+                return None
+            # Only known by name: one of the teachers of that name without a person
+            teacher, created = self.teachers_by_name.resolve(person_name, {"teacher_id": teacher_id})
+        else:
+            teacher, created = self.teachers.resolve(
+                person_id,
+                {"name_cn": person_name, "teacher_id": teacher_id},
+                fallback={"name_cn": person_name, "person_id__isnull": True},
             )
-            if created:
-                self.logger.info(f"Created new Teacher: {person_name} (teacher_id: {teacher_id})")
-            else:
-                self.logger.debug(f"Updated existing Teacher: {person_name} (teacher_id: {teacher_id})")
+            if getattr(self.teachers_by_name.cache.get(person_name), "pk", None) == teacher.pk:
+                # Adopted by its person, the cached copy is stale
+                self.teachers_by_name.evict(person_name)
+
+        if created:
+            self.logger.info(f"Created new Teacher: {person_name} (teacher_id: {teacher_id})")
         else:
-            teacher.person_id = person_id
-            teacher.teacher_id = teacher_id
-            teacher.name_cn = person_name
-            self.logger.debug(f"Found existing Teacher: {person_name} (teacher_id: {teacher_id})")
+            self.logger.debug(f"Resolved existing Teacher: {person_name} (teacher_id: {teacher_id})")
 
         return teacher
 
@@ -315,31 +675,27 @@ class Command(BaseCommand):
 
         self.logger.debug(f"Processing schedule group #{group_no} for section {section.code} (jw_id: {group_id})")
 
-        schedule_group, created = ScheduleGroup.objects.update_or_create(
-            jw_id=group_id,
-            defaults={
-                "section": section,
-                "no": group_no,
-                "limit_count": group_data.get("limitCount"),
-                "std_count": group_data.get("stdCount"),
-                "actual_periods": group_data.get("actualPeriods"),
-                "default": group_data.get("default", False)
-            }
-        )
+        schedule_group, created = self.schedule_groups.resolve(group_id, {
+            "section": section,
+            "no": group_no,
+            "limit_count": group_data.get("limitCount"),
+            "std_count": group_data.get("stdCount"),
+            "actual_periods": group_data.get("actualPeriods"),
+            "default": group_data.get("default", False)
+        })
 
         if created:
             self.logger.info(f"Created new Schedule Group #{group_no} for {section.code} (jw_id: {group_id})")
         else:
-            self.logger.debug(f"Updated existing Schedule Group #{group_no} for {section.code} (jw_id: {group_id})")
+            self.logger.debug(f"Resolved existing Schedule Group #{group_no} for {section.code} (jw_id: {group_id})")
 
         return schedule_group
 
-    def create_or_update_schedule(self, schedule_data, section):
-        if not schedule_data or not section:
-            self.logger.debug("Missing schedule data or section, returning None")
-            return None
-
+    def build_schedule(self, schedule_data, section, schedule_groups):
+        """Build an unsaved Schedule for `schedule_data`, resolving its room, teacher and schedule group"""
         date = schedule_data.get("date")
+        if isinstance(date, str):
+            date = parse_date(date)
         weekday = schedule_data.get("weekday")
         schedule_group_id = schedule_data.get("scheduleGroupId")
 
@@ -355,13 +711,14 @@ class Command(BaseCommand):
             person_name=schedule_data.get("personName"),
         )
 
-        self.logger.debug(f"Looking up schedule group with jw_id: {schedule_group_id}")
-        schedule_group = ScheduleGroup.objects.filter(jw_id=schedule_group_id).first()
+        schedule_group = schedule_groups.get(schedule_group_id) or self.schedule_groups.cache.get(schedule_group_id)
+        if not schedule_group:
+            self.logger.debug(f"Looking up schedule group with jw_id: {schedule_group_id}")
+            schedule_group = ScheduleGroup.objects.filter(jw_id=schedule_group_id).first()
         if not schedule_group:
-            self.logger.warning(f"Schedule group with jw_id {schedule_group_id} not found")
+            raise ValueError(f"Schedule group with jw_id {schedule_group_id} not found")
 
-        # Simply create a new schedule entry
-        schedule = Schedule.objects.create(
+        return Schedule(
             section=section,
             schedule_group=schedule_group,
             room=room,
@@ -380,77 +737,291 @@ class Command(BaseCommand):
             end_unit=schedule_data.get("endUnit")
         )
 
-        self.logger.info(f"Created new Schedule for {section.code} on {date} (weekday: {weekday})")
+    def reconcile_schedules(self, sections, new_schedules):
+        """
+        Make the stored schedules of `sections` match `new_schedules` with as few writes as possible
+
+        Rows are matched on `Schedule.reconcile_key()`: matches keep their primary key and are only
+        updated when another field differs, the rest are bulk inserted or deleted.
+        """
+        existing = defaultdict(list)
+        for schedule in Schedule.objects.filter(section__in=sections).order_by('id'):
+            existing[schedule.reconcile_key()].append(schedule)
+
+        to_create = []
+        to_update = []
+        for schedule in new_schedules:
+            matches = existing.get(schedule.reconcile_key())
+            if not matches:
+                to_create.append(schedule)
+                continue
 
-        return schedule
+            current = matches.pop(0)
+            attnames = [Schedule._meta.get_field(field).attname for field in SCHEDULE_UPDATE_FIELDS]
+            if any(getattr(current, attname) != getattr(schedule, attname) for attname in attnames):
+                for attname in attnames:
+                    setattr(current, attname, getattr(schedule, attname))
+                to_update.append(current)
 
-    def parse_and_commit(self, data):
-        """Parse the JSON response and commit to the database"""
+        to_delete = [schedule.id for matches in existing.values() for schedule in matches]
+        self.write_schedules(to_create, to_update, to_delete)
+
+        self.logger.debug(
+            f"Schedules: {len(to_create)} inserted, {len(to_update)} updated, {len(to_delete)} deleted, "
+            f"{len(new_schedules) - len(to_create) - len(to_update)} unchanged"
+        )
+        self.telemetry.count_rows(Schedule, inserted=len(to_create), updated=len(to_update), deleted=len(to_delete))
+        return Counter({
+            "schedules_inserted": len(to_create),
+            "schedules_updated": len(to_update),
+            "schedules_deleted": len(to_delete),
+        })
+
+    def write_schedules(self, to_create, to_update, to_delete):
+        """Apply the result of `reconcile_schedules` with batched statements, load_snapshot writes it through COPY instead"""
+        for chunk in chunked(to_delete):
+            Schedule.objects.filter(id__in=chunk).delete()
+        Schedule.objects.bulk_update(to_update, SCHEDULE_UPDATE_FIELDS, batch_size=BATCH_SIZE)
+        Schedule.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+    def update_section_teachers(self, section, lesson):
+        """Copy the person and teacher IDs of the lesson's teacher assignments onto the section's teachers"""
+        teacher_mapping: dict[str, dict] = {}
+        for teacher_data in lesson.get('teacherAssignmentList', []):
+            teacher_mapping[teacher_data['name']] = teacher_data
+
+        for teacher in section.teachers.all():
+            if (teacher_data := teacher_mapping.get(teacher.name_cn)) is not None:
+                old_person_id = teacher.person_id
+                if self.teachers.update(teacher, {
+                    "person_id": teacher_data.get("personId"),
+                    "teacher_id": teacher_data.get("teacherId"),
+                }):
+                    # Cached teachers under either person_id or the name may no longer match the database
+                    self.teachers.evict(old_person_id)
+                    self.teachers.evict(teacher.person_id)
+                    self.teachers_by_name.evict(teacher.name_cn)
+                    self.logger.debug(f"Updated teacher {teacher.name_cn} with person_id {teacher.person_id} and teacher_id {teacher.teacher_id}")
 
+    def resolve_shared_rows(self, batch):
+        """
+        Resolve the rows of a parsed schedule datum batch that are shared between semesters
+
+        Used by `import_semesters_parallel` in place of `commit_batch`: the teachers of every lesson
+        and the rooms and teachers of every schedule are written, the rest is left to the worker processes.
+        """
+        lesson_list = batch["lessons"]
+        sections = Section.objects.filter(
+            jw_id__in=[lesson.get("id") for lesson in lesson_list]
+        ).prefetch_related('teachers').in_bulk(field_name='jw_id')
+
+        try:
+            with self.telemetry.atomic(), self.telemetry.stage("resolve"):
+                for lesson in lesson_list:
+                    if section := sections.get(lesson.get("id")):
+                        self.update_section_teachers(section, lesson)
+
+                for schedule_data in batch["schedules"]:
+                    self.create_or_update_room(schedule_data.get("room"))
+                    self.create_or_update_teacher(
+                        teacher_id=schedule_data.get("teacherId"),
+                        person_id=schedule_data.get("personId"),
+                        person_name=schedule_data.get("personName"),
+                    )
+        except Exception:
+            # Everything cached during this batch may have been rolled back
+            self.clear_identity_maps()
+            raise
+
+        return Counter()
+
+    def parse_batch(self, body):
+        """Decode a raw schedule datum response and normalize it for `commit_batch`, runs on the parse thread"""
+        with self.telemetry.stage("decode"):
+            return self.normalize_batch(json.loads(body))
+
+    def parse_parts(self, parts):
+        """
+        Decode the parts returned by `fetch_batch` into one batch for `commit_batch`, runs on the parse thread
+
+        The batch also lists the `lesson_ids` that were fetched and the `failed_parts` as `(part, error)`.
+        """
+        fetched = [(part, body) for part, body, error in parts if error is None]
+        failed = [(part, error) for part, _, error in parts if error is not None]
+        if not fetched:
+            raise failed[0][1]
+
+        if len(fetched) == 1:
+            batch = self.parse_batch(fetched[0][1])
+        else:
+            with self.telemetry.stage("decode"):
+                result = {"lessonList": [], "scheduleGroupList": [], "scheduleList": []}
+                for _, body in fetched:
+                    part_result = json.loads(body).get("result", {})
+                    for name in result:
+                        result[name] += part_result.get(name, [])
+                batch = self.normalize_batch({"result": result})
+
+        batch["lesson_ids"] = [lesson_id for part, _ in fetched for lesson_id in part]
+        batch["failed_parts"] = failed
+        return batch
+
+    def normalize_batch(self, data):
+        """
+        Bucket the schedule groups and schedules of a datum response by lesson and fingerprint each lesson
+
+        Pure computation without database access, so it can run off the main thread.
+        """
         result = data.get("result", {})
 
         lesson_list = result.get("lessonList", [])
         schedule_group_list = result.get("scheduleGroupList", [])
         schedule_list = result.get("scheduleList", [])
 
-        self.logger.info(f"Processing data with {len(lesson_list)} lessons, {len(schedule_group_list)} schedule groups, and {len(schedule_list)} schedules")
-
-        processed_sections = 0
-        missing_sections = 0
-
-        for lesson in lesson_list:
-            section_id = lesson.get("id")
-            self.logger.debug(f"Processing lesson with ID: {section_id}")
-
-            section = Section.objects.filter(jw_id=section_id).first()
-            if not section:
-                self.logger.warning(f"Section with ID {section_id} not found in database")
-                missing_sections += 1
-                continue
-
-            # update teacher info related to this section
-            teacher_mapping: dict[str, dict] = {}
-            for teacher_data in lesson.get('teacherAssignmentList', []):
-                teacher_mapping[teacher_data['name']] = teacher_data
+        # Bucket groups and schedules by lessonId once instead of rescanning them for every lesson
+        groups_by_lesson = defaultdict(list)
+        for group in schedule_group_list:
+            groups_by_lesson[group.get("lessonId")].append(group)
+
+        schedules_by_lesson = defaultdict(list)
+        for schedule_data in schedule_list:
+            schedules_by_lesson[schedule_data.get("lessonId")].append(schedule_data)
+
+        return {
+            "lessons": lesson_list,
+            "schedule_groups": schedule_group_list,
+            "schedules": schedule_list,
+            "groups_by_lesson": groups_by_lesson,
+            "schedules_by_lesson": schedules_by_lesson,
+            "fingerprints": {
+                lesson.get("id"): fingerprint({
+                    "lesson": lesson,
+                    "groups": groups_by_lesson[lesson.get("id")],
+                    "schedules": schedules_by_lesson[lesson.get("id")],
+                })
+                for lesson in lesson_list
+            },
+        }
 
-            for teacher in section.teachers.all():
-                if (teacher_data := teacher_mapping.get(teacher.name_cn)) is not None:
-                    teacher.person_id = teacher_data.get("personId")
-                    teacher.teacher_id = teacher_data.get("teacherId")
-                    teacher.save()
-                    self.logger.debug(f"Updated teacher {teacher.name_cn} with person_id {teacher.person_id} and teacher_id {teacher.teacher_id}")
+    def parse_and_commit(self, data):
+        """Parse a decoded JSON response and commit it to the database, see `commit_batch`"""
+        return self.commit_batch(self.normalize_batch(data))
+
+    def commit_batch(self, batch):
+        """
+        Commit a batch normalized by `normalize_batch` to the database
+
+        Sections whose lesson, schedule group and schedule payload has the same fingerprint as last time
+        are left untouched. Returns a Counter of created/changed/unchanged/failed/missing sections; the
+        sections that failed are listed with their error in ``batch["failed_sections"]``.
+        """
+        lesson_list = batch["lessons"]
+        schedule_group_list = batch["schedule_groups"]
+        groups_by_lesson = batch["groups_by_lesson"]
+        schedules_by_lesson = batch["schedules_by_lesson"]
+
+        self.logger.info(f"Processing data with {len(lesson_list)} lessons, {len(schedule_group_list)} schedule groups, and {len(batch['schedules'])} schedules")
+
+        sections = Section.objects.filter(
+            jw_id__in=[lesson.get("id") for lesson in lesson_list]
+        ).prefetch_related('teachers').in_bulk(field_name='jw_id')
+        self.schedule_groups.preload(group.get("id") for group in schedule_group_list)
+
+        stats = Counter()
+        committed_sections = []
+        new_schedules = []
+        batch["failed_sections"] = {}
+
+        try:
+            with self.telemetry.atomic():
+                with self.telemetry.stage("resolve"):
+                    for lesson in lesson_list:
+                        section_id = lesson.get("id")
+                        self.logger.debug(f"Processing lesson with ID: {section_id}")
+
+                        section = sections.get(section_id)
+                        if not section:
+                            self.logger.warning(f"Section with ID {section_id} not found in database")
+                            stats["missing"] += 1
+                            continue
+
+                        payload_fingerprint = batch["fingerprints"][section_id]
+                        if not self.force and section.schedule_fingerprint == payload_fingerprint:
+                            self.logger.debug(f"Schedules of section {section.code} are unchanged, skipping")
+                            stats["unchanged"] += 1
+                            continue
+
+                        if not self.shared_resolved:
+                            self.update_section_teachers(section, lesson)
+
+                        self.logger.debug(f"Found section: {section.code} (jw_id: {section_id})")
+
+                        # Each section gets its own savepoint so a bad section doesn't drop the whole batch
+                        try:
+                            with transaction.atomic():
+                                section_groups = {}
+                                for group in groups_by_lesson[section_id]:
+                                    self.logger.debug(f"Processing schedule group for section ID: {section_id}")
+                                    schedule_group = self.create_or_update_schedule_group(group, section)
+                                    section_groups[schedule_group.jw_id] = schedule_group
+                                self.logger.debug(f"Processed {len(section_groups)} schedule groups for section {section.code}")
+
+                                section_schedules = [
+                                    self.build_schedule(schedule_data, section, section_groups)
+                                    for schedule_data in schedules_by_lesson[section_id]
+                                ]
+                        except Exception as e:
+                            self.logger.error(f"Error processing section {section.code}: {str(e)}")
+                            stats["failed"] += 1
+                            batch["failed_sections"][section_id] = e
+                            # Rows created or updated in the rolled back savepoint may be cached
+                            self.clear_identity_maps()
+                            continue
+
+                        stats["created" if section.schedule_fingerprint is None else "changed"] += 1
+                        section.schedule_fingerprint = payload_fingerprint
+                        committed_sections.append(section)
+                        new_schedules.extend(section_schedules)
+
+                with self.telemetry.stage("write"):
+                    stats.update(self.reconcile_schedules(committed_sections, new_schedules))
+                    Section.objects.bulk_update(committed_sections, ['schedule_fingerprint'], batch_size=BATCH_SIZE)
+                    self.telemetry.count_rows(Section, updated=len(committed_sections))
+                    if committed_sections:
+                        bump_data_version(*(section.semester_id for section in committed_sections))
+        except Exception:
+            # Everything cached during this batch may have been rolled back
+            self.clear_identity_maps()
+            raise
+
+        self.logger.info(
+            f"Successfully processed {len(committed_sections)} sections ({stats['unchanged']} unchanged), "
+            f"{stats['missing']} sections not found"
+        )
+        if stats["missing"] > 0:
+            self.logger.warning(f"{stats['missing']} sections were not found in database")
 
-            self.logger.debug(f"Found section: {section.code} (jw_id: {section_id})")
-            processed_sections += 1
+        return stats
 
-            # Process scheduleGroupList and scheduleList in a transaction
-            try:
-                with transaction.atomic():
-                    # Process scheduleGroupList
-                    groups_count = 0
-                    for group in schedule_group_list:
-                        if group.get("lessonId") == section_id:
-                            self.logger.debug(f"Processing schedule group for section ID: {section_id}")
-                            self.create_or_update_schedule_group(group, section)
-                            groups_count += 1
-                    self.logger.debug(f"Processed {groups_count} schedule groups for section {section.code}")
-
-                    # First, delete all existing schedules for this section
-                    deleted_count = Schedule.objects.filter(section=section).delete()[0]
-                    self.logger.debug(f"Deleted {deleted_count} existing schedules for section {section.code}")
-
-                    # Process scheduleList and create new schedules
-                    schedules_count = 0
-                    for schedule_data in schedule_list:
-                        if schedule_data.get("lessonId") == section_id:
-                            self.logger.debug(f"Creating new schedule for section ID: {section_id}")
-                            self.create_or_update_schedule(schedule_data, section)
-                            schedules_count += 1
-                    self.logger.debug(f"Created {schedules_count} new schedules for section {section.code}")
-            except Exception as e:
-                self.logger.error(f"Error processing section {section.code}: {str(e)}")
-                continue
 
-        self.logger.info(f"Successfully processed {processed_sections} sections, {missing_sections} sections not found")
-        if missing_sections > 0:
-            self.logger.warning(f"{missing_sections} sections were not found in database")
+def splittable(error):
+    """Whether a failed request may succeed with fewer sections: timeouts, dropped connections and 5xx/413 responses"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (
+            error.response.status_code in RETRY_STATUS_CODES or error.response.status_code == 413
+        )
+    return isinstance(error, (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError))
+
+
+@bumps_explicitly()
+def import_semester_process(semester_id, options):
+    """Commit the archived schedule data of one semester in a worker process of `Command.import_semesters_parallel`"""
+    command = Command()
+    command.shared_resolved = True
+    command.reset_identity_maps()
+    command.configure(options)
+    started = time.monotonic()
+    with command.telemetry.capture_queries():
+        stats = command.import_semester(Semester.objects.get(pk=semester_id))
+    command.count_identity_map_rows()
+    return stats, time.monotonic() - started, command.telemetry.report()
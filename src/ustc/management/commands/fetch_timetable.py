@@ -1,5 +1,8 @@
-import requests_cache
+import json
 import logging
+import time
+from collections import Counter
+from itertools import islice
 from django.core.management.base import BaseCommand
 from datetime import datetime
 from ustc.models import (
@@ -7,6 +10,37 @@ from ustc.models import (
     CourseClassify, Department, Campus, ExamMode, TeachLanguage,
     EducationLevel, ClassType, Teacher, AdminClass, Semester
 )
+from ustc.archive_utils import ResponseArchive
+from ustc.http_utils import add_transport_arguments, transport_from_options
+from ustc.json_utils import CHUNK_SIZE, iter_json_array
+from ustc.pipeline_utils import Pipeline
+from ustc.telemetry_utils import Telemetry, emit_report, profiling
+from ustc.snapshot_utils import write_outdated_snapshots
+from ustc.version_utils import bump_data_version, bumps_explicitly
+from ustc.import_utils import (
+    BATCH_SIZE, bulk_upsert, chunked, fingerprint, id_map, log_run_summary, run_in_processes
+)
+
+# Lookup tables keyed by name_cn, as (model, key in the lesson JSON)
+COURSE_LOOKUPS = {
+    "education_level": (EducationLevel, "education"),
+    "gradation": (CourseGradation, "courseGradation"),
+    "category": (CourseCategory, "courseCategory"),
+    "class_type": (ClassType, "classType"),
+    "type": (CourseType, "courseType"),
+    "classify": (CourseClassify, "courseClassify"),
+}
+SECTION_LOOKUPS = {
+    "campus": (Campus, "campus"),
+    "exam_mode": (ExamMode, "examMode"),
+    "teach_language": (TeachLanguage, "teachLang"),
+}
+# Plain Section columns copied from the lesson JSON, see Command.parse_section_fields
+SECTION_FIELDS = [
+    "code", "credits", "period", "periods_per_week", "std_count", "limit_count",
+    "graduate_and_postgraduate", "date_time_place_text", "date_time_place_person_text",
+    "lesson_fingerprint",
+]
 
 
 class Command(BaseCommand):
@@ -14,9 +48,14 @@ class Command(BaseCommand):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.session = requests_cache.CachedSession('cache_fetch_timetable', expire_after=60 * 60 * 24)  # Cache for 24 hours
+        self.transport = None
         self.logger = logging.getLogger('ustc.fetch_timetable')
         self.setup_logging()
+        self.record_archive = None
+        self.replay_archive = None
+        self.stream = False
+        self.chunk_size = BATCH_SIZE
+        self.telemetry = Telemetry('fetch_timetable')
 
     def setup_logging(self):
         """Configure logging for the command"""
@@ -38,9 +77,47 @@ class Command(BaseCommand):
         parser.add_argument('--log-level', default='INFO',
                             choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                             help='Set the logging level explicitly')
+        parser.add_argument('--bulk', action='store_true', default=False,
+                            help='Resolve the whole lesson list in memory and write it with bulk upserts')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Rewrite every section, even those whose upstream payload is unchanged')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Import this many semesters at a time in separate processes, implies --bulk (default: 1)')
+        parser.add_argument('--stream', action='store_true', default=False,
+                            help='Parse lesson lists incrementally, bypassing the HTTP cache, and import them in chunks')
+        parser.add_argument('--chunk-size', type=int, default=BATCH_SIZE,
+                            help=f'Lessons imported at a time with --stream (default: {BATCH_SIZE})')
+        archive = parser.add_mutually_exclusive_group()
+        archive.add_argument('--record', metavar='DIR',
+                             help='Also write every raw API response to an archive directory')
+        archive.add_argument('--replay', metavar='DIR',
+                             help='Import from an archive directory written by --record instead of the network')
+        parser.add_argument('--report', metavar='FILE',
+                            help='Write the JSON telemetry report of the run to this file instead of the log')
+        parser.add_argument('--profile', metavar='FILE',
+                            help='Run under cProfile and write the statistics to this file (the main process only)')
+        add_transport_arguments(parser)
         # Django automatically adds --verbosity
 
+    @bumps_explicitly()
     def handle(self, *args, **options):
+        with profiling(options['profile'], self.logger), self.telemetry.capture_queries():
+            try:
+                results = self.run(options)
+            finally:
+                if self.transport:
+                    self.transport.close()
+                if self.record_archive:
+                    self.record_archive.close()
+
+        total = Counter()
+        for _, stats, _ in results:
+            total.update(stats)
+        hosts = self.transport.host_stats() if self.transport else None
+        emit_report(self.logger, self.telemetry.report(total, hosts=hosts), options['report'])
+
+    def run(self, options):
+        """Import the semesters selected by `options`, returning `[(semester, stats, seconds), ...]`"""
         if options.get('quiet'):
             self.logger.setLevel(logging.WARNING)
         elif options.get('log_level'):
@@ -49,11 +126,22 @@ class Command(BaseCommand):
 
         self.logger.debug("Debug logging is enabled")
 
+        # The semester list and a lesson list may be fetched at the same time
+        self.transport = transport_from_options('cache_fetch_timetable', options, pool_size=2, log=self.logger)
+        if options['record']:
+            self.record_archive = ResponseArchive(options['record'])
+            self.logger.info(f"Recording responses to {options['record']}")
+        if options['replay']:
+            self.replay_archive = ResponseArchive(options['replay'])
+            self.logger.info(f"Replaying responses from {options['replay']}")
+        self.stream = options['stream']
+        self.chunk_size = max(1, options['chunk_size'])
+
         semesters = self.fetch_and_update_semesters()
 
         if not semesters:
             self.logger.error("Failed to fetch semesters list")
-            return
+            return []
 
         if not options['all']:
             # Use the most recent semester as default
@@ -61,9 +149,77 @@ class Command(BaseCommand):
             self.logger.warning(f"Using most recent semester: {most_recent.name} ({most_recent.code})")
             semesters = [most_recent]
 
-        for semester in semesters:
-            self.logger.info(f"Processing semester: {semester.name} ({semester.code})")
-            self.fetch_and_process_semester(semester)
+        if options['workers'] > 1:
+            results = self.import_semesters_parallel(semesters, options['workers'], force=options['force'])
+        else:
+            results = []
+            for semester in semesters:
+                self.logger.info(f"Processing semester: {semester.name} ({semester.code})")
+                started = time.monotonic()
+                stats = self.fetch_and_process_semester(semester, bulk=options['bulk'], force=options['force'])
+                results.append((semester, stats, time.monotonic() - started))
+
+        log_run_summary(self.logger, results)
+        with self.telemetry.stage("snapshot"):
+            write_outdated_snapshots([semester for semester, _, _ in results], self.logger)
+        return results
+
+    def import_semesters_parallel(self, semesters, workers, force=False):
+        """
+        Import semesters on `workers` processes, returning `[(semester, stats, seconds), ...]`
+
+        Lesson lists are fetched and the rows shared between semesters (lookups, departments, courses,
+        teachers, admin classes) written here, one semester after another and in the same order as a
+        sequential run. Worker processes then only write the sections and links of their own semester,
+        so they never contend for the same rows.
+        """
+        self.logger.info(f"Importing {len(semesters)} semesters with {workers} worker processes")
+        semesters_by_id = {semester.pk: semester for semester in semesters}
+        stats = {semester.pk: Counter() for semester in semesters}
+        seconds = dict.fromkeys(semesters_by_id, 0.0)
+
+        def tasks():
+            for semester in semesters:
+                self.logger.info(f"Processing semester: {semester.name} ({semester.code})")
+                started = time.monotonic()
+                for data in self.fetch_changed_lessons(semester, stats[semester.pk], force):
+                    try:
+                        self.import_shared_rows(data)
+                    except Exception as e:
+                        self.logger.error(f"Failed to write shared rows for semester {semester.name}: {e}", exc_info=True)
+                        stats[semester.pk]["failed_semesters"] = 1
+                        break
+
+                    seconds[semester.pk] += time.monotonic() - started
+                    yield semester.pk, data, self.logger.level
+                    started = time.monotonic()
+                seconds[semester.pk] += time.monotonic() - started
+
+        for (semester_id, _, _), result, error in run_in_processes(import_semester_process, tasks(), workers):
+            if error:
+                self.logger.error(f"Failed to import semester {semesters_by_id[semester_id].name}: {error}")
+                stats[semester_id]["failed_semesters"] = 1
+            else:
+                section_stats, section_seconds, report = result
+                stats[semester_id].update(section_stats)
+                seconds[semester_id] += section_seconds
+                self.telemetry.merge(report)
+
+        return [(semester, stats[semester.pk], seconds[semester.pk]) for semester in semesters]
+
+    def get_json(self, key, url):
+        """GET `url` as JSON, archiving the raw body under `key` with --record or reading it back with --replay"""
+        if self.replay_archive:
+            self.logger.debug(f"Replaying {key} from archive")
+            content = self.replay_archive.load(key)
+        else:
+            response = self.transport.get(url)
+            if self.record_archive:
+                self.record_archive.record(key, response.content, url=url)
+            content = response.content
+
+        with self.telemetry.stage("decode"):
+            return json.loads(content)
 
     def fetch_and_update_semesters(self):
         """Fetch all available semesters from the API and update them in the database"""
@@ -71,9 +227,8 @@ class Command(BaseCommand):
         self.logger.info(f"Fetching semesters from: {url}")
 
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
-            data = response.json()
+            with self.telemetry.stage("fetch"):
+                data = self.get_json("timetable/semesters", url)
         except Exception as e:
             self.logger.error(f"Failed to fetch semesters: {e}", exc_info=True)
             return []
@@ -107,29 +262,113 @@ class Command(BaseCommand):
         self.logger.info(f"Processed {len(semesters)} semesters (Created: {created_count}, Updated: {updated_count})")
         return semesters
 
-    def fetch_and_process_semester(self, semester):
-        """Fetch and process all sections for a semester"""
-        self.logger.info(f"Fetching data for semester: {semester.name} ({semester.code})")
+    def fetch_lesson_chunks(self, semester):
+        """
+        Yield the lesson list of a semester as lists of lessons
 
+        The list is decoded in one go into a single chunk, unless --stream is set: then the response body
+        (or archived body) is parsed incrementally and yielded in chunks of --chunk-size lessons, so memory
+        use stays flat however large the semester is. Streamed requests bypass the HTTP cache.
+        """
+        key = f"timetable/lessons/{semester.jw_id}"
         url = f"https://catalog.ustc.edu.cn/api/teach/lesson/list-for-teach/{semester.jw_id}"
 
-        try:
-            response = self.session.get(url)
-            response.raise_for_status()
-            data = response.json()
-            self.logger.info(f"Fetched {len(data)} sections")
-        except Exception as e:
-            self.logger.error(f"Failed to fetch sections for semester {semester.name}: {e}", exc_info=True)
+        if not self.stream:
+            yield self.get_json(key, url)
             return
 
+        if self.replay_archive:
+            self.logger.debug(f"Streaming {key} from archive")
+            body = self.replay_archive.load_chunks(key, CHUNK_SIZE)
+        else:
+            response = self.transport.get(url, stream=True, cache=False)
+            body = response.iter_content(CHUNK_SIZE)
+            if self.record_archive:
+                body = self.record_archive.record_chunks(key, body, url=url)
+
+        lessons = iter_json_array(body)
+        while chunk := list(islice(lessons, self.chunk_size)):
+            yield chunk
+
+    def fetch_changed_lessons(self, semester, stats, force=False):
+        """
+        Fetch the lessons of a semester and yield, chunk by chunk, those that need importing
+
+        Fetching and decoding run on a background thread and fingerprinting on another, while the caller
+        imports the previous chunk. Unchanged and removed sections are counted into `stats`. A failed fetch
+        is logged and counted as a failed semester; the chunks yielded before the failure stay valid.
+        """
+        self.logger.info(f"Fetching data for semester: {semester.name} ({semester.code})")
+
+        def fingerprint_chunk(data):
+            with self.telemetry.stage("fingerprint"):
+                return {item.get("id"): fingerprint(item) for item in data}
+
+        sync = Counter()
+        listed = set()
+        pipeline = Pipeline(f"lesson list {semester.jw_id}", [("fingerprint", fingerprint_chunk, 1)], log=self.logger)
+        # With --stream the "fetch" stage includes decoding, which happens as the body is read
+        chunks = pipeline.run(self.telemetry.timed("fetch", self.fetch_lesson_chunks(semester)))
+        try:
+            while True:
+                try:
+                    entry = next(chunks, None)
+                    if entry is None:
+                        break
+                    data, fingerprints, error = entry
+                    if error:
+                        raise error
+                except Exception as e:
+                    self.logger.error(f"Failed to fetch sections for semester {semester.name}: {e}", exc_info=True)
+                    stats["failed_semesters"] += 1
+                    return
+
+                listed.update(fingerprints)
+                data, chunk_sync = self.filter_changed_sections(data, force, fingerprints)
+                sync.update(chunk_sync)
+                if data:
+                    yield data
+        finally:
+            chunks.close()
+
+        removed = set(Section.objects.filter(semester=semester).values_list("jw_id", flat=True)) - listed
+        self.logger.info(f"Fetched {len(listed)} sections")
+        self.logger.info(
+            f"Sync summary for {semester.name}: Created: {sync['created']}, Changed: {sync['changed']}, "
+            f"Unchanged: {sync['unchanged']}, Removed upstream: {len(removed)}"
+        )
+        if removed:
+            self.logger.debug(f"Sections no longer listed upstream: {sorted(removed)}")
+        stats.update(unchanged=sync["unchanged"], removed=len(removed))
+
+    def fetch_and_process_semester(self, semester, bulk=False, force=False):
+        """Fetch and process all sections for a semester, returning a Counter of section stats"""
+        stats = Counter()
+        for data in self.fetch_changed_lessons(semester, stats, force):
+            if bulk:
+                stats.update(self.import_sections_bulk(data, semester))
+            else:
+                stats.update(self.import_sections(data, semester))
+        return stats
+
+    def import_sections(self, data, semester):
+        """
+        Import lessons one by one with `import_section`, returning a Counter of section stats
+
+        The M2M links are collected per section and written for the whole list at the end with `replace_links`.
+        The lesson fingerprints are only stored along with them, so that sections whose links didn't get written
+        are imported again by the next run.
+        """
         # Use a counter to show progress periodically
         created_count = updated_count = error_count = 0
+        links = {"teachers": {}, "admin_classes": {}, "fingerprints": {}}
         total_count = len(data)
         progress_interval = max(1, total_count // 10)  # Report progress at 10% intervals
 
         for i, item in enumerate(data, 1):
             try:
-                result = self.import_section(item, semester)
+                with self.telemetry.stage("write"):
+                    result = self.import_section(item, semester, links)
 
                 if result == 'created':
                     created_count += 1
@@ -144,12 +383,51 @@ class Command(BaseCommand):
             if i % progress_interval == 0 or i == total_count:
                 self.logger.info(f"Progress: {i}/{total_count} sections processed ({i / total_count:.1%})")
 
+        with self.telemetry.stage("write"), self.telemetry.atomic():
+            link_stats = self.write_links(links["teachers"], links["admin_classes"])
+            Section.objects.bulk_update(
+                [Section(pk=pk, lesson_fingerprint=value) for pk, value in links["fingerprints"].items()],
+                ["lesson_fingerprint"], batch_size=BATCH_SIZE,
+            )
+            # The sections themselves were committed one by one above
+            if created_count or updated_count:
+                bump_data_version(semester.pk)
+        self.telemetry.count_rows(Section, inserted=created_count, updated=updated_count)
+
         self.logger.info(
             f"Total sections processed for {semester.name}: {total_count} "
             f"(Created: {created_count}, Updated: {updated_count}, Errors: {error_count})"
         )
-
-    def import_section(self, item, semester):
+        stats = Counter(created=created_count, updated=updated_count, errors=error_count)
+        stats.update(link_stats)
+        return stats
+
+    def filter_changed_sections(self, data, force=False, fingerprints=None):
+        """
+        Drop the lessons whose fingerprint matches the one stored on their section, unless `force` is set
+
+        `fingerprints` maps lesson IDs to their fingerprints if they were computed ahead of time.
+        Returns the remaining lessons and a Counter of created, changed and unchanged sections.
+        """
+        if fingerprints is None:
+            fingerprints = {item.get("id"): fingerprint(item) for item in data}
+        with self.telemetry.stage("filter"):
+            stored = id_map(Section, "jw_id", fingerprints.keys(), target="lesson_fingerprint")
+
+        created = fingerprints.keys() - stored.keys()
+        changed = {jw_id for jw_id in stored if force or stored[jw_id] != fingerprints[jw_id]}
+
+        changed_items = [item for item in data if item.get("id") in created or item.get("id") in changed]
+        return changed_items, Counter(created=len(created), changed=len(changed), unchanged=len(stored) - len(changed))
+
+    def import_section(self, item, semester, links=None):
+        """
+        Import a single lesson, returning 'created' or 'updated'
+
+        If `links` is given, the section's teacher and admin class IDs are stored into
+        ``links["teachers"]`` and ``links["admin_classes"]`` for the caller to write, instead of being set here,
+        and its lesson fingerprint into ``links["fingerprints"]``, to be stored with them.
+        """
         from django.db import transaction
 
         def update_or_create_fk(model, name_cn, name_en=None, **kwargs):
@@ -205,6 +483,9 @@ class Command(BaseCommand):
                 )
 
                 # Step 2: Section-level info
+                section_fields = self.parse_section_fields(item)
+                if links is not None:
+                    lesson_fingerprint = section_fields.pop("lesson_fingerprint")
                 section, created = Section.objects.update_or_create(
                     jw_id=item["id"],
                     defaults={
@@ -215,21 +496,12 @@ class Command(BaseCommand):
                         "exam_mode": update_or_create_fk(ExamMode, item["examMode"]["cn"], item["examMode"]["en"]),
                         "teach_language": update_or_create_fk(TeachLanguage, item["teachLang"]["cn"], item["teachLang"]["en"]),
 
-                        "code": item.get("code", None),
-                        "credits": item.get("credits", 0),
-                        "period": item.get("period", 0),
-                        "periods_per_week": item.get("periodsPerWeek", 0),
-                        "std_count": item.get("stdCount", 0),
-                        "limit_count": item.get("limitCount", 0),
-                        "graduate_and_postgraduate": item.get("graduateAndPostgraduate", False),
-                        "date_time_place_text": item.get("dateTimePlaceText"),
-                        "date_time_place_person_text": item.get("dateTimePlacePersonText", {}),
+                        **section_fields,
                     }
                 )
 
-                # Step 3: Teachers - Use bulk operations for better performance
+                # Step 3: Teachers, set() only deletes vanished links and inserts new ones
                 teacher_list = []
-                section.teachers.clear()
                 for t in item.get("teacherAssignmentList", []):
                     teacher, _ = Teacher.objects.update_or_create(
                         name_cn=t["cn"],
@@ -238,12 +510,11 @@ class Command(BaseCommand):
                     )
                     teacher_list.append(teacher)
 
-                if teacher_list:
-                    section.teachers.add(*teacher_list)
+                if links is None:
+                    section.teachers.set(teacher_list)
 
-                # Step 4: Admin Classes - Use bulk operations for better performance
+                # Step 4: Admin Classes, likewise
                 admin_class_list = []
-                section.admin_classes.clear()
                 for c in item.get("adminClasses", []):
                     admin_class, _ = AdminClass.objects.update_or_create(
                         name_cn=c["cn"],
@@ -251,8 +522,12 @@ class Command(BaseCommand):
                     )
                     admin_class_list.append(admin_class)
 
-                if admin_class_list:
-                    section.admin_classes.add(*admin_class_list)
+                if links is None:
+                    section.admin_classes.set(admin_class_list)
+                else:
+                    links["teachers"][section.pk] = {teacher.pk for teacher in teacher_list}
+                    links["admin_classes"][section.pk] = {admin_class.pk for admin_class in admin_class_list}
+                    links["fingerprints"][section.pk] = lesson_fingerprint
 
                 self.logger.debug(f"{'Created' if created else 'Updated'} section: {section.code}")
                 return 'created' if created else 'updated'
@@ -261,3 +536,317 @@ class Command(BaseCommand):
                 # Log the specific error but re-raise to trigger transaction rollback
                 self.logger.error(f"Error in transaction for section {item.get('id')}: {e}")
                 raise
+
+    def parse_section_fields(self, item):
+        """Extract the plain Section columns (SECTION_FIELDS) from a lesson JSON"""
+        return {
+            "code": item.get("code", None),
+            "credits": item.get("credits", 0),
+            "period": item.get("period", 0),
+            "periods_per_week": item.get("periodsPerWeek", 0),
+            "std_count": item.get("stdCount", 0),
+            "limit_count": item.get("limitCount", 0),
+            "graduate_and_postgraduate": item.get("graduateAndPostgraduate", False),
+            "date_time_place_text": item.get("dateTimePlaceText"),
+            "date_time_place_person_text": item.get("dateTimePlacePersonText", {}),
+            "lesson_fingerprint": fingerprint(item),
+        }
+
+    def parse_section(self, item):
+        """Normalize one lesson JSON into plain values, with related rows referenced by natural keys"""
+        course_info = item["course"]
+
+        def lookup(json_key):
+            name_cn, name_en = item[json_key]["cn"], item[json_key]["en"]
+            return (name_cn, name_en) if name_cn else None
+
+        teachers = [
+            (t["cn"], t.get("en", ""), t.get("departmentCode") or None)
+            for t in item.get("teacherAssignmentList", [])
+        ]
+        admin_classes = [(c["cn"], c.get("en", "")) for c in item.get("adminClasses", [])]
+
+        return {
+            "course": {
+                "jw_id": course_info["id"],
+                "code": course_info["code"],
+                "name_cn": course_info["cn"],
+                "name_en": course_info.get("en", ""),
+                "lookups": {field: lookup(json_key) for field, (_, json_key) in COURSE_LOOKUPS.items()},
+            },
+            "section": {
+                "jw_id": item["id"],
+                **self.parse_section_fields(item),
+                "lookups": {field: lookup(json_key) for field, (_, json_key) in SECTION_LOOKUPS.items()},
+            },
+            "open_department": {
+                "code": item["openDepartment"]["code"],
+                "name_cn": item["openDepartment"]["cn"],
+                "name_en": item["openDepartment"].get("en", ""),
+                "is_college": item["openDepartment"].get("college", False),
+            },
+            "teachers": teachers,
+            "admin_classes": admin_classes,
+        }
+
+    def parse_sections(self, data):
+        """Normalize a lesson list with `parse_section`, returning the records and the number of lessons that failed"""
+        records = []
+        error_count = 0
+        for item in data:
+            try:
+                records.append(self.parse_section(item))
+            except Exception as e:
+                error_count += 1
+                self.logger.error(f"Error parsing section ID {item.get('id', 'unknown')}: {e}")
+        return records, error_count
+
+    def import_shared_rows(self, data):
+        """Write the rows of a lesson list that are shared between semesters, see `resolve_shared_rows`"""
+        with self.telemetry.stage("parse"):
+            records, _ = self.parse_sections(data)
+        with self.telemetry.atomic(), self.telemetry.stage("resolve"):
+            self.resolve_shared_rows(records)
+
+    def resolve_shared_rows(self, records, write=True):
+        """
+        Upsert the rows shared between semesters that `records` reference and return their ID maps
+
+        Covers the lookup tables, departments, courses, teachers and admin classes. With `write=False`
+        the rows are only looked up, for workers whose shared rows were already written by `import_shared_rows`.
+        """
+        # Later occurrences win, matching the sequential update_or_create semantics
+        lookup_values = {model: {} for model, _ in [*COURSE_LOOKUPS.values(), *SECTION_LOOKUPS.values()]}
+        departments = {}
+        teacher_department_codes = set()
+        admin_classes = {}
+        for record in records:
+            for field, (model, _) in COURSE_LOOKUPS.items():
+                if value := record["course"]["lookups"][field]:
+                    lookup_values[model][value[0]] = value[1] or ""
+            for field, (model, _) in SECTION_LOOKUPS.items():
+                if value := record["section"]["lookups"][field]:
+                    lookup_values[model][value[0]] = value[1] or ""
+            departments[record["open_department"]["code"]] = record["open_department"]
+            teacher_department_codes.update(code for _, _, code in record["teachers"] if code)
+            admin_classes.update(record["admin_classes"])
+
+        # Step 1: Lookup tables
+        lookup_ids = {}
+        for model, values in lookup_values.items():
+            if write:
+                self.upsert(
+                    model,
+                    [model(name_cn=name_cn, name_en=name_en) for name_cn, name_en in values.items()],
+                    unique_fields=["name_cn"],
+                    update_fields=["name_en"],
+                )
+            lookup_ids[model] = id_map(model, "name_cn", values)
+
+        def lookup_id(record, field, lookups):
+            value = record["lookups"][field]
+            return lookup_ids[lookups[field][0]][value[0]] if value else None
+
+        # Step 2: Departments, placeholders for codes only referenced by teachers are never overwritten
+        if write:
+            self.upsert(
+                Department,
+                [Department(**dept) for dept in departments.values()],
+                unique_fields=["code"],
+                update_fields=["name_cn", "name_en", "is_college"],
+            )
+            self.upsert(
+                Department,
+                [Department(code=code, name_cn=f"未知({code})") for code in teacher_department_codes - departments.keys()],
+                unique_fields=["code"],
+            )
+        department_ids = id_map(Department, "code", departments.keys() | teacher_department_codes)
+
+        # Step 3: Courses
+        courses = {}
+        for record in records:
+            course = record["course"]
+            courses[course["jw_id"]] = Course(
+                jw_id=course["jw_id"],
+                code=course["code"],
+                name_cn=course["name_cn"],
+                name_en=course["name_en"],
+                **{f"{field}_id": lookup_id(course, field, COURSE_LOOKUPS) for field in COURSE_LOOKUPS},
+            )
+        if write:
+            self.upsert(
+                Course,
+                list(courses.values()),
+                unique_fields=["jw_id"],
+                update_fields=["code", "name_cn", "name_en", *COURSE_LOOKUPS],
+            )
+        course_ids = id_map(Course, "jw_id", courses.keys())
+
+        # Step 4: Teachers, matched on (name_cn, name_en, department) like update_or_create
+        teacher_keys = {
+            (name_cn, name_en, department_ids[code] if code else None)
+            for record in records for name_cn, name_en, code in record["teachers"]
+        }
+        teacher_ids = self.resolve_teacher_ids(teacher_keys, create=write)
+
+        # Step 5: Admin classes
+        if write:
+            self.upsert(
+                AdminClass,
+                [AdminClass(name_cn=name_cn, name_en=name_en) for name_cn, name_en in admin_classes.items()],
+                unique_fields=["name_cn"],
+                update_fields=["name_en"],
+            )
+        admin_class_ids = id_map(AdminClass, "name_cn", admin_classes.keys())
+
+        return {
+            "lookup_id": lookup_id,
+            "departments": department_ids,
+            "courses": course_ids,
+            "teachers": teacher_ids,
+            "admin_classes": admin_class_ids,
+        }
+
+    def import_sections_bulk(self, data, semester, shared_resolved=False):
+        """
+        Import a whole lesson list with set-based writes, returning a Counter of section stats
+
+        All lessons are parsed first, every related row is resolved by its natural key in memory,
+        and each table is then written with a handful of bulk upserts inside one transaction.
+        The resulting rows are the same as importing the lessons one by one with `import_section`.
+        With `shared_resolved` the rows shared between semesters are expected to exist already.
+        """
+        with self.telemetry.stage("parse"):
+            records, error_count = self.parse_sections(data)
+        self.logger.info(f"Parsed {len(records)} sections, writing in bulk")
+
+        with self.telemetry.atomic():
+            with self.telemetry.stage("resolve"):
+                ids = self.resolve_shared_rows(records, write=not shared_resolved)
+            lookup_id = ids["lookup_id"]
+            department_ids = ids["departments"]
+
+            with self.telemetry.stage("write"):
+                # Step 6: Sections
+                sections = {}
+                for record in records:
+                    section = record["section"]
+                    sections[section["jw_id"]] = Section(
+                        course_id=ids["courses"][record["course"]["jw_id"]],
+                        semester=semester,
+                        open_department_id=department_ids[record["open_department"]["code"]],
+                        **{key: value for key, value in section.items() if key != "lookups"},
+                        **{f"{field}_id": lookup_id(section, field, SECTION_LOOKUPS) for field in SECTION_LOOKUPS},
+                    )
+                existing_section_ids = id_map(Section, "jw_id", sections.keys())
+                self.upsert(
+                    Section,
+                    list(sections.values()),
+                    unique_fields=["jw_id"],
+                    update_fields=["course", "semester", "open_department", *SECTION_LOOKUPS, *SECTION_FIELDS],
+                )
+                section_ids = id_map(Section, "jw_id", sections.keys())
+
+                # Step 7: Many-to-many links, diffed against the current links of every imported section
+                teacher_links = {}
+                admin_class_links = {}
+                for record in records:
+                    section_id = section_ids[record["section"]["jw_id"]]
+                    teacher_links[section_id] = {
+                        ids["teachers"][(name_cn, name_en, department_ids[code] if code else None)]
+                        for name_cn, name_en, code in record["teachers"]
+                    }
+                    admin_class_links[section_id] = {ids["admin_classes"][name_cn] for name_cn, _ in record["admin_classes"]}
+
+                link_stats = self.write_links(teacher_links, admin_class_links)
+                if sections:
+                    bump_data_version(semester.pk)
+
+        created_count = len(sections.keys() - existing_section_ids.keys())
+        updated_count = len(sections) - created_count
+        self.logger.info(
+            f"Total sections processed for {semester.name}: {len(data)} "
+            f"(Created: {created_count}, Updated: {updated_count}, Errors: {error_count})"
+        )
+        stats = Counter(created=created_count, updated=updated_count, errors=error_count)
+        stats.update(link_stats)
+        return stats
+
+    def resolve_teacher_ids(self, teacher_keys, create=True):
+        """Map (name_cn, name_en, department_id) keys to teacher IDs, creating the missing teachers unless `create` is off"""
+        def existing():
+            result = {}
+            names = {name_cn for name_cn, _, _ in teacher_keys}
+            for chunk in chunked(names):
+                rows = Teacher.objects.filter(name_cn__in=chunk).order_by('id').values_list(
+                    'id', 'name_cn', 'name_en', 'department_id'
+                )
+                for pk, *key in rows:
+                    result.setdefault(tuple(key), pk)
+            return result
+
+        teacher_ids = existing()
+        missing = teacher_keys - teacher_ids.keys()
+        if missing and create:
+            Teacher.objects.bulk_create(
+                [Teacher(name_cn=name_cn, name_en=name_en, department_id=dept_id) for name_cn, name_en, dept_id in missing],
+                batch_size=BATCH_SIZE,
+            )
+            self.telemetry.count_rows(Teacher, inserted=len(missing))
+            teacher_ids = existing()
+        return teacher_ids
+
+    def write_links(self, teacher_links, admin_class_links):
+        """Write the teacher and admin class links of sections with `replace_links`, returning a Counter of link stats"""
+        stats = Counter()
+        for through, target_field, links in [
+            (Section.teachers.through, "teacher_id", teacher_links),
+            (Section.admin_classes.through, "adminclass_id", admin_class_links),
+        ]:
+            deleted, inserted = self.replace_links(through, target_field, links)
+            stats.update(links_deleted=deleted, links_inserted=inserted)
+        self.logger.debug(f"Links deleted: {stats['links_deleted']}, inserted: {stats['links_inserted']}")
+        return stats
+
+    def replace_links(self, through, target_field, links):
+        """
+        Make the M2M links of the given sections match ``{section_id: {target_id, ...}}``
+
+        The wanted (section_id, target_id) pairs are diffed against the stored ones, so only vanished
+        pairs are deleted and only new pairs inserted. Returns the number of deleted and inserted links.
+        """
+        wanted = {(section_id, target_id) for section_id, targets in links.items() for target_id in targets}
+        stored = {}
+        for chunk in chunked(links.keys()):
+            rows = through.objects.filter(section_id__in=chunk).values_list("id", "section_id", target_field)
+            for pk, section_id, target_id in rows:
+                stored[(section_id, target_id)] = pk
+
+        vanished = [pk for pair, pk in stored.items() if pair not in wanted]
+        for chunk in chunked(vanished):
+            through.objects.filter(pk__in=chunk).delete()
+
+        new = sorted(wanted - stored.keys())
+        self.telemetry.count_rows(through, deleted=len(vanished))
+        self.upsert(
+            through,
+            [through(section_id=section_id, **{target_field: target_id}) for section_id, target_id in new],
+            unique_fields=["section", target_field],
+        )
+        return len(vanished), len(new)
+
+    def upsert(self, model, objs, unique_fields, update_fields=None):
+        """Insert or update rows in bulk with `bulk_upsert`, load_snapshot writes them through COPY instead"""
+        self.telemetry.count_rows(model, upserted=len(objs))
+        bulk_upsert(model, objs, unique_fields, update_fields)
+
+
+@bumps_explicitly()
+def import_semester_process(semester_id, data, log_level):
+    """Import the changed lessons of one semester in a worker process of `Command.import_semesters_parallel`"""
+    command = Command()
+    command.logger.setLevel(log_level)
+    started = time.monotonic()
+    with command.telemetry.capture_queries():
+        stats = command.import_sections_bulk(data, Semester.objects.get(pk=semester_id), shared_resolved=True)
+    return stats, time.monotonic() - started, command.telemetry.report()
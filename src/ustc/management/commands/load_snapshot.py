@@ -0,0 +1,196 @@
+import logging
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ustc.models import Section, Schedule, ScheduleGroup, Semester
+from ustc.archive_utils import ResponseArchive
+from ustc.copy_utils import copy_insert, copy_supported, copy_update, copy_upsert
+from ustc.import_utils import chunked, id_map, log_run_summary
+from ustc.management.commands import fetch_schedule, fetch_timetable
+from ustc.snapshot_utils import write_outdated_snapshots
+from ustc.version_utils import bumps_explicitly
+
+# Lessons written per transaction, COPY pays off with large batches
+LOAD_CHUNK_SIZE = 5000
+
+
+class TimetableLoader(fetch_timetable.Command):
+    """fetch_timetable's bulk import, writing through COPY"""
+
+    def upsert(self, model, objs, unique_fields, update_fields=None):
+        self.telemetry.count_rows(model, upserted=len(objs))
+        copy_upsert(model, objs, unique_fields, update_fields)
+
+
+class ScheduleLoader(fetch_schedule.Command):
+    """fetch_schedule's batch commit, writing schedule groups and schedules through COPY"""
+
+    def commit_batch(self, batch):
+        lesson_ids = [lesson.get("id") for lesson in batch["lessons"]]
+        stored = id_map(Section, "jw_id", lesson_ids, target="schedule_fingerprint")
+        # Only the groups of the sections commit_batch won't skip as unchanged
+        section_ids = {
+            jw_id: pk for jw_id, pk in id_map(Section, "jw_id", lesson_ids).items()
+            if self.force or stored[jw_id] != batch["fingerprints"][jw_id]
+        }
+        groups = [
+            ScheduleGroup(
+                jw_id=group.get("id"),
+                section_id=section_ids[group.get("lessonId")],
+                no=group.get("no"),
+                limit_count=group.get("limitCount"),
+                std_count=group.get("stdCount"),
+                actual_periods=group.get("actualPeriods"),
+                default=group.get("default", False),
+            )
+            for group in batch["schedule_groups"] if group.get("lessonId") in section_ids
+        ]
+
+        with transaction.atomic():
+            # Written up front so that resolving the groups in commit_batch finds them unchanged
+            self.telemetry.count_rows(ScheduleGroup, upserted=len(groups))
+            copy_upsert(
+                ScheduleGroup, groups, unique_fields=["jw_id"],
+                update_fields=["section", "no", "limit_count", "std_count", "actual_periods", "default"],
+            )
+            for group in groups:
+                self.schedule_groups.evict(group.jw_id)
+            return super().commit_batch(batch)
+
+    def write_schedules(self, to_create, to_update, to_delete):
+        for chunk in chunked(to_delete):
+            Schedule.objects.filter(id__in=chunk).delete()
+        copy_update(Schedule, to_update, fetch_schedule.SCHEDULE_UPDATE_FIELDS)
+        copy_insert(Schedule, to_create)
+
+
+class Command(BaseCommand):
+    help = "Loads an archive written by fetch_timetable/fetch_schedule --record, using COPY on PostgreSQL"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.logger = logging.getLogger('ustc.load_snapshot')
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Configure logging for the command"""
+        if self.logger.handlers:
+            self.logger.handlers.clear()
+
+        handler = logging.StreamHandler(self.stdout)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handler.setFormatter(formatter)
+        handler.setLevel(logging.DEBUG)
+
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False  # Prevent duplicate logs
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', metavar='DIR', help='Archive directory written by --record')
+        parser.add_argument('--semester', type=int, action='append', metavar='JW_ID',
+                            help='Only load this semester, may be repeated (default: every archived semester)')
+        parser.add_argument('--chunk-size', type=int, default=LOAD_CHUNK_SIZE,
+                            help=f'Lessons written per transaction (default: {LOAD_CHUNK_SIZE})')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Rewrite every section, even those whose upstream payload is unchanged')
+        parser.add_argument('--skip-schedules', action='store_true', default=False,
+                            help='Only load semesters and sections')
+        parser.add_argument('--quiet', action='store_true', default=False, help='Suppress detailed output')
+        parser.add_argument('--log-level', default='INFO',
+                            choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                            help='Set the logging level explicitly')
+
+    @bumps_explicitly()
+    def handle(self, *args, **options):
+        level = logging.WARNING if options['quiet'] else getattr(logging, options['log_level'])
+        self.logger.setLevel(level)
+        started = time.monotonic()
+
+        archive = ResponseArchive(options['archive'])
+        if not copy_supported():
+            self.logger.warning("COPY needs PostgreSQL, falling back to batched inserts")
+
+        chunk_size = max(1, options['chunk_size'])
+        timetable = TimetableLoader(stdout=self.stdout, stderr=self.stderr)
+        timetable.logger.setLevel(level)
+        timetable.replay_archive = archive
+        timetable.stream = True
+        timetable.chunk_size = chunk_size
+
+        semesters = timetable.fetch_and_update_semesters() or list(Semester.objects.all())
+        if options['semester']:
+            semesters = [semester for semester in semesters if semester.jw_id in options['semester']]
+        self.logger.info(f"Loading {len(semesters)} semesters from {archive.path}")
+
+        results = []
+        for semester in semesters:
+            if f"timetable/lessons/{semester.jw_id}" not in archive.entries:
+                self.logger.debug(f"No lesson list archived for {semester.name}, skipping")
+                continue
+            semester_started = time.monotonic()
+            stats = Counter()
+            for data in timetable.fetch_lesson_chunks(semester):
+                data, sync = timetable.filter_changed_sections(data, options['force'])
+                stats["unchanged"] += sync["unchanged"]
+                if data:
+                    stats.update(timetable.import_sections_bulk(data, semester))
+            results.append((semester, stats, time.monotonic() - semester_started))
+        log_run_summary(self.logger, results)
+
+        if not options['skip_schedules']:
+            schedule = ScheduleLoader(stdout=self.stdout, stderr=self.stderr)
+            schedule.logger.setLevel(level)
+            schedule.force = options['force']
+            section_ids = set(Section.objects.filter(semester__in=semesters).values_list("jw_id", flat=True))
+            stats = self.load_schedules(schedule, archive, section_ids, chunk_size)
+            schedule.log_identity_map_stats()
+            self.logger.info(
+                "Schedule summary: " + (", ".join(f"{name}: {count}" for name, count in sorted(stats.items())) or "nothing to do")
+            )
+
+        write_outdated_snapshots(semesters, self.logger)
+        self.logger.info(f"Loaded snapshot in {time.monotonic() - started:.1f}s")
+
+    def load_schedules(self, loader, archive, section_ids, chunk_size):
+        """
+        Commit the archived schedule data of the sections `section_ids` in batches of about `chunk_size` lessons
+
+        Archived responses are merged into larger batches than they were fetched in. A lesson recorded
+        more than once is only loaded from its most recent response.
+        """
+        keys = sorted(archive.keys('schedule/datum/'), key=lambda key: archive.entries[key].get('recorded_at', ''))
+        latest = {
+            lesson_id: key
+            for key in keys
+            for lesson_id in archive.entries[key].get('lesson_ids', [])
+        }
+
+        stats = Counter()
+        loaded = set()
+        pending = {"lessonList": [], "scheduleGroupList": [], "scheduleList": []}
+
+        def flush():
+            nonlocal pending
+            if pending["lessonList"]:
+                stats.update(loader.commit_batch(loader.normalize_batch({"result": pending})))
+            pending = {"lessonList": [], "scheduleGroupList": [], "scheduleList": []}
+
+        for key in keys:
+            result = archive.load_json(key).get("result", {})
+            wanted = {
+                lesson.get("id") for lesson in result.get("lessonList", [])
+                if lesson.get("id") in section_ids and lesson.get("id") not in loaded
+                and latest.get(lesson.get("id"), key) == key
+            }
+            loaded |= wanted
+
+            pending["lessonList"] += [lesson for lesson in result.get("lessonList", []) if lesson.get("id") in wanted]
+            for name in ("scheduleGroupList", "scheduleList"):
+                pending[name] += [item for item in result.get(name, []) if item.get("lessonId") in wanted]
+            if len(pending["lessonList"]) >= chunk_size:
+                flush()
+        flush()
+
+        return stats
@@ -0,0 +1,42 @@
+import logging
+from django.core.management.base import BaseCommand
+from ustc.models import Semester
+from ustc.snapshot_utils import write_outdated_snapshots
+
+
+class Command(BaseCommand):
+    help = "Writes the downloadable snapshots of the semesters that changed since theirs were written"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.logger = logging.getLogger('ustc.write_snapshots')
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Configure logging for the command"""
+        if self.logger.handlers:
+            self.logger.handlers.clear()
+
+        handler = logging.StreamHandler(self.stdout)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handler.setFormatter(formatter)
+        handler.setLevel(logging.DEBUG)
+
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False  # Prevent duplicate logs
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semester', type=int, action='append', metavar='JW_ID',
+                            help='Only write this semester, may be repeated (default: every semester)')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Rewrite every snapshot, even those of unchanged semesters')
+        parser.add_argument('--quiet', action='store_true', default=False, help='Suppress detailed output')
+
+    def handle(self, *args, **options):
+        if options['quiet']:
+            self.logger.setLevel(logging.WARNING)
+        semesters = Semester.objects.order_by('id')
+        if options['semester']:
+            semesters = semesters.filter(jw_id__in=options['semester'])
+        write_outdated_snapshots(semesters, self.logger, force=options['force'])
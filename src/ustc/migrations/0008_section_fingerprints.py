@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ustc', '0007_add_jw_id_to_campus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='section',
+            name='lesson_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='schedule_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ustc', '0008_section_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=32, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('modified', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Data Versions',
+            },
+        ),
+    ]
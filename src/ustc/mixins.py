@@ -0,0 +1,122 @@
+"""
+Mixins of the API's viewsets: sparse fieldsets, eager loading of the rendered relations and `values()` reads
+"""
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .renderers import stream_json_array, streams_json
+from .representation_utils import ValuesRepresentation, restrict_fields
+from .serializers import model_columns, related_lookups
+
+
+@lru_cache(maxsize=256)
+def serializer_lookups(serializer_class, fields=None, expand=None):
+    """
+    `related_lookups` and `model_columns` of a serializer class restricted to a fieldset
+
+    They only depend on its declaration and the fieldset, see `restrict_fields`.
+    """
+    serializer = restrict_fields(serializer_class(), fields, expand)
+    return (*related_lookups(serializer), model_columns(serializer))
+
+
+def field_names(value):
+    """The sorted names of a comma-separated `?fields=`/`?expand=` parameter, or None if it isn't given"""
+    if value is None:
+        return None
+    return tuple(sorted({name.strip() for name in value.split(',') if name.strip()}))
+
+
+class SparseFieldsMixin:
+    """
+    Render only the fields listed in `?fields=`, nesting only the relations listed in `?expand=`
+
+    Both are comma-separated field names and only apply to reads. Relations that aren't expanded are rendered as
+    their primary keys, so `?expand=` without names renders none nested.
+    """
+
+    def get_fieldset(self):
+        """The `(fields, expand)` the request asks for, see `restrict_fields`"""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, None
+        fields = field_names(request.query_params.get('fields'))
+        return fields or None, field_names(request.query_params.get('expand'))
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields, expand = self.get_fieldset()
+        if fields is not None or expand is not None:
+            restrict_fields(getattr(serializer, 'child', serializer), fields, expand)
+        return serializer
+
+
+class EagerLoadingMixin(SparseFieldsMixin):
+    """
+    Join or prefetch every relation the serializer renders, instead of querying them row by row
+
+    Reads of a restricted fieldset only load the columns it renders.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Other actions, e.g. the nested lists of a detail route, may render another serializer's fieldset
+        fields, expand = self.get_fieldset() if self.action in ('list', 'retrieve') else (None, None)
+        select, prefetch, columns = serializer_lookups(self.get_serializer_class(), fields, expand)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if (fields is not None or expand is not None) and columns is not None:
+            queryset = queryset.only(*columns)
+        return queryset
+
+
+class ValuesReadMixin(SparseFieldsMixin):
+    """
+    List and retrieve from `values()` rows instead of model instances, if the serializer can be rendered that way
+
+    The output is the same as the serializer's, see `ValuesRepresentation`. Retrieving skips the object
+    permission checks, which the API's permission classes don't implement.
+    """
+
+    def list(self, request, *args, **kwargs):
+        representation = ValuesRepresentation.of(self.get_serializer_class(), *self.get_fieldset())
+        if representation is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = representation.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(representation.render(page, self.get_serializer_context()))
+        return self.array_response(representation.iter_render(rows.iterator(), self.get_serializer_context()))
+
+    def retrieve(self, request, *args, **kwargs):
+        representation = ValuesRepresentation.of(self.get_serializer_class(), *self.get_fieldset())
+        if representation is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        # The same lookup and errors as get_object()
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            rows = list(representation.values(queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})))
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not rows:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        return Response(representation.render(rows[:1], self.get_serializer_context())[0])
+
+    def array_response(self, items):
+        """
+        Response of an unpaginated list of rendered `items`
+
+        Streamed one item at a time if it's rendered as plain JSON, so that the body is never held in memory whole.
+        """
+        if streams_json(self.request):
+            return StreamingHttpResponse(stream_json_array(items), content_type=self.request.accepted_media_type)
+        return Response(list(items))
@@ -194,6 +194,10 @@ class Section(models.Model):
     date_time_place_text = models.TextField(blank=True, null=True)
     date_time_place_person_text = models.JSONField(blank=True, null=True)
 
+    # Content hashes of the upstream payloads, importers skip sections whose payload is unchanged
+    lesson_fingerprint = models.CharField(max_length=64, blank=True, null=True)
+    schedule_fingerprint = models.CharField(max_length=64, blank=True, null=True)
+
     teachers = models.ManyToManyField(Teacher, related_name="sections")
     admin_classes = models.ManyToManyField(AdminClass, related_name="sections")
 
@@ -274,6 +278,22 @@ class Schedule(models.Model):
     def __str__(self):
         return f"Schedule for Section {self.section.code} on {self.date}"
 
+    def reconcile_key(self):
+        """
+        Identity of this schedule across imports
+
+        fetch_schedule reconciles rows on this key instead of recreating them, so primary keys
+        (and the iCal UIDs derived from them) stay stable.
+        """
+        return (
+            self.schedule_group_id,
+            self.date,
+            self.start_time,
+            self.room_id,
+            None if self.room_id else self.custom_place,
+            self.teacher_id,
+        )
+
     def to_ical(self):
         """
         Convert this schedule to an iCalendar format
@@ -295,3 +315,21 @@ class Schedule(models.Model):
 
     class Meta:
         verbose_name_plural = "Schedules"
+
+
+class DataVersion(models.Model):
+    """
+    数据版本
+
+    Stamp the importers bump whenever they commit changes: one per semester (scope ``semester:<id>``) and one for
+    all data (scope ``global``). See `version_utils`.
+    """
+    scope = models.CharField(max_length=32, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+    class Meta:
+        verbose_name_plural = "Data Versions"
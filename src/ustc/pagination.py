@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .representation_utils import Rows
+
+
+class PageNumberOrCursorPagination(PageNumberPagination):
+    """
+    Page number pagination, or keyset pagination for requests passing `?cursor=`
+
+    Pages of a cursor continue after the last row of the previous one instead of counting and skipping all rows
+    before them, so they take the same time however deep into a collection they are. A cursor walks the rows in
+    one of the stable orderings of `cursor_orderings`, chosen by `?ordering=` (default: id). An empty `?cursor=`
+    starts at the beginning, every page links the `next` one until the last.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def cursor_orderings(self, model):
+        """The orderings a cursor may walk rows of `model` in, by name, as lists of unique-together key columns"""
+        fields = {field.name: field for field in model._meta.concrete_fields}
+        orderings = {'id': ['id']}
+        if 'jw_id' in fields:
+            orderings['jw_id'] = ['jw_id', 'id']
+        if 'semester' in fields and 'code' in fields:
+            orderings['semester'] = ['semester_id', 'code', 'id']
+        return orderings
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        orderings = self.cursor_orderings(queryset.model)
+        name = request.query_params.get(self.ordering_query_param, 'id')
+        if name not in orderings:
+            raise ValidationError({self.ordering_query_param: f"Cursors walk rows by one of: {', '.join(orderings)}"})
+        keys = orderings[name]
+        position = self.decode_cursor(request.query_params[self.cursor_query_param], queryset.model, keys)
+
+        # NULLs sort last on every database, and are skipped past like any other value
+        queryset = queryset.order_by(*(F(key).asc(nulls_last=True) for key in keys))
+        if position is not None:
+            queryset = queryset.filter(self.after(keys, position))
+        if isinstance(queryset, Rows):
+            queryset = queryset.columns(*keys)
+
+        rows = list(queryset[:page_size + 1])
+        self.cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            self.cursor = [last[key] if isinstance(last, dict) else getattr(last, key) for key in keys]
+        return rows
+
+    @staticmethod
+    def after(keys, position):
+        """Condition of the rows after `position` in the (ascending, NULLs last) order of `keys`"""
+        conditions = []
+        equal = Q()
+        for key, value in zip(keys, position):
+            if value is not None:
+                conditions.append(equal & (Q(**{f'{key}__gt': value}) | Q(**{f'{key}__isnull': True})))
+                equal &= Q(**{key: value})
+            else:
+                equal &= Q(**{f'{key}__isnull': True})
+        # The last key is the never NULL id, so there's always a condition
+        return reduce(operator.or_, conditions)
+
+    def decode_cursor(self, cursor, model, keys):
+        """The position of `cursor` as values of the columns `keys` of `model`, None to start at the beginning"""
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (UnicodeEncodeError, binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(keys):
+            raise NotFound(self.invalid_cursor_message)
+        if not all(value is None or isinstance(value, (int, str)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            # Of the column's type, so that filtering on it can't fail
+            return [
+                None if value is None else model._meta.get_field(key).to_python(value)
+                for key, value in zip(keys, position)
+            ]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position, ensure_ascii=False).encode()).decode('ascii')
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.cursor))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,181 @@
+"""
+Bounded producer/consumer pipelines, so importers overlap fetching and parsing with database writes
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger('ustc.pipeline_utils')
+
+_DONE = object()
+
+
+class _SourceFailure:
+    def __init__(self, error):
+        self.error = error
+
+
+class StageStats:
+    """Items handled by one stage, the time spent on them and how full its output queue was"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.busy += seconds
+
+    def sample(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self.depth_total += depth
+        self.depth_samples += 1
+
+    def describe(self, wall):
+        rate = self.count / wall if wall else 0
+        text = f"{self.name}: {self.count} items, {self.busy:.1f}s busy, {rate:.1f} items/s"
+        if self.depth_samples:
+            text += f", output queue depth avg {self.depth_total / self.depth_samples:.1f} max {self.max_depth}"
+        return text
+
+
+class Pipeline:
+    """
+    Run items through a chain of stages on background threads, into a single consumer on the caller's thread
+
+    `stages` is a list of `(name, func, workers)`: each stage calls `func(value)` on up to `workers` threads.
+    Items are read from the source on a thread of their own, keep their order, and every queue between
+    stages holds at most `capacity` items, so a slow consumer holds back the source instead of letting
+    work pile up in memory. The caller's thread is meant to be the only one touching the database.
+    """
+
+    def __init__(self, name, stages, capacity=2, log=None):
+        self.name = name
+        self.stages = stages
+        self.capacity = max(1, capacity)
+        self.log = log or logger
+        self.stats = [StageStats('source'), *(StageStats(stage_name) for stage_name, _, _ in stages), StageStats('write')]
+
+    def run(self, source):
+        """
+        Yield `(item, result, error)` for every item of `source`, in order
+
+        `result` is the output of the last stage, or `error` the exception of the first stage that failed
+        for this item. An exception raised by the source itself is re-raised here, after its earlier items.
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(self.capacity) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._read, args=(source, queues[0], stop), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._work, args=(stage, self.stats[i + 1], queues[i], queues[i + 1], stop), daemon=True
+            ))
+
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+
+        writer = self.stats[-1]
+        try:
+            while True:
+                entry = self._get(queues[-1], stop)
+                if entry is _DONE:
+                    break
+                if isinstance(entry, _SourceFailure):
+                    raise entry.error
+                write_started = time.monotonic()
+                yield entry
+                writer.record(time.monotonic() - write_started)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            wall = time.monotonic() - started
+            self.log.info(f"Pipeline {self.name} finished in {wall:.1f}s")
+            for stats in self.stats:
+                self.log.info(f"  {stats.describe(wall)}")
+
+    def _put(self, outbox, entry, stats, stop):
+        while not stop.is_set():
+            try:
+                outbox.put(entry, timeout=0.1)
+            except queue.Full:
+                continue
+            stats.sample(outbox.qsize())
+            return True
+        return False
+
+    def _get(self, inbox, stop):
+        while not stop.is_set():
+            try:
+                return inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _read(self, source, outbox, stop):
+        stats = self.stats[0]
+        iterator = iter(source)
+        while True:
+            read_started = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            except Exception as e:
+                self._put(outbox, _SourceFailure(e), stats, stop)
+                return
+            stats.record(time.monotonic() - read_started)
+            if not self._put(outbox, (item, item, None), stats, stop):
+                return
+        self._put(outbox, _DONE, stats, stop)
+
+    def _work(self, stage, stats, inbox, outbox, stop):
+        _, func, workers = stage
+
+        def timed(value):
+            work_started = time.monotonic()
+            try:
+                return func(value)
+            finally:
+                stats.record(time.monotonic() - work_started)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            window = deque()
+
+            def flush(limit):
+                # Hand on finished items in order until at most `limit` are left in flight
+                while len(window) > limit:
+                    item, future = window.popleft()
+                    error = future.exception()
+                    if not self._put(outbox, (item, None if error else future.result(), error), stats, stop):
+                        return False
+                return True
+
+            while True:
+                entry = self._get(inbox, stop)
+                if entry is _DONE or isinstance(entry, _SourceFailure):
+                    if flush(0):
+                        self._put(outbox, entry, stats, stop)
+                    return
+
+                item, value, error = entry
+                if error:
+                    # Failed in an earlier stage, pass it on in order
+                    future = Future()
+                    future.set_exception(error)
+                else:
+                    future = executor.submit(timed, value)
+                window.append((item, future))
+                if not flush(max(1, workers) - 1):
+                    executor.shutdown(cancel_futures=True)
+                    return
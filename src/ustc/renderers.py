@@ -0,0 +1,76 @@
+"""
+Renderers of the API: JSON encoded with orjson, and JSON arrays streamed element by element
+"""
+import json
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Datetimes are left to DRF's encoder, which writes UTC as "Z"
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+# Bytes of a streamed array sent at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """
+    Encode `data` into the same compact, unescaped UTF-8 JSON as `JSONRenderer`, but with orjson
+
+    Values orjson doesn't know (dates and datetimes, Decimals, lazy strings, ...) are converted by DRF's encoder,
+    documents orjson can't encode at all (integers beyond 64 bits) by `json`.
+    """
+    try:
+        content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        content = json.dumps(
+            data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+        ).encode()
+    # Like JSONRenderer, keep the output a strict JavaScript subset
+    return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` encoding with orjson, several times faster on large responses
+
+    Indented output (e.g. for the browsable API) is still rendered by `JSONRenderer`.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def streams_json(request):
+    """Whether the response to a DRF `request` is rendered as compact JSON, which `stream_json_array` writes"""
+    renderer = request.accepted_renderer
+    return (
+        isinstance(renderer, JSONRenderer) and not renderer.ensure_ascii and renderer.compact
+        and renderer.get_indent(request.accepted_media_type, {}) is None
+    )
+
+
+def stream_json_array(items):
+    """
+    Yield the JSON array of `items` in chunks of about `STREAM_CHUNK_SIZE` bytes, encoding one item at a time
+
+    The chunks add up to what `ORJSONRenderer` renders for the list of items.
+    """
+    chunk = bytearray(b'[')
+    for i, item in enumerate(items):
+        if i:
+            chunk += b','
+        chunk += dumps(item)
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk = bytearray()
+    chunk += b']'
+    yield bytes(chunk)
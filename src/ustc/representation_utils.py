@@ -0,0 +1,265 @@
+"""
+Read fast path of the API: serializer representations rendered from values() rows instead of model instances
+"""
+from collections import defaultdict
+from functools import cache, lru_cache
+
+from django.utils.functional import cached_property
+
+from rest_framework import serializers
+
+COLUMN, NESTED, MANY, URL = 'column', 'nested', 'many', 'url'
+
+
+def identity(value):
+    return value
+
+
+class Nested:
+    """Stand-in of a method field rendering the related object at `path` with `serializer_class`, or None"""
+
+    def __init__(self, path, serializer_class):
+        self.path = path
+        self.serializer_class = serializer_class
+
+
+class AbsoluteURL:
+    """Stand-in of a method field returning `request.build_absolute_uri(template.format(id=obj.id))`"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def build(self, request, id):
+        return request.build_absolute_uri(self.template.format(id=id))
+
+
+def restrict_fields(serializer, fields=None, expand=None):
+    """
+    Narrow `serializer` down to `fields` (all if None), nesting only the relations in `expand` (all if None)
+
+    Relations are the nested serializers and the `Nested` stand-ins, those not expanded are rendered as primary keys.
+    Unknown names are a validation error. Returns the serializer, whose fields have been changed in place.
+    """
+    stand_ins = getattr(serializer, 'values_fields', {})
+    relations = {
+        name for name, field in serializer.fields.items()
+        if isinstance(field, serializers.BaseSerializer) or isinstance(stand_ins.get(name), Nested)
+    }
+    errors = {}
+    if fields is not None and set(fields) - set(serializer.fields):
+        errors['fields'] = f"Unknown fields: {', '.join(sorted(set(fields) - set(serializer.fields)))}"
+    if expand is not None and set(expand) - relations:
+        errors['expand'] = f"Not expandable: {', '.join(sorted(set(expand) - relations))}"
+    if errors:
+        raise serializers.ValidationError(errors)
+
+    for name, field in list(serializer.fields.items()):
+        if fields is not None and name not in fields:
+            del serializer.fields[name]
+        elif expand is not None and name in relations and name not in expand:
+            if isinstance(field, serializers.SerializerMethodField):
+                source = stand_ins[name].path.replace('__', '.')
+            else:
+                source = field.source
+            kwargs = {'source': source} if source != name else {}
+            many = isinstance(field, serializers.ListSerializer)
+            serializer.fields[name] = serializers.PrimaryKeyRelatedField(many=many, read_only=True, **kwargs)
+    return serializer
+
+
+class Rows:
+    """
+    `values()` rows of a queryset for a paginator, counted without the joins of their columns
+
+    Joins to related models can't change the number of rows, but the database still runs them for COUNT(*).
+    Like a queryset, rows can be narrowed down with `filter()` and `order_by()`, and `columns()` adds columns
+    that aren't rendered, e.g. a cursor's keys.
+    """
+
+    def __init__(self, queryset, representation, columns=()):
+        self.queryset = queryset
+        self.representation = representation
+        self.extra_columns = columns
+        self.model = queryset.model
+        self.ordered = queryset.ordered
+
+    @cached_property
+    def values(self):
+        return self.representation.values(self.queryset, *self.extra_columns)
+
+    def filter(self, *args, **kwargs):
+        return Rows(self.queryset.filter(*args, **kwargs), self.representation, self.extra_columns)
+
+    def order_by(self, *fields):
+        return Rows(self.queryset.order_by(*fields), self.representation, self.extra_columns)
+
+    def columns(self, *paths):
+        return Rows(self.queryset, self.representation, (*self.extra_columns, *paths))
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def iterator(self):
+        """The rows read from the database as they are iterated over, without keeping them"""
+        return self.values.iterator(chunk_size=2000)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+
+class ValuesRepresentation:
+    """
+    Renders what a model serializer would from `values()` rows of its model, without model instances
+
+    Compiled once per serializer class and fieldset (see `of`): model fields are read from their columns and
+    converted by the serializer's own fields, nested serializers of foreign keys from the joined columns of the
+    related model, and primary keys of foreign keys from the key column. Nested lists (or primary keys) of to-many
+    relations of the rendered model itself are loaded with one more query each into a lookup map by the rows' ids.
+    Nested objects are rendered once per `render()` call, however many rows share them. Method fields need a
+    stand-in in the serializer's `values_fields`; serializers with fields of any other kind can't be compiled.
+    """
+
+    def __init__(self, serializer, prefix=''):
+        self.model = serializer.Meta.model
+        self.entries = []
+        self.paths = []
+        stand_ins = getattr(serializer, 'values_fields', {})
+
+        for field in serializer._readable_fields:
+            name = field.field_name
+            stand_in = stand_ins.get(name) if isinstance(field, serializers.SerializerMethodField) else None
+            if isinstance(stand_in, Nested):
+                self.add_nested(name, prefix + stand_in.path, stand_in.serializer_class())
+            elif isinstance(stand_in, AbsoluteURL):
+                self.add_column(name, URL, prefix, 'id', stand_in)
+            elif type(field) is serializers.PrimaryKeyRelatedField and field.pk_field is None:
+                self.add_column(name, COLUMN, prefix, field.source.replace('.', '__'), identity)
+            elif '.' in field.source or field.source == '*':
+                raise TypeError(f"{type(serializer).__name__}.{name} has no column to read")
+            elif isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise TypeError(f"{type(serializer).__name__}.{name} is a to-many relation of a nested object")
+                self.add_many(name, field.source, field.child)
+            elif isinstance(field, serializers.BaseSerializer):
+                self.add_nested(name, prefix + field.source, field)
+            elif (isinstance(field, serializers.ManyRelatedField) and not prefix
+                  and type(field.child_relation) is serializers.PrimaryKeyRelatedField
+                  and field.child_relation.pk_field is None):
+                self.add_many(name, field.source, None)
+            elif isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField, serializers.SerializerMethodField)):
+                raise TypeError(f"{type(serializer).__name__}.{name} is a {type(field).__name__}")
+            else:
+                self.add_column(name, COLUMN, prefix, field.source, field.to_representation)
+
+    def add_column(self, name, kind, prefix, source, arg):
+        # A related object's id is the foreign key it's reached by, which doesn't need a join
+        path = prefix[:-2] if prefix and source == 'id' else prefix + source
+        self.entries.append((name, kind, path, arg))
+        self.paths.append(path)
+
+    def add_nested(self, name, path, serializer):
+        nested = ValuesRepresentation(serializer, path + '__')
+        # Nested objects are shared by the path and serializer they are rendered with
+        self.entries.append((name, NESTED, path, (nested, (path, type(serializer)))))
+        self.paths += [path, *nested.paths]
+
+    def add_many(self, name, source, serializer):
+        """Add a to-many relation, rendered with `serializer` or, if None, as primary keys"""
+        relation = self.model._meta.get_field(source)
+        if relation.auto_created:
+            query_name = relation.field.name
+        else:
+            query_name = relation.related_query_name()
+        child = ValuesRepresentation(serializer) if serializer is not None else None
+        key = (source, type(serializer))
+        self.entries.append((name, MANY, 'id', (child, relation.related_model, query_name, key)))
+        self.paths.append('id')
+
+    def lookup_many(self, entry, ids, request, nested):
+        """The rendered related objects (or primary keys) of `entry` by the ids of the rows they belong to"""
+        name, kind, path, (child, model, query_name, key) = entry
+        queryset = model._default_manager.filter(**{f'{query_name}__in': ids})
+        related = defaultdict(list)
+        if child is None:
+            for parent, pk in queryset.values_list(query_name, 'pk'):
+                related[parent].append(pk)
+            return related
+
+        rendered = nested.setdefault(key, {})
+        for row in child.values(queryset, query_name):
+            if row['id'] not in rendered:
+                rendered[row['id']] = child.render_row(row, request, nested)
+            related[row[query_name]].append(rendered[row['id']])
+        return related
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def of(serializer_class, fields=None, expand=None):
+        """
+        The representation of `serializer_class` restricted to a fieldset (see `restrict_fields`)
+
+        None if the serializer can't be rendered from values.
+        """
+        try:
+            return ValuesRepresentation(restrict_fields(serializer_class(), fields, expand))
+        except TypeError:
+            return None
+
+    def values(self, queryset, *paths):
+        """`queryset` reading the rows this representation renders, plus the columns `paths`"""
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*paths, *self.paths]))
+
+    def rows(self, queryset):
+        """`values(queryset)` to paginate, see `Rows`"""
+        return Rows(queryset, self)
+
+    @cache
+    def model_values(self, model):
+        """
+        `values()` of all `model` rows, to be narrowed down with `filter()`
+
+        Setting up the joins of the columns takes about as long as running the query, this is only done once.
+        """
+        return self.values(model._default_manager.all())
+
+    def render(self, rows, context):
+        """Render the `values()` rows, in order"""
+        return list(self.iter_render(rows, context))
+
+    def iter_render(self, rows, context):
+        """Render the `values()` rows one at a time, in order"""
+        request = context.get('request')
+        nested = {}
+        many = [entry for entry in self.entries if entry[1] is MANY]
+        if many:
+            rows = list(rows)
+            ids = [row['id'] for row in rows]
+            nested[MANY] = {entry[0]: self.lookup_many(entry, ids, request, nested) for entry in many}
+        for row in rows:
+            yield self.render_row(row, request, nested)
+
+    def render_row(self, row, request, nested):
+        ret = {}
+        for name, kind, path, arg in self.entries:
+            value = row[path]
+            if kind is MANY:
+                ret[name] = nested[MANY][name].get(value, [])
+            elif value is None:
+                ret[name] = None
+            elif kind is COLUMN:
+                ret[name] = arg(value)
+            elif kind is NESTED:
+                representation, key = arg
+                rendered = nested.setdefault(key, {})
+                if value not in rendered:
+                    rendered[value] = representation.render_row(row, request, nested)
+                ret[name] = rendered[value]
+            else:
+                ret[name] = None if request is None else arg.build(request, value)
+        return ret
@@ -1,3 +1,4 @@
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
 from .models import (
     Semester, CourseType, CourseGradation, CourseCategory, CourseClassify,
@@ -5,6 +6,7 @@ from .models import (
     Campus, Course, Teacher, AdminClass, Section, Schedule, ScheduleGroup,
     Room, Building
 )
+from .representation_utils import AbsoluteURL, Nested
 
 
 class SemesterSerializer(serializers.ModelSerializer):
@@ -93,11 +95,16 @@ class CourseSerializer(serializers.ModelSerializer):
 
 
 class SectionSerializer(serializers.ModelSerializer):
+    # Stand-ins of the method fields for the values() read path, see representation_utils
+    values_fields = {
+        'ical_url': AbsoluteURL('/api/v1/sections/{id}/ical/'),
+    }
+
     ical_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Section
-        fields = '__all__'
+        exclude = ['lesson_fingerprint', 'schedule_fingerprint']
         depth = 1  # Include related objects one level deep
 
     def get_ical_url(self, obj):
@@ -145,6 +152,16 @@ class CourseNestedSerializer(serializers.ModelSerializer):
 
 
 class ScheduleSerializer(serializers.ModelSerializer):
+    # Read by get_course, see related_lookups
+    select_related = ['section__course']
+
+    # Stand-ins of the method fields for the values() read path, see representation_utils
+    values_fields = {
+        'group': Nested('schedule_group', ScheduleGroupSerializer),
+        'course': Nested('section__course', CourseNestedSerializer),
+        'ical_url': AbsoluteURL('/api/v1/schedules/{id}/ical/'),
+    }
+
     room = RoomSerializer(read_only=True)
     teacher = TeacherNestedSerializer(read_only=True)
     schedule_group = ScheduleGroupSerializer(read_only=True)
@@ -179,3 +196,61 @@ class ScheduleSerializer(serializers.ModelSerializer):
         if request is None:
             return None
         return request.build_absolute_uri(f'/api/v1/schedules/{obj.id}/ical/')
+
+
+def related_lookups(serializer, prefix=''):
+    """
+    Return the `(select_related, prefetch_related)` lookups needed to render `serializer` without N+1 queries
+
+    Nested serializers of foreign keys (including those `depth` generates) are joined with select_related,
+    nested lists and primary key lists of many-to-many fields are prefetched. Relations only read by method
+    fields have to be listed in the serializer's `select_related` attribute.
+    """
+    select = [prefix + path for path in getattr(serializer, 'select_related', [])]
+    prefetch = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.ListSerializer):
+            prefetch.append(path)
+            nested_select, nested_prefetch = related_lookups(field.child, path + '__')
+            prefetch += nested_select + nested_prefetch
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            nested_select, nested_prefetch = related_lookups(field, path + '__')
+            select += nested_select
+            prefetch += nested_prefetch
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch.append(path)
+    return select, prefetch
+
+
+def model_columns(serializer):
+    """
+    Return the model fields `serializer` reads from its instances, for `only()`, or None if they aren't known
+
+    To-many relations are left to their prefetches, and method fields read what their stand-in in
+    `values_fields` does.
+    """
+    model = serializer.Meta.model
+    stand_ins = getattr(serializer, 'values_fields', {})
+    columns = {model._meta.pk.name}
+    columns.update(path.split('__')[0] for path in getattr(serializer, 'select_related', []))
+    for field in serializer._readable_fields:
+        if isinstance(field, serializers.SerializerMethodField):
+            stand_in = stand_ins.get(field.field_name)
+            if isinstance(stand_in, Nested):
+                columns.add(stand_in.path.split('__')[0])
+            elif not isinstance(stand_in, AbsoluteURL):
+                return None
+            continue
+        if field.source == '*':
+            return None
+        try:
+            model_field = model._meta.get_field(field.source.split('.')[0])
+        except FieldDoesNotExist:
+            return None
+        if model_field.concrete and not model_field.many_to_many:
+            columns.add(model_field.name)
+    return sorted(columns)
@@ -0,0 +1,232 @@
+"""
+Per-semester snapshots: every entity of a semester in one gzipped NDJSON file, to download instead of paging the API
+
+A snapshot is written after each import that changed its semester, next to a manifest holding its checksums,
+entity counts and the data versions it was generated at. Data files are named after their checksum and only
+removed once the manifest points at a newer one, so a download in progress is never cut short. Rows shared with
+other semesters (courses, teachers) are as they were when the semester itself last changed.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .import_utils import BATCH_SIZE
+from .models import Course, DataVersion, Schedule, Section, Semester, Teacher
+from .renderers import dumps
+from .representation_utils import ValuesRepresentation
+from .serializers import CourseSerializer, ScheduleSerializer, SectionSerializer, SemesterSerializer, TeacherSerializer
+from .version_utils import GLOBAL_SCOPE, semester_scope
+
+SNAPSHOT_FORMAT = 'ndjson+gzip'
+# Fields that need a request to be rendered
+EXCLUDED_FIELDS = {'ical_url'}
+COMPRESS_LEVEL = 6
+READ_SIZE = 64 * 1024
+
+_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def snapshot_dir():
+    return Path(settings.SNAPSHOT_DIR)
+
+
+def manifest_path(semester_id):
+    return snapshot_dir() / f'semester-{semester_id}.json'
+
+
+def read_manifest(semester_id):
+    """The manifest of the semester's snapshot, or None if it has none yet"""
+    try:
+        with open(manifest_path(semester_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def semester_versions(semester):
+    """The current `{'semester': ..., 'global': ...}` data versions of `semester`, 0 if never bumped"""
+    scopes = {semester_scope(semester.pk): 'semester', GLOBAL_SCOPE: 'global'}
+    versions = dict.fromkeys(scopes.values(), 0)
+    for scope, version in DataVersion.objects.filter(scope__in=scopes).values_list('scope', 'version'):
+        versions[scopes[scope]] = version
+    return versions
+
+
+def snapshot_outdated(semester):
+    """Whether the semester changed since its snapshot was written (or has none)"""
+    manifest = read_manifest(semester.pk)
+    return manifest is None or manifest['data_version']['semester'] != semester_versions(semester)['semester']
+
+
+def entity_querysets(semester):
+    """`(type, serializer class, queryset)` of the entities of a snapshot, in the order they're written"""
+    sections = Section.objects.filter(semester=semester)
+    return [
+        ('semester', SemesterSerializer, Semester.objects.filter(pk=semester.pk)),
+        ('course', CourseSerializer, Course.objects.filter(pk__in=sections.values('course_id'))),
+        ('teacher', TeacherSerializer, Teacher.objects.filter(
+            pk__in=Section.teachers.through.objects.filter(section__semester=semester).values('teacher_id'),
+        ) | Teacher.objects.filter(pk__in=Schedule.objects.filter(section__semester=semester).values('teacher_id'))),
+        ('section', SectionSerializer, sections),
+        ('schedule', ScheduleSerializer, Schedule.objects.filter(section__semester=semester)),
+    ]
+
+
+def iter_rendered(serializer_class, queryset):
+    """Render the rows of `queryset` as the list endpoints do, in id order, one batch at a time"""
+    fields = tuple(sorted(set(serializer_class().fields) - EXCLUDED_FIELDS))
+    representation = ValuesRepresentation.of(serializer_class, fields)
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(representation.values(batch.order_by('id'), 'id')[:BATCH_SIZE])
+        if not rows:
+            return
+        yield from representation.iter_render(rows, {})
+        last_id = rows[-1]['id']
+
+
+def write_snapshot(semester):
+    """
+    Write the snapshot of `semester` and its manifest, returning the manifest
+
+    Each line of the snapshot is one `{"type": ..., "data": ...}` entity rendered like the API's list endpoints,
+    ordered by type (semester, courses, teachers, sections, schedules) and then id. The same data always gives the
+    same bytes, and an unchanged snapshot is kept as it is.
+    """
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Read before the data, so that a concurrent import makes the snapshot look older rather than newer
+    versions = semester_versions(semester)
+
+    tmp_path = directory / f'semester-{semester.pk}.ndjson.gz.tmp'
+    content_hash = hashlib.sha256()
+    counts = {}
+    with open(tmp_path, 'wb') as f:
+        with gzip.GzipFile(filename='', mode='wb', compresslevel=COMPRESS_LEVEL, fileobj=f, mtime=0) as out:
+            for entity_type, serializer_class, queryset in entity_querysets(semester):
+                counts[entity_type] = 0
+                for data in iter_rendered(serializer_class, queryset):
+                    line = b'{"type":"%s","data":%s}\n' % (entity_type.encode(), dumps(data))
+                    out.write(line)
+                    content_hash.update(line)
+                    counts[entity_type] += 1
+
+    file_hash = hashlib.sha256()
+    with open(tmp_path, 'rb') as f:
+        while chunk := f.read(READ_SIZE):
+            file_hash.update(chunk)
+    name = f'semester-{semester.pk}-{file_hash.hexdigest()[:16]}.ndjson.gz'
+    os.replace(tmp_path, directory / name)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'semester': {'id': semester.pk, 'jw_id': semester.jw_id, 'code': semester.code, 'name': semester.name},
+        'data_version': versions,
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'file': name,
+        'size': (directory / name).stat().st_size,
+        'sha256': file_hash.hexdigest(),
+        'content_sha256': content_hash.hexdigest(),
+        'counts': counts,
+    }
+    path = manifest_path(semester.pk)
+    with open(path.with_suffix('.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path.with_suffix('.tmp'), path)
+
+    for old in directory.glob(f'semester-{semester.pk}-*.ndjson.gz'):
+        if old.name != name:
+            old.unlink(missing_ok=True)
+    return manifest
+
+
+def write_outdated_snapshots(semesters, logger, force=False):
+    """Write the snapshots of the `semesters` that changed since they were last written (all of them with `force`)"""
+    for semester in semesters:
+        if force or snapshot_outdated(semester):
+            manifest = write_snapshot(semester)
+            logger.info(
+                f"Wrote snapshot of {semester.name} ({semester.code}): {manifest['file']}, {manifest['counts']}"
+            )
+
+
+def parse_range(header, size):
+    """
+    The `(start, end)` bytes (inclusive) of a single-range `Range` header, None to send the whole file
+
+    Raises ValueError if the range can't be satisfied.
+    """
+    match = _range.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0 and (chunk := f.read(min(READ_SIZE, length))):
+            length -= len(chunk)
+            yield chunk
+
+
+def snapshot_response(request, semester_id):
+    """
+    The semester's snapshot as a download, or the bytes of a `Range` of it with 206 Partial Content
+
+    None if it has no snapshot. The ETag is the file's checksum, so `If-Range` resumes only the same file.
+    """
+    for _ in range(2):
+        if (manifest := read_manifest(semester_id)) is None:
+            return None
+        path = snapshot_dir() / manifest['file']
+        try:
+            stat = path.stat()
+            break
+        except FileNotFoundError:
+            # Replaced by a newer snapshot since the manifest was read
+            continue
+    else:
+        return None
+
+    etag = f'"{manifest["sha256"]}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        byte_range = None
+        if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+            try:
+                byte_range = parse_range(request.headers['Range'], stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), as_attachment=True, filename=manifest['file'])
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Disposition'] = f'attachment; filename="{manifest["file"]}"'
+        response['Content-Type'] = 'application/gzip'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,197 @@
+"""
+Run telemetry for the importers: stage timers, query counts, row counters and a JSON report
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.db import connections, transaction
+
+REPORT_VERSION = 1
+
+
+class Telemetry:
+    """
+    Collects where the time of an import run goes, safe to use from fetch threads
+
+    Stages are timed inclusively, so nested stages also count towards the enclosing ones, and so are
+    the queries run on the current thread while a stage is active (see `capture_queries`). Row counters
+    record the writes per model, plain counters anything else worth tracking, and host counters the
+    HTTP traffic of the run (see `http_utils.Transport`).
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.stages = defaultdict(Counter)
+        self.rows = defaultdict(Counter)
+        self.counters = Counter()
+        self.queries = Counter()
+        self.hosts = defaultdict(Counter)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def active_stages(self):
+        if not hasattr(self.local, 'stages'):
+            self.local.stages = []
+        return self.local.stages
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage `name`"""
+        active = self.active_stages()
+        active.append(name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - started
+            active.pop()
+            with self.lock:
+                self.stages[name]["calls"] += 1
+                self.stages[name]["seconds"] += seconds
+
+    def timed(self, name, iterable):
+        """Yield from `iterable`, timing the production of every item as stage `name`"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    @contextmanager
+    def atomic(self, using='default'):
+        """`transaction.atomic()` that times committing (or releasing its savepoint) as the "commit" stage"""
+        atomic = transaction.atomic(using=using)
+        atomic.__enter__()
+        try:
+            yield
+        except BaseException:
+            if not atomic.__exit__(*sys.exc_info()):
+                raise
+        else:
+            with self.stage("commit"):
+                atomic.__exit__(None, None, None)
+
+    @contextmanager
+    def capture_queries(self, using='default'):
+        """Count the queries of this thread's connection, in total and for every active stage"""
+        def execute(execute, sql, params, many, context):
+            started = time.monotonic()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                seconds = time.monotonic() - started
+                with self.lock:
+                    self.queries["count"] += 1
+                    self.queries["seconds"] += seconds
+                    for name in set(self.active_stages()):
+                        self.stages[name]["queries"] += 1
+                        self.stages[name]["query_seconds"] += seconds
+
+        with connections[using].execute_wrapper(execute):
+            yield
+
+    def count_rows(self, model, **counts):
+        """Add to the write counters of `model`, e.g. ``count_rows(Schedule, inserted=10)``"""
+        with self.lock:
+            self.rows[model._meta.label].update(counts)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def merge(self, report):
+        """Add a `report()` of another process, e.g. an import worker, to this one"""
+        with self.lock:
+            for name, values in report["stages"].items():
+                self.stages[name].update(values)
+            for label, counts in report["rows"].items():
+                self.rows[label].update(counts)
+            self.counters.update(report["counters"])
+            self.queries.update(report["queries"])
+            for host, counts in report.get("hosts", {}).items():
+                self.hosts[host].update(counts)
+
+    def report(self, stats=None, hosts=None):
+        """
+        The collected telemetry as a JSON-serializable dict
+
+        Includes the run's summary `stats` and adds the per-host HTTP counters `hosts`, if given.
+        """
+        with self.lock:
+            all_hosts = defaultdict(Counter, {host: Counter(counts) for host, counts in self.hosts.items()})
+            for host, counts in (hosts or {}).items():
+                all_hosts[host].update(counts)
+            return {
+                "version": REPORT_VERSION,
+                "command": self.command,
+                "started_at": self.started_at.isoformat(timespec='seconds'),
+                "seconds": round(time.monotonic() - self.started, 3),
+                "stages": {
+                    name: {key: round(value, 3) for key, value in sorted(values.items())}
+                    for name, values in sorted(self.stages.items())
+                },
+                "queries": {key: round(value, 3) for key, value in sorted(self.queries.items())},
+                "rows": {label: dict(sorted(counts.items())) for label, counts in sorted(self.rows.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "hosts": {
+                    host: {key: round(value, 3) for key, value in sorted(counts.items())}
+                    for host, counts in sorted(all_hosts.items())
+                },
+                "stats": dict(sorted((stats or {}).items())),
+            }
+
+
+def emit_report(log, report, path=None):
+    """
+    Log the stages and hosts of a `Telemetry.report()` and emit the report as JSON
+
+    The JSON goes to the file `path` (written atomically) if given, otherwise onto a single log line.
+    """
+    for name, values in report["stages"].items():
+        log.info(
+            f"Stage {name}: {values.get('calls', 0)} calls in {values.get('seconds', 0):.1f}s, "
+            f"{values.get('queries', 0)} queries in {values.get('query_seconds', 0):.1f}s"
+        )
+    for host, counts in report["hosts"].items():
+        log.info(
+            f"Host {host}: {counts.get('requests', 0)} requests ({counts.get('cache_hits', 0)} from cache), "
+            f"{counts.get('retries', 0)} retries, {counts.get('errors', 0)} errors, "
+            f"{counts.get('bytes', 0) / 1024 / 1024:.1f} MiB in {counts.get('seconds', 0):.1f}s"
+        )
+
+    if path:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        log.info(f"Wrote telemetry report to {path}")
+    else:
+        log.info(f"Telemetry report: {json.dumps(report, ensure_ascii=False)}")
+
+
+@contextmanager
+def profiling(path, log):
+    """Run the enclosed block under cProfile and dump the statistics to `path`, if set"""
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        log.info(f"Wrote profile to {path}, inspect it with: python -m pstats {path}")
@@ -1,3 +1,881 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import requests
+from django.db import transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from . import archive_utils, cache_utils
+from .archive_utils import ResponseArchive
+from .http_utils import AdaptiveBatchSize, TokenBucket, Transport, request_with_retry
+from .import_utils import Checkpoint, fingerprint
+from .json_utils import iter_json_array
+from .management.commands import fetch_schedule, fetch_timetable, load_snapshot
+from .models import (
+    AdminClass, Building, Campus, Course, DataVersion, Department, ExamMode, Room, Schedule, ScheduleGroup, Section,
+    Semester, Teacher, TeachLanguage
+)
+from .serializers import ScheduleSerializer, SectionSerializer
+from .snapshot_utils import snapshot_outdated, write_snapshot
+from .version_utils import GLOBAL_SCOPE, bump_data_version, bumps_explicitly, data_versions, forget_data_versions
+
+
+class APIQueryBudgetTest(TestCase):
+    """List endpoints must run a fixed number of queries per page, however many rows the page holds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        semester = Semester.objects.create(jw_id=1, code='2025S', name='2025春', start_date=datetime.date(2025, 2, 24))
+        department = Department.objects.create(code='001', name_cn='数学科学学院')
+        campus = Campus.objects.create(jw_id=1, name_cn='东区')
+        exam_mode = ExamMode.objects.create(name_cn='笔试')
+        teach_language = TeachLanguage.objects.create(name_cn='中文')
+        building = Building.objects.create(jw_id=1, name_cn='第一教学楼', code='1', campus=campus)
+        room = Room.objects.create(
+            jw_id=1, code='5104', name_cn='5104', building=building, floor=1, seats_for_section=100, seats=120,
+        )
+
+        for i in range(25):
+            course = Course.objects.create(jw_id=i, code=f'MATH{i:04d}', name_cn=f'课程{i}', name_en=f'Course {i}')
+            section = Section.objects.create(
+                jw_id=i, code=f'MATH{i:04d}.01', course=course, semester=semester, open_department=department,
+                campus=campus, exam_mode=exam_mode, teach_language=teach_language,
+            )
+            teacher = Teacher.objects.create(person_id=i, name_cn=f'教师{i}', department=department)
+            section.teachers.add(teacher)
+            section.admin_classes.add(AdminClass.objects.create(name_cn=f'班级{i}'))
+            group = ScheduleGroup.objects.create(
+                jw_id=i, section=section, no=1, limit_count=100, std_count=80, actual_periods=40,
+            )
+            Schedule.objects.create(
+                section=section, schedule_group=group, room=room, teacher=teacher, periods=2,
+                date=datetime.date(2025, 3, 3), weekday=1, start_time=800, end_time=935, week_index=2,
+                start_unit=1, end_unit=2,
+            )
+            if i == 1:
+                Schedule.objects.create(
+                    section=section, schedule_group=group, periods=2, date=datetime.date(2025, 3, 10), weekday=1,
+                    start_time=800, end_time=935, week_index=3, start_unit=1, end_unit=2, custom_place='线上',
+                )
+
+    def setUp(self):
+        # Read the data versions up front, so that re-reading them doesn't count towards the budgets
+        self.enterContext(mock.patch('ustc.version_utils.DATA_VERSION_TTL', 3600))
+        forget_data_versions()
+        data_versions()
+
+    def assert_page_queries(self, url, num, count, **params):
+        with self.assertNumQueries(num):
+            response = self.client.get(url, {'format': 'json', **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), count)
+        return response.json()['results']
+
+    def test_section_list(self):
+        # Count, page, then one prefetch each for teachers and admin classes
+        results = self.assert_page_queries('/api/v1/ustc/section/', 4, 20)
+        self.assertEqual(results[0]['course']['code'], 'MATH0000')
+        self.assertEqual(len(results[0]['teachers']), 1)
+        self.assert_page_queries('/api/v1/ustc/section/', 4, 5, page=2)
+
+    def test_schedule_list(self):
+        results = self.assert_page_queries('/api/v1/ustc/schedules/', 2, 20)
+        self.assertEqual(results[0]['room']['building']['campus']['name_cn'], '东区')
+        self.assertIsNotNone(results[0]['course'])
+
+    def test_course_list(self):
+        self.assert_page_queries('/api/v1/ustc/course/', 2, 20)
+
+    def test_section_schedules(self):
+        section = Section.objects.get(jw_id=0)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/ustc/section/{section.pk}/schedules/', {'format': 'json'})
+        # Unpaginated, so streamed
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(response.getvalue())), 1)
+        response = self.client.get('/api/v1/ustc/section/0/schedules/', {'format': 'json'})
+        self.assertEqual(response.status_code, 404)
+
+        # The fieldset is the schedules', not the section's
+        response = self.client.get(f'/api/v1/ustc/section/{section.pk}/schedules/', {'format': 'json', 'fields': 'date'})
+        self.assertEqual(list(json.loads(response.getvalue())[0]), ['date'])
+        section.pk, section.jw_id, section.code = None, 100, 'MATH0100.01'
+        section.save()
+        response = self.client.get(f'/api/v1/ustc/section/{section.pk}/schedules/', {'format': 'json'})
+        self.assertEqual(json.loads(response.getvalue()), [])
+
+    def test_section_schedules_not_found(self):
+        for pk in ['abc', Section.objects.order_by('pk').last().pk + 1]:
+            response = self.client.get(f'/api/v1/ustc/section/{pk}/schedules/', {'format': 'json'})
+            self.assertEqual(response.status_code, 404)
+
+    def test_schedule_values_representation(self):
+        # The values() read path renders exactly what the serializer would, relations left empty included
+        section = Section.objects.get(jw_id=1)
+        response = self.client.get(f'/api/v1/ustc/section/{section.pk}/schedules/', {'format': 'json'})
+        schedules = Schedule.objects.filter(section=section)
+        expected = ScheduleSerializer(schedules, many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(len(expected), 2)
+        self.assertEqual(response.getvalue(), JSONRenderer().render(expected))
+
+    def test_section_values_representation(self):
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json'})
+        sections = Section.objects.all()[:20]
+        expected = SectionSerializer(sections, many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+
+        section = sections[0]
+        response = self.client.get(f'/api/v1/ustc/section/{section.pk}/', {'format': 'json'})
+        expected = SectionSerializer(section, context={'request': response.wsgi_request}).data
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(expected)))
+
+    def test_cursor_pagination(self):
+        Section.objects.filter(jw_id__in=[3, 7]).update(semester=None)
+        for ordering, keys in [('id', ['id']), ('jw_id', ['jw_id']), ('semester', ['semester_id', 'code'])]:
+            ids, url = [], f'/api/v1/ustc/section/?format=json&cursor=&ordering={ordering}'
+            while url:
+                # No COUNT(*), just the page and the prefetched teachers and admin classes
+                with self.assertNumQueries(3):
+                    response = self.client.get(url).json()
+                ids += [section['id'] for section in response['results']]
+                url = response['next']
+            expected = Section.objects.order_by(*(F(key).asc(nulls_last=True) for key in keys), 'id')
+            self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json', 'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 404)
+        # Well-formed, but not of the columns' types
+        for ordering, position in [('id', ['abc']), ('semester', ['abc', 'MATH0001.01', 1])]:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get('/api/v1/ustc/section/', {'format': 'json', 'cursor': cursor, 'ordering': ordering})
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json', 'cursor': '', 'ordering': 'name_cn'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        # Without the nested relations, the prefetches and joins are skipped too
+        results = self.assert_page_queries('/api/v1/ustc/section/', 2, 20, fields='id,code,std_count')
+        self.assertEqual(set(results[0]), {'id', 'code', 'std_count'})
+
+        section = Section.objects.get(jw_id=0)
+        results = self.assert_page_queries('/api/v1/ustc/section/', 4, 20, expand='course')
+        self.assertEqual(results[0]['course']['code'], 'MATH0000')
+        self.assertEqual(results[0]['semester'], section.semester_id)
+        self.assertEqual(results[0]['teachers'], [section.teachers.get().pk])
+
+        results = self.assert_page_queries('/api/v1/ustc/schedules/', 2, 20, fields='id,course,group', expand='')
+        self.assertEqual(results[0]['course'], section.course_id)
+
+        # The instance path renders the same
+        response = self.client.get('/api/v1/ustc/campus/', {'format': 'json', 'fields': 'id'})
+        self.assertEqual(response.json()['results'], [{'id': Campus.objects.get().pk}])
+
+        # Lookup tables too
+        response = self.client.get('/api/v1/ustc/exam-mode/', {'format': 'json', 'fields': 'name_cn'})
+        self.assertEqual(response.json()['results'], [{'name_cn': '笔试'}])
+        response = self.client.get('/api/v1/ustc/exam-mode/', {'format': 'json', 'fields': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json', 'fields': 'id,bogus'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json', 'expand': 'code'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        # No validators before the first import
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json'})
+        self.assertNotIn('ETag', response)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version(Semester.objects.get().pk)
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json'})
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # Revalidated without touching the database
+        section = Section.objects.get(jw_id=0)
+        for url in [
+            '/api/v1/ustc/section/?format=json',
+            f'/api/v1/ustc/section/{section.pk}/schedules/?format=json',
+            f'/api/v1/ustc/section/{section.pk}/ical/',
+            f'/ustc/section/{section.pk}/ical/',
+        ]:
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version()
+        response = self.client.get('/api/v1/ustc/section/', {'format': 'json'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_response_cache(self):
+        url = '/api/v1/ustc/section/?format=json'
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version()
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+
+        # Served again once the importers bump the version of the changes
+        Section.objects.filter(jw_id=0).update(std_count=12345)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version(Semester.objects.get().pk)
+        self.assertEqual(self.client.get(url).json()['results'][0]['std_count'], 12345)
+
+    def test_single_flight_timeout(self):
+        # A follower renders the response itself once the leader takes too long
+        started, release = threading.Event(), threading.Event()
+
+        def slow_render():
+            started.set()
+            release.wait(5)
+            return 'leader', 'response'
+
+        leader = threading.Thread(target=cache_utils.single_flight, args=('key', slow_render))
+        leader.start()
+        started.wait(5)
+        try:
+            with mock.patch.object(cache_utils, 'SHARED_FLIGHT_TIMEOUT', 0.01):
+                entry = cache_utils.single_flight('key', lambda: ('follower', 'response'))
+            self.assertEqual(entry, ('follower', 'response'))
+        finally:
+            release.set()
+            leader.join()
+
+    def test_semester_snapshot(self):
+        semester = Semester.objects.get()
+        url = f'/api/v1/ustc/semester/{semester.pk}/snapshot/'
+        self.enterContext(override_settings(SNAPSHOT_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        bump_data_version(semester.pk)
+        self.assertTrue(snapshot_outdated(semester))
+        manifest = write_snapshot(semester)
+        self.assertFalse(snapshot_outdated(semester))
+        self.assertEqual(manifest['data_version'], {'semester': 1, 'global': 1})
+        self.assertEqual(
+            manifest['counts'], {'semester': 1, 'course': 25, 'teacher': 25, 'section': 25, 'schedule': 26},
+        )
+        self.assertEqual(self.client.get(url + 'manifest/').json(), manifest)
+
+        response = self.client.get(url)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(len(content), manifest['size'])
+        self.assertEqual(hashlib.sha256(content).hexdigest(), manifest['sha256'])
+        # Rendered as the list endpoints render them, ordered by type and then id
+        records = [json.loads(line) for line in gzip.decompress(content).splitlines()]
+        self.assertEqual([record['type'] for record in records[:2]], ['semester', 'course'])
+        sections = [record['data'] for record in records if record['type'] == 'section']
+        self.assertEqual([section['jw_id'] for section in sections], list(range(25)))
+        listed = [
+            section for page in (1, 2)
+            for section in self.client.get('/api/v1/ustc/section/', {'format': 'json', 'page': page}).json()['results']
+        ]
+        for section in listed:
+            del section['ical_url']
+        self.assertEqual(sections, sorted(listed, key=lambda section: section['id']))
+        # The same data gives the same file
+        self.assertEqual(write_snapshot(semester)['file'], manifest['file'])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, 416)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{manifest["sha256"]}"')
+        self.assertEqual(response.status_code, 304)
+
+
+class DataVersionSignalTest(TransactionTestCase):
+    """Changes made outside the importers and the API, e.g. in the admin, invalidate cached responses too"""
+
+    def global_version(self):
+        return DataVersion.objects.get(scope=GLOBAL_SCOPE).version
+
+    def test_model_changes_bump_data_version(self):
+        url = '/api/v1/ustc/semester/?format=json'
+        with transaction.atomic():
+            Semester.objects.create(jw_id=1, code='2025S', name='2025春', start_date=datetime.date(2025, 2, 24))
+            semester = Semester.objects.create(jw_id=2, code='2025F', name='2025秋')
+        # Once per transaction
+        self.assertEqual(self.global_version(), 1)
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+
+        semester.name = '2025秋季学期'
+        semester.save()
+        self.assertIn('2025秋季学期', [row['name'] for row in self.client.get(url).json()['results']])
+        semester.delete()
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+
+        section = Section.objects.create(
+            jw_id=1, code='MATH0001.01', semester=Semester.objects.get(),
+            course=Course.objects.create(jw_id=1, code='MATH0001', name_cn='课程', name_en='Course'),
+        )
+        teacher = Teacher.objects.create(person_id=1, name_cn='教师')
+        url = f'/api/v1/ustc/section/{section.pk}/?format=json'
+        self.assertEqual(self.client.get(url).json()['teachers'], [])
+        section.teachers.add(teacher)
+        self.assertEqual(len(self.client.get(url).json()['teachers']), 1)
+
+        # Not on a rolled back transaction
+        version = self.global_version()
+        with transaction.atomic():
+            Teacher.objects.create(person_id=2, name_cn='教师2')
+            transaction.set_rollback(True)
+        self.assertEqual(self.global_version(), version)
+
+        # Nor for the rows the API doesn't serve, or in code bumping the version itself
+        campus = Campus.objects.create(jw_id=1, name_cn='东区')
+        version = self.global_version()
+        Building.objects.create(jw_id=1, name_cn='第一教学楼', code='1', campus=campus)
+        with bumps_explicitly():
+            Teacher.objects.create(person_id=3, name_cn='教师3')
+        self.assertEqual(self.global_version(), version)
+
+
+class ScheduleImportTest(TestCase):
+    """fetch_schedule's batch commit, driven with schedule datum payloads shaped like upstream responses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        semester = Semester.objects.create(jw_id=1, code='2025S', name='2025春', start_date=datetime.date(2025, 2, 24))
+        course = Course.objects.create(jw_id=1, code='MATH0001', name_cn='课程')
+        cls.section = Section.objects.create(jw_id=1, code='MATH0001.01', course=course, semester=semester)
+
+    def datum(self, schedules):
+        """A datum response of one lesson with one schedule group, holding `schedules` (personId, personName)"""
+        return {'result': {
+            'lessonList': [{'id': 1, 'teacherAssignmentList': []}],
+            'scheduleGroupList': [
+                {'id': 1, 'lessonId': 1, 'no': 1, 'limitCount': 100, 'stdCount': 80, 'actualPeriods': 40, 'default': True},
+            ],
+            'scheduleList': [
+                {
+                    'lessonId': 1, 'scheduleGroupId': 1, 'date': f'2025-03-{day:02d}', 'weekday': 1, 'startTime': 800,
+                    'endTime': 935, 'periods': 2, 'weekIndex': 1, 'startUnit': 1, 'endUnit': 2, 'customPlace': '线上',
+                    'personId': person_id, 'personName': person_name, 'teacherId': None,
+                }
+                for day, (person_id, person_name) in enumerate(schedules, 1)
+            ],
+        }}
+
+    def commit(self, data, force=False):
+        command = fetch_schedule.Command(stdout=io.StringIO())
+        command.force = force
+        return command.parse_and_commit(data)
+
+    def test_reimport_keeps_schedules(self):
+        # Teachers sharing a person_id must resolve to the same row on every run, whatever their names
+        first = Teacher.objects.create(name_cn='教师A', person_id=7)
+        Teacher.objects.create(name_cn='教师B', person_id=7)
+        # Renamed, the first one no longer comes first by name
+        data = self.datum([(7, '教师C'), (7, '教师C'), (8, '教师D')])
+
+        self.commit(data)
+        schedules = dict(Schedule.objects.values_list('id', 'teacher_id'))
+        self.assertEqual(len(schedules), 3)
+        stats = self.commit(data, force=True)
+        self.assertEqual(dict(Schedule.objects.values_list('id', 'teacher_id')), schedules)
+        self.assertEqual((stats['schedules_inserted'], stats['schedules_deleted']), (0, 0))
+        self.assertEqual(Schedule.objects.filter(teacher=first).count(), 2)
+
+    def test_teachers_without_person_id(self):
+        # Resolved by name, among the teachers without a person, or created
+        known = Teacher.objects.create(name_cn='教师甲', person_id=5)
+        unknown = Teacher.objects.create(name_cn='教师甲')
+        data = self.datum([(None, '教师甲'), (None, '教师乙'), (None, '教师乙'), (None, None)])
+
+        self.commit(data)
+        teachers = list(Schedule.objects.order_by('date').values_list('teacher_id', flat=True))
+        self.assertEqual(teachers[0], unknown.pk)
+        self.assertNotIn(known.pk, teachers)
+        created = Teacher.objects.get(name_cn='教师乙')
+        self.assertEqual((created.person_id, teachers[1:]), (None, [created.pk, created.pk, None]))
+
+        self.commit(data, force=True)
+        self.assertEqual(list(Schedule.objects.order_by('date').values_list('teacher_id', flat=True)), teachers)
+        self.assertEqual(Teacher.objects.count(), 3)
+
+    def test_unchanged_sections_skipped(self):
+        data = self.datum([(7, '教师甲'), (8, '教师乙')])
+        self.assertEqual(self.commit(data)['created'], 1)
+        schedules = list(Schedule.objects.values_list('id', 'date'))
+        stats = self.commit(data)
+        self.assertEqual((stats['unchanged'], stats['changed'], stats['schedules_inserted']), (1, 0, 0))
+
+        data['result']['scheduleList'][1]['date'] = '2025-03-09'
+        stats = self.commit(data)
+        self.assertEqual((stats['changed'], stats['schedules_inserted'], stats['schedules_deleted']), (1, 1, 1))
+        self.assertEqual(Schedule.objects.filter(id=schedules[0][0]).count(), 1)
+
+    def test_loader_skips_unchanged_groups(self):
+        # load_snapshot only copies the schedule groups of the sections it doesn't skip
+        data = self.datum([(7, '教师甲')])
+        loader = load_snapshot.ScheduleLoader(stdout=io.StringIO())
+        loader.force = False
+        with mock.patch.object(load_snapshot, 'copy_upsert', wraps=load_snapshot.copy_upsert) as copy_upsert:
+            self.assertEqual(loader.parse_and_commit(data)['created'], 1)
+            self.assertEqual(loader.parse_and_commit(data)['unchanged'], 1)
+        self.assertEqual([len(call.args[1]) for call in copy_upsert.call_args_list], [1, 0])
+
+    def test_checkpoint_failed_sections(self):
+        Section.objects.create(jw_id=2, code='MATH0001.02', course=self.section.course, semester=self.section.semester)
+        data = self.datum([(7, '教师甲')])
+        data['result']['lessonList'].append({'id': 2, 'teacherAssignmentList': []})
+        # Section 2 fails on its own: its schedule points to a schedule group that doesn't exist
+        schedules = data['result']['scheduleList']
+        schedules.append({**schedules[0], 'lessonId': 2, 'scheduleGroupId': 9})
+
+        archive_dir = self.enterContext(tempfile.TemporaryDirectory())
+        with ResponseArchive(archive_dir) as archive:
+            archive.record(f'schedule/datum/{fingerprint([1, 2])}', json.dumps(data).encode(), lesson_ids=[1, 2])
+        command = fetch_schedule.Command(stdout=io.StringIO())
+        args = ['--replay', archive_dir, '--state-dir', archive_dir, '--no-http-cache', '--quiet']
+        command.configure(vars(command.create_parser('manage.py', 'fetch_schedule').parse_args(args)))
+        stats = command.import_semester(self.section.semester)
+        self.assertEqual((stats['created'], stats['failed']), (1, 1))
+
+        checkpoint = Checkpoint(Path(archive_dir) / '1.json', resume=True)
+        self.assertEqual(checkpoint.done, {1})
+        self.assertEqual(checkpoint.failed_lesson_ids, {2})
+        self.assertFalse(checkpoint.completed)
+        command.retry_failed = True
+        self.assertEqual(command.pending_section_ids(self.section.semester, checkpoint, [1, 2]), [2])
+
+
+class TimetableImportTest(TestCase):
+    """fetch_timetable's sequential and bulk imports, driven with lesson lists shaped like upstream responses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = Semester.objects.create(
+            jw_id=1, code='2025S', name='2025春', start_date=datetime.date(2025, 2, 24),
+        )
+
+    def lesson(self, jw_id, teachers=('教师甲',), admin_classes=('班级甲',), **fields):
+        def lookup(name):
+            return {'cn': name, 'en': name.upper()}
+
+        return {
+            'id': jw_id, 'code': f'MATH{jw_id:04d}.01', 'credits': 3.0, 'period': 60, 'periodsPerWeek': 4,
+            'stdCount': 80, 'limitCount': 100, 'graduateAndPostgraduate': False, 'dateTimePlaceText': None,
+            'dateTimePlacePersonText': {},
+            'course': {'id': jw_id % 3, 'code': f'MATH{jw_id % 3:04d}', 'cn': f'课程{jw_id % 3}', 'en': ''},
+            'education': lookup('本科'), 'courseGradation': lookup('基础'), 'courseCategory': lookup('通修'),
+            'classType': lookup('理论'), 'courseType': lookup('必修'), 'courseClassify': lookup('计划内'),
+            'openDepartment': {'code': '001', 'cn': '数学科学学院', 'en': 'Mathematics', 'college': True},
+            'campus': lookup('东区'), 'examMode': lookup('笔试'), 'teachLang': lookup('中文'),
+            'teacherAssignmentList': [{'cn': name, 'en': '', 'departmentCode': '001'} for name in teachers],
+            'adminClasses': [{'cn': name, 'en': ''} for name in admin_classes],
+            **fields,
+        }
+
+    def run_import(self, data, bulk=False, force=False):
+        """Import the lesson list `data` into the semester as `fetch_and_process_semester` does"""
+        command = fetch_timetable.Command(stdout=io.StringIO())
+        with mock.patch.object(command, 'fetch_lesson_chunks', lambda semester: iter([data])):
+            return command.fetch_and_process_semester(self.semester, bulk=bulk, force=force)
+
+    def links(self):
+        return {
+            section.jw_id: (
+                sorted(teacher.name_cn for teacher in section.teachers.all()),
+                sorted(admin_class.name_cn for admin_class in section.admin_classes.all()),
+            )
+            for section in Section.objects.prefetch_related('teachers', 'admin_classes')
+        }
+
+    def dump(self):
+        """Every imported row by its natural keys, to compare imports regardless of primary keys"""
+        lookups = ['education_level', 'gradation', 'category', 'class_type', 'type', 'classify']
+        sections = Section.objects.order_by('jw_id').values(
+            'jw_id', 'semester__jw_id', *fetch_timetable.SECTION_FIELDS,
+            'course__jw_id', 'course__code', 'course__name_cn', 'course__name_en',
+            *(f'course__{field}__{name}' for field in lookups for name in ['name_cn', 'name_en']),
+            'open_department__code', 'open_department__name_cn', 'open_department__is_college',
+            *(f'{field}__{name}' for field in ['campus', 'exam_mode', 'teach_language'] for name in ['name_cn', 'name_en']),
+        )
+        teachers = Teacher.objects.order_by('name_cn', 'name_en').values_list('name_cn', 'name_en', 'department__code')
+        return {
+            'sections': list(sections),
+            'links': self.links(),
+            'teachers': list(teachers),
+            'admin_classes': sorted(AdminClass.objects.values_list('name_cn', 'name_en')),
+            'departments': sorted(Department.objects.values_list('code', 'name_cn', 'name_en', 'is_college')),
+        }
+
+    def test_loader_counts_rows(self):
+        # load_snapshot writes through COPY, and counts the rows as the bulk import does
+        data = [self.lesson(0, teachers=['教师甲', '教师乙']), self.lesson(1)]
+        rows = []
+        for command_class in [fetch_timetable.Command, load_snapshot.TimetableLoader]:
+            command = command_class(stdout=io.StringIO())
+            with transaction.atomic(), mock.patch.object(command, 'fetch_lesson_chunks', lambda semester: iter([data])):
+                command.fetch_and_process_semester(self.semester, bulk=True, force=False)
+                transaction.set_rollback(True)
+            rows.append(command.telemetry.report()['rows'])
+        self.assertEqual(rows[1], rows[0])
+        self.assertEqual(rows[0]['ustc.Course']['upserted'], 2)
+
+    def test_bulk_import_matches_sequential(self):
+        imports = [
+            [
+                self.lesson(0, teachers=['教师甲', '教师乙'], admin_classes=['班级甲', '班级乙']),
+                self.lesson(1, teachers=[], admin_classes=[], campus={'cn': '', 'en': ''}),
+                self.lesson(3, teachers=['教师甲'], dateTimePlaceText='1-16周 5104: 1(1,2)'),
+            ],
+            # Changed upstream: links, lookups, columns and a section gone from the list
+            [
+                self.lesson(0, teachers=['教师乙', '教师丙'], admin_classes=['班级乙'], examMode={'cn': '开卷', 'en': ''}),
+                self.lesson(1, teachers=['教师甲'], stdCount=95),
+            ],
+        ]
+        dumps = []
+        for bulk in [False, True]:
+            with transaction.atomic():
+                for data in imports:
+                    self.run_import(data, bulk=bulk)
+                dumps.append(self.dump())
+                transaction.set_rollback(True)
+        self.assertEqual(dumps[1], dumps[0])
+        self.assertEqual(dumps[0]['links'][0], (['教师丙', '教师乙'], ['班级乙']))
+
+    def test_unchanged_lessons_skipped(self):
+        data = [self.lesson(i) for i in range(3)]
+        for bulk in [False, True]:
+            with transaction.atomic():
+                self.assertEqual(self.run_import(data, bulk=bulk)['created'], 3)
+                stats = self.run_import(data, bulk=bulk)
+                self.assertEqual((stats['unchanged'], stats['created'], stats['updated']), (3, 0, 0))
+
+                changed = [*data[:2], self.lesson(2, stdCount=95)]
+                stats = self.run_import(changed, bulk=bulk)
+                self.assertEqual((stats['unchanged'], stats['updated']), (2, 1))
+                self.assertEqual(Section.objects.get(jw_id=2).std_count, 95)
+                stats = self.run_import(changed, bulk=bulk, force=True)
+                self.assertEqual((stats['unchanged'], stats['updated']), (0, 3))
+                transaction.set_rollback(True)
+
+    def test_fingerprint_stored_with_links(self):
+        data = [self.lesson(i) for i in range(3)]
+        with mock.patch.object(fetch_timetable.Command, 'write_links', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                self.run_import(data)
+        # The sections were committed, but without the fingerprints that would skip them
+        self.assertEqual(Section.objects.count(), 3)
+        self.assertFalse(Section.objects.filter(lesson_fingerprint__isnull=False).exists())
+
+        stats = self.run_import(data)
+        self.assertEqual(stats['updated'], 3)
+        self.assertEqual(self.links(), {i: (['教师甲'], ['班级甲']) for i in range(3)})
+        self.assertFalse(Section.objects.filter(lesson_fingerprint__isnull=True).exists())
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Local stub of the upstream server, answering each path with the `(status, body, delay)` responses queued for it
+
+    The last response of a path is repeated once the others were used. Requests are listed in `requests`.
+    """
+    daemon_threads = True
+
+    def __init__(self, responses):
+        self.responses = {path: list(queue) for path, queue in responses.items()}
+        self.requests = []
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), ReplayHandler)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, args=(0.01,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def respond(self, path, body):
+        with self.lock:
+            self.requests.append((path, body))
+            queue = self.responses[path]
+            response = queue.pop(0) if len(queue) > 1 else queue[0]
+        return response(body) if callable(response) else response
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    def handle_one(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status, content, delay = self.server.respond(self.path, body)
+        time.sleep(delay)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = handle_one
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPUtilsTest(SimpleTestCase):
+    """The importers' HTTP client against a local server replaying upstream responses"""
+
+    def transport(self, **kwargs):
+        return Transport('test', cache=False, retries=2, backoff=0, log=mock.Mock(), **kwargs)
+
+    def test_retries(self):
+        with ReplayServer({'/flaky': [(503, b'', 0), (200, b'{}', 0)], '/down': [(502, b'', 0)],
+                           '/missing': [(404, b'', 0)]}) as server:
+            transport = self.transport()
+            retried = []
+            response = transport.get(server.url + '/flaky', on_retry=lambda: retried.append(1))
+            self.assertEqual((response.status_code, len(retried)), (200, 1))
+            # Retried until the last attempt, whose error is raised
+            with self.assertRaises(requests.HTTPError):
+                transport.get(server.url + '/down')
+            # Client errors aren't retried
+            with self.assertRaises(requests.HTTPError):
+                transport.get(server.url + '/missing')
+            self.assertEqual([path for path, _ in server.requests], ['/flaky'] * 2 + ['/down'] * 3 + ['/missing'])
+            host = urlsplit(server.url).netloc
+            self.assertEqual(
+                {key: transport.host_stats()[host][key] for key in ['requests', 'retries', 'errors', 'bytes']},
+                {'requests': 3, 'retries': 3, 'errors': 2, 'bytes': 2},
+            )
+
+    def test_connection_errors(self):
+        with ReplayServer({}) as server:
+            url = server.url
+        retried = []
+        with self.assertRaises(requests.ConnectionError):
+            request_with_retry(
+                requests.Session(), 'GET', url, retries=2, backoff=0, log=mock.Mock(), on_retry=lambda: retried.append(1),
+            )
+        self.assertEqual(len(retried), 2)
+
+    def test_rate_limit(self):
+        with ReplayServer({'/': [(200, b'{}', 0)]}) as server:
+            transport = self.transport(rate_limiter=TokenBucket(50, capacity=1))
+            started = time.monotonic()
+            for _ in range(6):
+                transport.get(server.url + '/')
+            # The first request takes the burst token, the others wait a fiftieth of a second each
+            self.assertGreaterEqual(time.monotonic() - started, 5 / 50)
+
+    def test_response_cache(self):
+        with ReplayServer({'/': [(200, b'{"n": 1}', 0), (200, b'{"n": 2}', 0)]}) as server:
+            cache_dir = self.enterContext(tempfile.TemporaryDirectory())
+            transport = Transport('test', cache_dir=cache_dir, backoff=0)
+            self.assertEqual([transport.get(server.url + '/').json()['n'] for _ in range(2)], [1, 1])
+            self.assertEqual(transport.get(server.url + '/', cache=False).json()['n'], 2)
+            transport.close()
+
+    def test_concurrent_batches_in_order(self):
+        def datum(body):
+            # Earlier batches take longer, so that they finish after later ones
+            lesson_ids = json.loads(body)['lessonIds']
+            content = json.dumps({'result': {'lessonList': [{'id': i} for i in lesson_ids]}}).encode()
+            return 200, content, 0.02 * (max(lesson_ids) % 5)
+
+        with ReplayServer({'/ws/schedule-table/datum': [datum]}) as server:
+            command = fetch_schedule.Command(stdout=io.StringIO())
+            args = ['--base-url', server.url, '--concurrency', '4', '--no-http-cache', '--batch-policy', 'fixed',
+                    '--batch-size', '2', '--min-batch-size', '1', '--quiet']
+            command.configure(vars(command.create_parser('manage.py', 'fetch_schedule').parse_args(args)))
+            command.headers, command.cookies = {}, {}
+            committed = []
+            command.process_section_ids(range(20), handle_batch=lambda batch: committed.append(batch['lesson_ids']))
+        self.assertEqual(committed, [[19 - i, 18 - i] for i in range(0, 20, 2)])
+        self.assertEqual(len(server.requests), 10)
+
+
+class CheckpointTest(SimpleTestCase):
+    def test_batches_appended_to_log(self):
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / '1.json'
+        checkpoint = Checkpoint(path)
+        with mock.patch.object(checkpoint, 'save', wraps=checkpoint.save) as save:
+            checkpoint.mark_failed([1, 2], 'boom')
+            for i in range(3, 50):
+                checkpoint.mark_done([i])
+            checkpoint.mark_done([1, 2])
+            checkpoint.mark_failed([50], 'boom')
+            # Only the state the run started from, the batches go to the log
+            self.assertEqual(save.call_count, 1)
+
+        resumed = Checkpoint(path, resume=True)
+        self.assertEqual((resumed.done, resumed.failed_lesson_ids), (set(range(1, 50)), {50}))
+        # An interrupted write of a batch loses that batch only
+        with open(path.with_suffix('.log'), 'a', encoding='utf-8') as f:
+            f.write('{"done":[5')
+        self.assertEqual(Checkpoint(path, resume=True).done, set(range(1, 50)))
+
+        resumed.mark_done([50])
+        resumed.mark_completed()
+        self.assertFalse(path.with_suffix('.log').exists())
+        state = json.loads(path.read_text())
+        self.assertEqual((state['completed'], state['done'], state['failed']), (True, list(range(1, 51)), {}))
+        # A fresh start forgets it all
+        Checkpoint(path).mark_done([1])
+        self.assertEqual(Checkpoint(path, resume=True).done, {1})
+
+
+class ResponseArchiveTest(SimpleTestCase):
+    def test_manifest_saved_on_close(self):
+        path = self.enterContext(tempfile.TemporaryDirectory())
+        with ResponseArchive(path) as archive:
+            with mock.patch.object(archive, 'save_manifest', wraps=archive.save_manifest) as save_manifest:
+                for i in range(100):
+                    archive.record(f'key/{i}', b'[%d]' % i)
+                self.assertEqual(b''.join(archive.record_chunks('chunks', [b'[1, ', b'2]'])), b'[1, 2]')
+                save_manifest.assert_not_called()
+        self.assertFalse(archive.dirty)
+
+        archive = ResponseArchive(path)
+        self.assertEqual(len(archive.keys('key/')), 100)
+        self.assertEqual(archive.load_json('key/42'), [42])
+        self.assertEqual(b''.join(archive.load_chunks('chunks')), b'[1, 2]')
+
+    def test_loaded_objects_per_archive(self):
+        path = self.enterContext(tempfile.TemporaryDirectory())
+        with ResponseArchive(path) as archive:
+            for i in range(archive_utils.LOADED_OBJECTS + 4):
+                archive.record(f'key/{i}', b'[%d]' % i)
+        archive = ResponseArchive(path)
+        with mock.patch('gzip.open', wraps=gzip.open) as gzip_open:
+            for key in archive.keys():
+                archive.load(key)
+            archive.load('key/0')
+            archive.load(archive.keys()[-1])
+        # Only the least recently used bodies were evicted, and only from this archive
+        self.assertEqual(gzip_open.call_count, archive_utils.LOADED_OBJECTS + 5)
+        self.assertEqual(len(archive.loaded), archive_utils.LOADED_OBJECTS)
+        self.assertEqual(ResponseArchive(path).loaded, {})
+
+
+class JSONArrayTest(SimpleTestCase):
+    """Incremental parsing of lesson lists, whose chunks may split items, strings and characters anywhere"""
+
+    document = json.dumps([
+        {'id': 1, 'cn': '数学分析(B1)', 'text': 'quote " backslash \\ comma , bracket ] brace }', 'emoji': '😀'},
+        {'id': 23456789, 'nested': {'list': [1.5, -2e3, None, True, False], 'empty': {}}, 'escaped': ' \t\n'},
+        [], '', 0,
+    ], ensure_ascii=False, indent=1).encode()
+
+    def parse(self, *chunks):
+        return list(iter_json_array(chunks))
+
+    def test_split_anywhere(self):
+        expected = json.loads(self.document)
+        # Two chunks split at every byte, including inside multi-byte characters and escapes
+        for i in range(len(self.document) + 1):
+            self.assertEqual(self.parse(self.document[:i], self.document[i:]), expected, i)
+        for size in [1, 2, 3, 7]:
+            chunks = [self.document[i:i + size] for i in range(0, len(self.document), size)]
+            self.assertEqual(self.parse(*chunks), expected, size)
+
+    def test_numbers_split_between_chunks(self):
+        self.assertEqual(self.parse(b'[12', b'345, 6', b'.5e', b'1]'), [12345, 65.0])
+        self.assertEqual(self.parse(b' [', b' ]\n'), [])
+
+    def test_reads_to_the_end(self):
+        read = []
+
+        def chunks():
+            for chunk in [b'[1,', b'2]', b' ', b'\n']:
+                read.append(chunk)
+                yield chunk
+
+        self.assertEqual(list(iter_json_array(chunks())), [1, 2])
+        self.assertEqual(len(read), 4)
+
+    def test_invalid(self):
+        for chunks in [[b'{"a": 1}'], [b'[1, 2'], [b'[1', b', {"a": '], [b'[1] 2'], [b'[1 2]'], [b'']]:
+            with self.assertRaises(ValueError, msg=chunks):
+                self.parse(*chunks)
+
+
+class AdaptiveBatchSizeTest(SimpleTestCase):
+    """Sizing of schedule datum batches after each request, and splitting of failed ones"""
+
+    def test_grows_while_fast(self):
+        batch_size = AdaptiveBatchSize(100, minimum=10, maximum=150, target_latency=10, max_bytes=1000)
+        for expected in [110, 121, 133, 146, 150, 150]:
+            batch_size.record_success(batch_size.next(), 1.0, 100)
+            self.assertEqual(batch_size.size, expected)
+        # Requests for fewer items than the size don't tell whether a larger one would do
+        batch_size = AdaptiveBatchSize(100, maximum=150)
+        batch_size.record_success(50, 1.0, 100)
+        self.assertEqual(batch_size.size, 100)
+
+    def test_shrinks(self):
+        batch_size = AdaptiveBatchSize(100, minimum=10, maximum=200, target_latency=10, max_bytes=1000)
+        batch_size.record_success(100, 20.0, 100)
+        self.assertEqual(batch_size.size, 50)  # Towards the target latency
+        batch_size.record_success(50, 1.0, 2500)
+        self.assertEqual(batch_size.size, 20)  # Towards the response size limit
+        batch_size.record_failure(20)
+        self.assertEqual(batch_size.size, 10)
+        batch_size.record_failure(10)
+        self.assertEqual(batch_size.size, 10)  # Never below the minimum
+
+    def test_errors_stop_growth(self):
+        batch_size = AdaptiveBatchSize(100, maximum=200)
+        batch_size.record_retry()
+        batch_size.record_success(100, 1.0, 100)
+        self.assertEqual(batch_size.size, 100)
+
+    def test_fixed(self):
+        batch_size = AdaptiveBatchSize(100, adaptive=False, target_latency=10, max_bytes=1000)
+        batch_size.record_success(100, 1.0, 100)
+        batch_size.record_success(100, 20.0, 5000)
+        batch_size.record_failure(100)
+        self.assertEqual(batch_size.size, 100)
+
+    def test_failed_batches_split(self):
+        command = fetch_schedule.Command(stdout=io.StringIO())
+        args = ['--batch-size', '8', '--min-batch-size', '2', '--no-http-cache', '--quiet']
+        command.configure(vars(command.create_parser('manage.py', 'fetch_schedule').parse_args(args)))
+
+        def fetch_group(url, group):
+            # Upstream times out on more than two sections, and never answers for section 7
+            if 7 in group:
+                raise requests.HTTPError(response=mock.Mock(status_code=404 if len(group) <= 2 else 504))
+            if len(group) > 2:
+                raise requests.Timeout()
+            return json.dumps(group).encode()
+
+        with mock.patch.object(command, 'fetch_group', fetch_group):
+            parts = command.fetch_batch('', list(range(8)))
+        self.assertEqual([(part, error is None) for part, _, error in parts], [
+            ([0, 1], True), ([2, 3], True), ([4, 5], True), ([6, 7], False),
+        ])
+        self.assertEqual(command.batch_size.size, 2)
+
+        # Client errors aren't split, nor are batches at the minimum size
+        client_error = requests.HTTPError(response=mock.Mock(status_code=400))
+        with mock.patch.object(command, 'fetch_group', side_effect=client_error):
+            self.assertEqual(len(command.fetch_batch('', list(range(8)))), 1)
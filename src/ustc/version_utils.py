@@ -0,0 +1,175 @@
+"""
+Data versions: stamps bumped whenever imported data changes, validating conditional GETs of the API
+
+The data only changes when the importers, API writes or saves of single rows (e.g. in the admin) commit,
+so a response is fresh as long as the global data version it was served at is current. Reads are answered
+with 304 from a copy of the versions kept by each process, without any other database work.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import DataVersion
+
+GLOBAL_SCOPE = 'global'
+
+# Seconds a process answers from the versions it read, before reading them again
+DATA_VERSION_TTL = 1.0
+
+_versions = (0.0, {})
+_local = threading.local()
+
+
+def semester_scope(semester_id):
+    return f'semester:{semester_id}'
+
+
+def bump_data_version(*semester_ids):
+    """
+    Bump the global data version and those of the semesters `semester_ids`
+
+    Call it in the transaction writing the changes, so that they are committed together.
+    """
+    scopes = [GLOBAL_SCOPE, *(semester_scope(pk) for pk in sorted(set(semester_ids)) if pk is not None)]
+    now = timezone.now()
+    for scope in scopes:
+        DataVersion.objects.get_or_create(scope=scope, defaults={'modified': now})
+    DataVersion.objects.filter(scope__in=scopes).update(version=F('version') + 1, modified=now)
+    transaction.on_commit(forget_data_versions)
+
+
+@contextmanager
+def bumps_explicitly():
+    """
+    Mute `bump_on_change` in this thread, around writes whose callers call `bump_data_version` themselves
+
+    Used by the importers and the API's writes. Also usable as a decorator.
+    """
+    muted = getattr(_local, 'muted', False)
+    _local.muted = True
+    try:
+        yield
+    finally:
+        _local.muted = muted
+
+
+def connect_bump_on_change(models):
+    """Connect `bump_on_change` to the saves and deletes of `models` and the changes of their many-to-many fields"""
+    for model in models:
+        label = model._meta.label
+        post_save.connect(bump_on_change, sender=model, dispatch_uid=f'bump_on_change.post_save.{label}')
+        post_delete.connect(bump_on_change, sender=model, dispatch_uid=f'bump_on_change.post_delete.{label}')
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            m2m_changed.connect(
+                bump_on_change, sender=through, dispatch_uid=f'bump_on_change.m2m_changed.{through._meta.label}',
+            )
+
+
+def bump_on_change(sender, raw=False, using=None, **kwargs):
+    """
+    Signal receiver bumping the global data version once the transaction saving or deleting a row commits
+
+    Catches the changes of the rows the API serves made outside the importers and the API's writes, which bump
+    the data version themselves, e.g. in the admin or a shell. Bulk writes (`bulk_create()`, `update()`, ...)
+    send no signals, their callers bump the data version themselves too.
+    """
+    if raw or getattr(_local, 'muted', False):
+        return
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    # Once per transaction, however many rows it changes
+    connection = transaction.get_connection(using)
+    if any(callback[1] is bump_changed_data_version for callback in connection.run_on_commit):
+        return
+    transaction.on_commit(bump_changed_data_version, using=using)
+
+
+def bump_changed_data_version():
+    with transaction.atomic():
+        bump_data_version()
+
+
+def forget_data_versions():
+    """Make this process read the data versions again on their next use"""
+    global _versions
+    _versions = (0.0, {})
+
+
+def data_versions():
+    """`{scope: (version, modified)}` of all data versions, read at most every `DATA_VERSION_TTL` seconds"""
+    global _versions
+    expires, versions = _versions
+    if time.monotonic() >= expires:
+        versions = {
+            scope: (version, modified)
+            for scope, version, modified in DataVersion.objects.values_list('scope', 'version', 'modified')
+        }
+        _versions = (time.monotonic() + DATA_VERSION_TTL, versions)
+    return versions
+
+
+def data_version_stamp():
+    """
+    The current global data version as a string that changes with every bump, None before the first import
+
+    Includes the time of the bump, so that it doesn't repeat even if the versions are reset.
+    """
+    if GLOBAL_SCOPE in (versions := data_versions()):
+        version, modified = versions[GLOBAL_SCOPE]
+        return f'{version}-{modified.timestamp():.6f}'
+    return None
+
+
+def data_version_etag(request, *args, **kwargs):
+    """
+    Weak ETag of a read at the current global data version, None before the first import
+
+    Responses nest rows shared between semesters (courses, teachers, rooms, ...) that any import may update,
+    so even those of a single semester are validated against the global version.
+    """
+    if GLOBAL_SCOPE in (versions := data_versions()):
+        return f'W/"{versions[GLOBAL_SCOPE][0]}"'
+    return None
+
+
+def data_version_last_modified(request, *args, **kwargs):
+    if GLOBAL_SCOPE in (versions := data_versions()):
+        return versions[GLOBAL_SCOPE][1]
+    return None
+
+
+# Adds ETag and Last-Modified to responses, and answers matching conditional requests before calling the view
+conditional_on_data_version = condition(etag_func=data_version_etag, last_modified_func=data_version_last_modified)
+
+
+class DataVersionMixin:
+    """
+    Validate the reads of a viewset against the data version, and bump it with every write
+
+    Conditional requests are answered before the view runs, see `conditional_on_data_version`.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        return conditional_on_data_version(super().dispatch)(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        with transaction.atomic(), bumps_explicitly():
+            super().perform_create(serializer)
+            bump_data_version()
+
+    def perform_update(self, serializer):
+        with transaction.atomic(), bumps_explicitly():
+            super().perform_update(serializer)
+            bump_data_version()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), bumps_explicitly():
+            super().perform_destroy(instance)
+            bump_data_version()
@@ -1,16 +1,24 @@
+import itertools
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import *
 from .serializers import *
+from .representation_utils import ValuesRepresentation
+from .snapshot_utils import read_manifest, snapshot_response
+from .cache_utils import CachedResponseMixin, cache_on_data_version
+from .version_utils import DataVersionMixin, conditional_on_data_version
 from .views_extra import *
+from .mixins import EagerLoadingMixin, ValuesReadMixin
 
 
-class BaseViewSet(viewsets.ModelViewSet):
+class BaseViewSet(DataVersionMixin, CachedResponseMixin, ValuesReadMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     """Base ViewSet with common actions for all models"""
 
     @action(detail=False, url_path='jw-id/(?P<jw_id>[^/.]+)')
@@ -26,7 +34,7 @@ class BaseViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=404)
 
 
-class CampusViewSet(viewsets.ModelViewSet):
+class CampusViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Campus.objects.all()
     serializer_class = CampusSerializer
 
@@ -36,7 +44,7 @@ class SemesterViewSet(BaseViewSet):
     serializer_class = SemesterSerializer
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
 
@@ -46,17 +54,17 @@ class CourseViewSet(BaseViewSet):
     serializer_class = CourseSerializer
 
 
-class TeacherViewSet(viewsets.ModelViewSet):
+class TeacherViewSet(DataVersionMixin, CachedResponseMixin, ValuesReadMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Teacher.objects.all()
     serializer_class = TeacherSerializer
 
 
-class AdminClassViewSet(viewsets.ModelViewSet):
+class AdminClassViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = AdminClass.objects.all().order_by('name_cn')
     serializer_class = AdminClassSerializer
 
 
-class ScheduleViewSet(viewsets.ModelViewSet):
+class ScheduleViewSet(DataVersionMixin, CachedResponseMixin, ValuesReadMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Schedule.objects.all()
     serializer_class = ScheduleSerializer
 
@@ -91,15 +99,18 @@ class SectionViewSet(BaseViewSet):
     @action(detail=True, methods=['get'])
     def schedules(self, request, pk=None):
         """Get schedules for a specific section using serializer"""
-        section = self.get_object()
-        schedules = Schedule.objects.filter(section=section).select_related(
-            'room', 'room__building', 'room__building__campus',
-            'teacher', 'teacher__department', 'schedule_group', 'section__course'
-        )
-
-        # Use the serializer to format the data
-        serializer = ScheduleSerializer(schedules, many=True, context={'request': request})
-        return Response(serializer.data)
+        representation = ValuesRepresentation.of(ScheduleSerializer, *self.get_fieldset())
+        try:
+            sections = self.filter_queryset(self.get_queryset()).filter(pk=pk)
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        rows = representation.model_values(Schedule).filter(section__in=sections.values('pk')).iterator()
+        first = next(rows, None)
+        if first is None:
+            # Only a section without schedules needs to be loaded, to tell whether it exists and may be seen
+            self.get_object()
+            return self.array_response(iter([]))
+        return self.array_response(representation.iter_render(itertools.chain([first], rows), {'request': request}))
 
     @action(detail=True, methods=['get'])
     def ical(self, request, pk=None):
@@ -398,6 +409,8 @@ def generate_ical_response(ical_content, filename):
     return response
 
 
+@conditional_on_data_version
+@cache_on_data_version
 def section_ical(request, pk):
     """Export section schedules as iCalendar (web view)"""
     section = get_object_or_404(Section, pk=pk)
@@ -408,8 +421,28 @@ def section_ical(request, pk):
     return generate_ical_response(ical_content, filename)
 
 
+@conditional_on_data_version
+@cache_on_data_version
 def schedule_ical(request, pk):
     """Export a single schedule as iCalendar (web view)"""
     schedule = get_object_or_404(Schedule, pk=pk)
     # Use the helper from ScheduleViewSet for consistent response
     return ScheduleViewSet().get_schedule_ical_response(schedule)
+
+
+@require_safe
+def semester_snapshot(request, pk):
+    """Download the gzipped NDJSON snapshot of a semester, supporting `Range` requests"""
+    response = snapshot_response(request, pk)
+    if response is None:
+        raise Http404("No snapshot of this semester has been written yet")
+    return response
+
+
+@require_safe
+def semester_snapshot_manifest(request, pk):
+    """The manifest of a semester's snapshot: its file, size, checksums, entity counts and data versions"""
+    manifest = read_manifest(pk)
+    if manifest is None:
+        raise Http404("No snapshot of this semester has been written yet")
+    return JsonResponse(manifest, json_dumps_params={'ensure_ascii': False})
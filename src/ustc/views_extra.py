@@ -3,6 +3,9 @@ from django.core.paginator import Paginator
 from rest_framework import viewsets
 from .models_extra import *
 from .serializers import *
+from .cache_utils import CachedResponseMixin
+from .mixins import EagerLoadingMixin
+from .version_utils import DataVersionMixin
 
 def generic_list_view(request, model_class, template_name, context_object_name, paginate_by=50):
     """Generic function for list views"""
@@ -46,42 +49,42 @@ def generic_detail_view(request, model_class, template_name, context_object_name
     context = {context_object_name: obj}
     return render(request, template_name, context)
 
-class CourseTypeViewSet(viewsets.ModelViewSet):
+class CourseTypeViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = CourseType.objects.all()
     serializer_class = CourseTypeSerializer
 
 
-class CourseGradationViewSet(viewsets.ModelViewSet):
+class CourseGradationViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = CourseGradation.objects.all()
     serializer_class = CourseGradationSerializer
 
 
-class CourseCategoryViewSet(viewsets.ModelViewSet):
+class CourseCategoryViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = CourseCategory.objects.all()
     serializer_class = CourseCategorySerializer
 
 
-class CourseClassifyViewSet(viewsets.ModelViewSet):
+class CourseClassifyViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = CourseClassify.objects.all()
     serializer_class = CourseClassifySerializer
 
 
-class ExamModeViewSet(viewsets.ModelViewSet):
+class ExamModeViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = ExamMode.objects.all()
     serializer_class = ExamModeSerializer
 
 
-class TeachLanguageViewSet(viewsets.ModelViewSet):
+class TeachLanguageViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = TeachLanguage.objects.all()
     serializer_class = TeachLanguageSerializer
 
 
-class EducationLevelViewSet(viewsets.ModelViewSet):
+class EducationLevelViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = EducationLevel.objects.all()
     serializer_class = EducationLevelSerializer
 
 
-class ClassTypeViewSet(viewsets.ModelViewSet):
+class ClassTypeViewSet(DataVersionMixin, CachedResponseMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = ClassType.objects.all()
     serializer_class = ClassTypeSerializer
 